@@ -0,0 +1,233 @@
+"""
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+import pandas as pd
+
+import constants
+import run
+from log import log
+
+
+PAGE_SIZES = [10000, 50000]
+HISTORY_SIZES = [10 ** 4, 10 ** 5, 10 ** 6]
+CHURN_RATES = [0.01, 0.1, 0.5]
+QUICK_PAGE_SIZES = [1000]
+QUICK_HISTORY_SIZES = [10 ** 3]
+QUICK_CHURN_RATES = [0.1]
+DOMAINS = 20
+# relative slowdown (or memory growth) over the baseline that counts as a regression
+DEFAULT_TOLERANCE = 0.25
+
+
+def generate_page(anchors: int, with_nav: bool = False, seed: int = 0) -> str:
+    """
+    A synthetic page with the given number of anchors, a fifth of them under <nav> when ``with_nav``.
+    """
+    rng = random.Random(seed)
+    nav_anchors = anchors // 5 if with_nav else 0
+    parts = ['<html><head><title>benchmark</title></head><body>']
+    if nav_anchors:
+        parts.append('<nav><ul>')
+        parts.extend(f'<li><a href="/section/{i}">Section {i}</a></li>' for i in range(nav_anchors))
+        parts.append('</ul></nav>')
+    for i in range(anchors - nav_anchors):
+        href = rng.choice([f'/article/{i}', f'https://other.com/{i}', f'#anchor-{i}', f'?page={i % 50}'])
+        parts.append(f'<div class="card"><a href="{href}" class="story">\n\t Story  {i % 500}\n</a></div>')
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+
+def generate_links(count: int, seed: int = 0, start: int = 0) -> pd.DataFrame:
+    """
+    Synthetic links in the ALL_LINKS_FILE_HEADER layout, spread over a handful of domains.
+    """
+    rng = random.Random(seed)
+    rows = list()
+    for i in range(start, start + count):
+        domain = f'www.site{i % DOMAINS}.com'
+        path = f'/path/{rng.randrange(count // 2 + 1)}'
+        rows.append({
+            'url': f'https://{domain}',
+            'label': f'site{i % DOMAINS}',
+            'domain': domain,
+            'link': path,
+            'full_link': f'https://{domain}{path}',
+            'link_text': f'text {i}',
+            'link_class_name': '',
+        })
+    return pd.DataFrame(rows, columns=constants.ALL_LINKS_FILE_HEADER)
+
+
+def generate_history(count: int, churn: float, seed: int = 0) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    A (current links, previous links) pair in which ``churn`` of the links changed: half of them
+    changed text, a quarter were removed and a quarter are new.
+    """
+    rng = random.Random(seed)
+    all_links = generate_links(count, seed=seed)
+    cur_links = all_links.copy()
+    changed = int(count * churn)
+    positions = rng.sample(range(count), changed)
+    text_changes = positions[:changed // 2]
+    removed = positions[changed // 2:changed // 2 + changed // 4]
+    cur_links.loc[text_changes, 'link_text'] = cur_links.loc[text_changes, 'link_text'] + ' changed'
+    cur_links = cur_links.drop(index=removed)
+    new_links = generate_links(changed // 4, seed=seed + 1, start=count)
+    cur_links = pd.concat([cur_links, new_links], ignore_index=True)
+    return cur_links, all_links
+
+
+def measure(setup: Callable[[], tuple], fn: Callable, repeat: int = 3) -> Dict[str, float]:
+    """
+    Best wall time over ``repeat`` runs, and peak traced memory of a separate run.
+    """
+    times = list()
+    for _ in range(repeat):
+        args = setup()
+        gc.collect()
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+
+    # memory tracing slows things down, so it gets its own run
+    args = setup()
+    gc.collect()
+    tracemalloc.start()
+    fn(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'seconds': min(times), 'peak_mb': peak / 2 ** 20}
+
+
+def page_row(with_nav: bool) -> pd.Series:
+    return pd.Series({
+        'url': 'https://www.website.com',
+        'label': 'label',
+        'domain': 'www.website.com',
+        'include_nav_links': with_nav,
+    })
+
+
+def run_benchmarks(quick: bool = False, repeat: int = 3) -> Dict[str, Dict[str, float]]:
+    page_sizes = QUICK_PAGE_SIZES if quick else PAGE_SIZES
+    history_sizes = QUICK_HISTORY_SIZES if quick else HISTORY_SIZES
+    churn_rates = QUICK_CHURN_RATES if quick else CHURN_RATES
+    results = dict()
+
+    for anchors in page_sizes:
+        for with_nav in (False, True):
+            page = generate_page(anchors, with_nav=with_nav)
+            row = page_row(with_nav)
+            name = f'process_page[anchors={anchors},nav={with_nav}]'
+            results[name] = measure(lambda: (row, page), run.process_page, repeat)
+            report(name, results[name])
+
+    for count in history_sizes:
+        links = generate_links(count)
+        name = f'make_element_ids[links={count}]'
+        results[name] = measure(lambda: (links.copy(),), run.make_element_ids, repeat)
+        report(name, results[name])
+
+    for count in history_sizes:
+        for churn in churn_rates:
+            cur_links, all_links = generate_history(count, churn)
+            name = f'find_new_links[links={count},churn={churn}]'
+            results[name] = measure(lambda: (cur_links.copy(), all_links.copy()), run.find_new_links, repeat)
+            report(name, results[name])
+
+    return results
+
+
+def report(name: str, result: Dict[str, float]):
+    print(f'{name:<50} {result["seconds"]:>10.4f}s {result["peak_mb"]:>10.1f}MB', flush=True)
+
+
+def find_regressions(
+        results: Dict[str, Dict[str, float]],
+        baseline: Dict[str, Dict[str, float]],
+        tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    regressions = list()
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric in ('seconds', 'peak_mb'):
+            before, after = baseline[name][metric], result[metric]
+            if before > 0 and after > before * (1 + tolerance):
+                regressions.append(f'{name} {metric}: {before:.4f} -> {after:.4f} (+{after / before - 1:.0%})')
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the parse and diff hot paths')
+    parser.add_argument(
+        '--quick',
+        dest='quick',
+        action='store_true',
+        default=False,
+        required=False,
+        help='Use small inputs, for a fast smoke run'
+    )
+    parser.add_argument(
+        '--repeat',
+        dest='repeat',
+        type=int,
+        default=3,
+        required=False
+    )
+    parser.add_argument(
+        '--save',
+        dest='save_file',
+        type=str,
+        default=None,
+        required=False,
+        help='Save the results as a baseline JSON file'
+    )
+    parser.add_argument(
+        '--compare',
+        dest='compare_file',
+        type=str,
+        default=None,
+        required=False,
+        help='Baseline JSON file to compare against; exits non-zero on regressions'
+    )
+    parser.add_argument(
+        '--tolerance',
+        dest='tolerance',
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        required=False,
+        help='Allowed relative slowdown or memory growth before reporting a regression'
+    )
+    return parser.parse_args()
+
+
+def cli() -> int:
+    args = parse_args()
+    # per-link change logging would dominate the diff timings
+    log.setLevel(logging.WARNING)
+    results = run_benchmarks(quick=args.quick, repeat=args.repeat)
+    if args.save_file:
+        with open(args.save_file, 'w') as fp:
+            json.dump(results, fp, indent=4)
+    if args.compare_file:
+        with open(args.compare_file, 'r') as fp:
+            baseline = json.load(fp)
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    os.sys.exit(cli())
@@ -0,0 +1,205 @@
+"""
+"""
+from __future__ import annotations
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from selenium.common.exceptions import InvalidSessionIdException, NoSuchWindowException
+
+from log import log
+from scheduler import bounded_map
+
+if TYPE_CHECKING:
+    from selenium.webdriver.chrome.webdriver import WebDriver
+
+
+DEFAULT_MAX_PAGES = 200
+DEFAULT_MAX_RSS_MB = 2048
+
+
+class BrowserPool:
+    """
+    Runs work items against a fixed number of browsers, one per worker thread.
+
+    Between items, a worker checks that its browser still responds, and recycles it after
+    ``max_pages`` items or once its processes use more than ``max_rss_mb`` of memory.
+
+    A worker whose browser crashes restarts it and retries the item once. Any other error, or a
+    second crash, is isolated: the item is reported through ``on_error``, the browser is discarded,
+    and the worker starts a fresh one for its next item.
+    """
+
+    def __init__(
+            self,
+            factory: Callable[[], WebDriver],
+            workers: int = 1,
+            max_pages: Optional[int] = DEFAULT_MAX_PAGES,
+            max_rss_mb: Optional[float] = DEFAULT_MAX_RSS_MB):
+        if workers < 1:
+            raise RuntimeError(f'Expected at least 1 worker, got {workers}')
+        self.factory = factory
+        self.workers = workers
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.recycled = 0
+        self.restarted = 0
+        self.retried = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._browsers: List[WebDriver] = list()
+
+    def _get_browser(self) -> WebDriver:
+        browser = getattr(self._local, 'browser', None)
+        if browser is not None:
+            reason = self._recycle_reason(browser)
+            if reason is not None:
+                log.info(f'Recycling browser of worker {threading.current_thread().name}: {reason}.')
+                self._discard_browser()
+                browser = None
+        if browser is None:
+            browser = self.factory()
+            with self._lock:
+                self._browsers.append(browser)
+            self._local.browser = browser
+            self._local.pages = 0
+        return browser
+
+    def _recycle_reason(self, browser: WebDriver) -> Optional[str]:
+        if not is_alive(browser):
+            with self._lock:
+                self.restarted += 1
+            return 'it stopped responding'
+        reason = None
+        if self.max_pages and self._local.pages >= self.max_pages:
+            reason = f'it loaded {self._local.pages} pages'
+        elif self.max_rss_mb:
+            rss = browser_rss(browser)
+            if rss is not None and rss > self.max_rss_mb * 2 ** 20:
+                reason = f'it uses {rss / 2 ** 20:.0f}MB'
+        if reason is not None:
+            with self._lock:
+                self.recycled += 1
+        return reason
+
+    def _discard_browser(self):
+        browser = getattr(self._local, 'browser', None)
+        self._local.browser = None
+        if browser is None:
+            return
+        with self._lock:
+            if browser in self._browsers:
+                self._browsers.remove(browser)
+        quit_browser(browser)
+
+    def _run(self, fn: Callable[[Any, WebDriver], Any], on_error: Callable[[Any, Exception], Any], item: Any) -> Any:
+        name = threading.current_thread().name
+        for attempt in range(2):
+            try:
+                result = fn(item, self._get_browser())
+                self._local.pages += 1
+                return result
+            except browser_crash_errors() as e:
+                self._discard_browser()
+                with self._lock:
+                    self.restarted += 1
+                if attempt > 0:
+                    log.warning(f'Browser of worker {name} crashed again, giving up on the item.', exc_info=True)
+                    return on_error(item, e)
+                log.warning(f'Browser of worker {name} crashed, restarting it and retrying the item.', exc_info=True)
+                with self._lock:
+                    self.retried += 1
+            except Exception as e:
+                log.warning(f'Browser worker {name} failed, restarting it.', exc_info=True)
+                self._discard_browser()
+                return on_error(item, e)
+
+    def map(
+            self,
+            fn: Callable[[Any, WebDriver], Any],
+            items: Iterable[Any],
+            on_error: Callable[[Any, Exception], Any]) -> Iterator[Any]:
+        """
+        Apply ``fn(item, browser)`` to every item, yielding results in input order.
+
+        Items are submitted a window at a time, so finished results held up behind a slow item stay bounded.
+        """
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='browser') as executor:
+            yield from bounded_map(executor, partial(self._run, fn, on_error), items, 2 * self.workers)
+
+    def close(self):
+        with self._lock:
+            browsers, self._browsers = self._browsers, list()
+        for browser in browsers:
+            quit_browser(browser)
+
+    def summary(self) -> str:
+        return f'{self.recycled} recycled, {self.restarted} restarted, {self.retried} items retried'
+
+
+def browser_crash_errors() -> Tuple[type, ...]:
+    """
+    Errors that mean the browser (or its driver process) is gone, rather than the page being bad.
+    """
+    # only looked up once an error is raised, by when the browser's driver has loaded urllib3
+    import urllib3
+    return InvalidSessionIdException, NoSuchWindowException, urllib3.exceptions.HTTPError, ConnectionError
+
+
+def quit_browser(browser: WebDriver):
+    try:
+        browser.quit()
+    except Exception:
+        log.warning('Error shutting down browser.', exc_info=True)
+
+
+def is_alive(browser: WebDriver) -> bool:
+    # a cheap round trip to the driver, which fails once the browser or its session is gone
+    try:
+        browser.current_url
+        return True
+    except Exception:
+        return False
+
+
+def browser_rss(browser: WebDriver) -> Optional[int]:
+    """
+    Resident memory in bytes of the browser's driver and every process under it, or None where unknown.
+    """
+    pid = getattr(getattr(getattr(browser, 'service', None), 'process', None), 'pid', None)
+    if pid is None:
+        return None
+    return process_tree_rss(pid)
+
+
+def process_tree_rss(pid: int) -> Optional[int]:
+    # read from /proc, so only known on Linux
+    if not os.path.isdir('/proc'):
+        return None
+    children: Dict[int, List[int]] = dict()
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as fp:
+                # the parent pid follows the parenthesized command name, which may contain spaces
+                parent = int(fp.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, list()).append(int(entry))
+
+    page_size = os.sysconf('SC_PAGE_SIZE')
+    rss = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f'/proc/{current}/statm', 'r') as fp:
+                rss += int(fp.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+        pids.extend(children.get(current, list()))
+    return rss
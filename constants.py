@@ -26,3 +26,68 @@ ALL_LINKS_FILE_HEADER = [
     "link_text",
     "link_class_name",
 ]
+
+
+class RenderModes:
+    # render the page in the browser before parsing it
+    BROWSER = "browser"
+    # parse the server HTML straight from the HTTP response
+    STATIC = "static"
+    # parse the server HTML, falling back to the browser when it has no links
+    AUTO = "auto"
+
+
+class WaitStrategies:
+    # fixed sleep after navigation
+    SLEEP = "sleep"
+    # wait for document.readyState to be complete
+    READY = "ready"
+    # wait for the document to be ready, then for DOM mutations to stop
+    MUTATIONS = "mutations"
+    # wait for the document to be ready, then for the number of anchors to stop changing
+    ANCHORS = "anchors"
+
+
+class StatusChecks:
+    # GET the url before navigating the browser to it
+    GET = "get"
+    # HEAD the url before navigating the browser to it
+    HEAD = "head"
+    # read the status of the browser's own navigation
+    BROWSER = "browser"
+
+
+class ResourcePolicies:
+    # load everything
+    NONE = "none"
+    # block third-party trackers and ads
+    TRACKERS = "trackers"
+    # also block images, audio, video and fonts
+    MEDIA = "media"
+    # also block stylesheets
+    STRICT = "strict"
+
+
+class OutputFormats:
+    CSV = "csv"
+    PARQUET = "parquet"
+
+
+INPUT_URLS_REQUIRED_FIELDS = [
+    "url",
+    "label",
+    "include_nav_links",
+]
+
+# optional input fields, and the value used when a field is absent or empty
+INPUT_URLS_OPTIONAL_FIELDS = {
+    "render_mode": RenderModes.BROWSER,
+    "wait_strategy": WaitStrategies.ANCHORS,
+    "resource_policy": ResourcePolicies.MEDIA,
+    # XPath or CSS selector of the elements to keep links from, e.g. main; empty for the whole page
+    "include_selector": "",
+    # XPath or CSS selector of the elements to drop links from, e.g. footer
+    "exclude_selector": "",
+    # how often watch.py re-scrapes the url, in seconds or e.g. 15m, 6h, 1d; ignored by run.py
+    "schedule": "1d",
+}
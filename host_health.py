@@ -0,0 +1,118 @@
+"""
+"""
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Set
+
+from log import log
+
+
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_TTL = 24 * 60 * 60
+MAX_TTL = 7 * DEFAULT_TTL
+# failure reasons of rows that were skipped rather than fetched
+NEGATIVE_CACHE_REASON = 'Host known failing'
+CIRCUIT_OPEN_REASON = 'Host circuit open'
+
+
+class HostHealth:
+    """
+    Tracks failing hosts within a run and, through an optional negative cache file, across runs.
+
+    Once a host fails ``failure_threshold`` times in a row, its circuit opens and its remaining rows
+    are skipped for the rest of the run. A host that failed every time it was tried in a run is
+    skipped by later runs for ``ttl`` seconds, doubling with each run that still finds it failing.
+    """
+
+    def __init__(
+            self,
+            filename: Optional[str] = None,
+            ttl: float = DEFAULT_TTL,
+            failure_threshold: int = DEFAULT_FAILURE_THRESHOLD):
+        if failure_threshold < 1:
+            raise RuntimeError(f'Expected a failure threshold of at least 1, got {failure_threshold}')
+        self.filename = filename
+        self.ttl = ttl
+        self.failure_threshold = failure_threshold
+        self.entries: Dict[str, dict] = dict()
+        self.skipped = 0
+        self._consecutive_failures: Dict[str, int] = dict()
+        self._failed: Set[str] = set()
+        self._succeeded: Set[str] = set()
+        self._open: Set[str] = set()
+        self._lock = threading.Lock()
+        if filename and os.path.isfile(filename):
+            with open(filename, 'r') as fp:
+                self.entries = json.load(fp)
+            log.info(f'Loaded {len(self.entries)} failing hosts from {filename}.')
+
+    def skip_reason(self, host: str) -> Optional[str]:
+        """
+        The failure reason to skip a row of the host with, or None if it should be fetched.
+        """
+        with self._lock:
+            if host in self._open:
+                reason = CIRCUIT_OPEN_REASON
+            elif host in self.entries and self.entries[host]['until'] > time.time():
+                reason = NEGATIVE_CACHE_REASON
+            else:
+                return None
+            self.skipped += 1
+        return reason
+
+    def record(self, host: str, failed: bool):
+        with self._lock:
+            if not failed:
+                self._succeeded.add(host)
+                self._consecutive_failures[host] = 0
+                return
+            self._failed.add(host)
+            self._consecutive_failures[host] = self._consecutive_failures.get(host, 0) + 1
+            if self._consecutive_failures[host] >= self.failure_threshold and host not in self._open:
+                self._open.add(host)
+                log.warning(f'{host} failed {self.failure_threshold} times in a row, skipping its other urls.')
+
+    def close_circuits(self):
+        """
+        Give every host whose circuit opened another try, e.g. on the next pass of a long-running watch.
+        """
+        with self._lock:
+            self._open = set()
+            self._consecutive_failures = dict()
+
+    def update(self):
+        """
+        Fold this run's outcomes into the negative cache.
+        """
+        now = time.time()
+        with self._lock:
+            for host in self._succeeded:
+                self.entries.pop(host, None)
+            for host in self._failed - self._succeeded:
+                strikes = self.entries.get(host, dict()).get('strikes', 0) + 1
+                self.entries[host] = {'until': now + min(self.ttl * 2 ** (strikes - 1), MAX_TTL), 'strikes': strikes}
+            # expired entries are kept for their strikes only while they might still fail again
+            self.entries = {
+                host: entry for host, entry in self.entries.items() if entry['until'] + MAX_TTL > now
+            }
+            self._failed, self._succeeded = set(), set()
+
+    def save(self):
+        self.update()
+        if not self.filename:
+            return
+        with self._lock:
+            entries = dict(self.entries)
+        # write to a temporary file first, so a crash never leaves a truncated cache behind
+        tmp_filename = f'{self.filename}.tmp'
+        with open(tmp_filename, 'w') as fp:
+            json.dump(entries, fp, indent=4)
+        os.replace(tmp_filename, self.filename)
+
+    def summary(self) -> str:
+        return (
+            f'{self.skipped} urls skipped, {len(self._open)} circuits opened, '
+            f'{len(self.entries)} hosts in the negative cache'
+        )
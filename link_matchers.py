@@ -0,0 +1,90 @@
+"""
+"""
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional
+
+import lxml.etree
+import lxml.html
+
+import constants
+
+
+# selectors starting with these are XPath, anything else is CSS
+XPATH_PREFIXES = ('/', '(', './')
+# distinct selectors kept compiled; input urls rarely use more than a handful
+MAX_COMPILED = 1024
+
+LINKS_XPATH = lxml.etree.XPath(constants.XPathMatchers.LINKS)
+LINKS_NOT_UNDER_NAV_XPATH = lxml.etree.XPath(constants.XPathMatchers.LINKS_NOT_UNDER_NAV)
+
+
+@lru_cache(maxsize=MAX_COMPILED)
+def compile_selector(selector: str) -> lxml.etree.XPath:
+    """
+    Compile an XPath or CSS selector, once per distinct expression.
+
+    CSS is translated to XPath with cssselect, which is only needed when a CSS selector is used.
+    """
+    if selector.startswith(XPATH_PREFIXES):
+        expression = selector
+    else:
+        try:
+            from cssselect import HTMLTranslator, SelectorError
+        except ImportError:
+            raise RuntimeError(f'CSS selector {selector!r} needs the cssselect package; install it, or use XPath')
+        try:
+            expression = HTMLTranslator().css_to_xpath(selector)
+        except SelectorError as e:
+            raise RuntimeError(f'Invalid CSS selector {selector!r}: {e}')
+    try:
+        return lxml.etree.XPath(expression)
+    except lxml.etree.XPathSyntaxError as e:
+        raise RuntimeError(f'Invalid XPath selector {selector!r}: {e}')
+
+
+def anchors_within(elements: Iterable) -> Iterator[lxml.html.HtmlElement]:
+    # a selector may match the anchors themselves, or the containers they are in
+    for element in elements:
+        if isinstance(element, lxml.etree._Element):
+            yield from element.iter('a')
+
+
+class LinkMatcher:
+    """
+    Finds the links of a page: its anchors with an href, leaving out those under <nav> unless
+    ``include_nav_links``.
+
+    With an ``include`` selector, only anchors it matches, or that are inside an element it matches,
+    are kept; with an ``exclude`` selector, those are dropped. Selectors are XPath or CSS, e.g.
+    ``main`` keeps only links in the main content, and ``footer, aside`` drops those in footers
+    and sidebars.
+    """
+
+    def __init__(self, include_nav_links: bool = False, include: str = '', exclude: str = ''):
+        self.links = LINKS_XPATH if include_nav_links else LINKS_NOT_UNDER_NAV_XPATH
+        self.include = compile_selector(include) if include else None
+        self.exclude = compile_selector(exclude) if exclude else None
+
+    def __call__(self, xml_tree: lxml.html.HtmlElement) -> List[lxml.html.HtmlElement]:
+        links = self.links(xml_tree)
+        # lxml hands back the same element objects while they are referenced, so they can be looked up in sets
+        if self.include is not None:
+            included = set(anchors_within(self.include(xml_tree)))
+            links = [link for link in links if link in included]
+        if self.exclude is not None:
+            excluded = set(anchors_within(self.exclude(xml_tree)))
+            links = [link for link in links if link not in excluded]
+        return links
+
+
+@lru_cache(maxsize=MAX_COMPILED)
+def get_matcher(include_nav_links: bool = False, include: str = '', exclude: str = '') -> LinkMatcher:
+    """
+    The matcher for a combination of options, built on first use and shared by every page after.
+    """
+    return LinkMatcher(include_nav_links, include, exclude)
+
+
+def clean_selector(value: Optional[str]) -> str:
+    # empty or missing selectors match everything
+    return value.strip() if isinstance(value, str) else ''
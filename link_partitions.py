@@ -0,0 +1,96 @@
+"""
+"""
+from __future__ import annotations
+
+import os
+import pickle
+import shutil
+import zlib
+from typing import TYPE_CHECKING, Iterator, List, Optional
+
+from log import log
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+DEFAULT_PARTITIONS = 256
+# peak memory of diffing links, relative to the memory of the links themselves
+DIFF_MEMORY_OVERHEAD = 3
+
+
+class LinkPartitions:
+    """
+    On-disk copy of a links file, split into partitions by a hash of the domain.
+
+    Rows are appended a chunk at a time, and the memory each partition takes once loaded is
+    recorded as it is written, so that partitions can be read back in batches that fit a memory
+    budget. Every link of a domain is in the same partition.
+    """
+
+    def __init__(self, directory: str, partitions: int = DEFAULT_PARTITIONS):
+        self.directory = directory
+        self.partitions = partitions
+        self.sizes = [0] * partitions
+        self.rows = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _filename(self, partition: int) -> str:
+        return os.path.join(self.directory, f'{partition}.pickle')
+
+    def partition_of(self, domain: str) -> int:
+        # not shard_of's hash, so that the domains of a shard still spread over every partition
+        return zlib.crc32(str(domain).encode()) % self.partitions
+
+    def append(self, links: pd.DataFrame):
+        domains = links['domain'].fillna('').astype(str)
+        partitions = domains.map({domain: self.partition_of(domain) for domain in domains.unique()})
+        for partition, rows in partitions.groupby(partitions, sort=False).indices.items():
+            chunk = links.iloc[rows]
+            # chunks are pickled one after another, keeping the dtypes they were read with
+            with open(self._filename(partition), 'ab') as fp:
+                pickle.dump(chunk, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            self.sizes[partition] += int(chunk.memory_usage(index=False, deep=True).sum())
+        self.rows += len(links)
+
+    def load(self, partitions: List[int]) -> Optional[pd.DataFrame]:
+        """
+        Load the links of the given partitions, or None if they have none.
+        """
+        import pandas as pd
+        chunks = list()
+        for partition in partitions:
+            if not os.path.isfile(self._filename(partition)):
+                continue
+            with open(self._filename(partition), 'rb') as fp:
+                while True:
+                    try:
+                        chunks.append(pickle.load(fp))
+                    except EOFError:
+                        break
+        if len(chunks) == 0:
+            return None
+        return pd.concat(chunks, ignore_index=True)
+
+    def remove(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def partition_batches(sizes: List[int], budget: float) -> Iterator[List[int]]:
+    """
+    Group consecutive partitions into batches whose links, with the diff's overhead, fit the budget.
+
+    A partition that doesn't fit on its own is a batch by itself, since a domain can't be split.
+    """
+    batch, batch_size = list(), 0
+    for partition, size in enumerate(sizes):
+        size *= DIFF_MEMORY_OVERHEAD
+        if batch and batch_size + size > budget:
+            yield batch
+            batch, batch_size = list(), 0
+        if size > budget:
+            log.warning(f'Partition {partition} needs about {size / 2 ** 20:.0f}MB, over the memory budget.')
+        batch.append(partition)
+        batch_size += size
+    if batch:
+        yield batch
@@ -0,0 +1,136 @@
+"""
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from log import log
+from page_links import PageLinks
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+JOURNAL_FILENAME = 'journal.jsonl'
+
+
+class LinkSpool:
+    """
+    On-disk spool of the links scraped in a run, with one JSON-lines file per domain.
+
+    Each page is appended as soon as it is scraped, so only one page's links are held in memory,
+    and a domain's links can be read back on their own for diffing.
+
+    Every finished page, failed or not, is also recorded in a journal. Opening the spool of an
+    interrupted run picks up where it left off, with ``completed`` holding the finished pages.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.urls: Dict[str, List[str]] = dict()
+        self.link_count = 0
+        self.completed: Dict[int, dict] = dict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_journal()
+
+    def _filename(self, domain: str) -> str:
+        # domains are hashed, so any domain (including a malformed one) maps to a safe file name
+        return os.path.join(self.directory, hashlib.md5(domain.encode()).hexdigest() + '.jsonl')
+
+    def _load_journal(self):
+        filename = os.path.join(self.directory, JOURNAL_FILENAME)
+        if not os.path.isfile(filename):
+            return
+        with open(filename, 'r') as fp:
+            for line in fp:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # the last line of a run that was killed mid-write
+                    log.warning(f'Skipping a partial journal entry in {filename}.')
+                    continue
+                self._complete(entry)
+        log.info(f'Loaded {len(self.completed)} finished pages from {filename}.')
+
+    def _complete(self, entry: dict):
+        self.completed[entry['position']] = entry
+        if not entry['failed']:
+            self.urls.setdefault(entry['domain'], list()).append(entry['url'])
+            self.link_count += entry['links']
+
+    def _journal(self, entry: dict):
+        # written last, so a page is only complete once its links are on disk
+        with open(os.path.join(self.directory, JOURNAL_FILENAME), 'a') as fp:
+            fp.write(json.dumps(entry) + '\n')
+        self._complete(entry)
+
+    def append(self, domain: str, position: int, url: str, links: PageLinks):
+        """
+        Append a scraped page. ``position`` orders pages of the same domain when they are read back.
+        """
+        line = json.dumps({'position': position, 'links': links.to_columns()}) + '\n'
+        with self._lock:
+            with open(self._filename(domain), 'a') as fp:
+                fp.write(line)
+            self._journal({
+                'position': position,
+                'url': url,
+                'domain': domain,
+                'failed': False,
+                'failure_reason': '',
+                'links': len(links),
+            })
+
+    def append_failure(self, domain: str, position: int, url: str, failure_reason: str):
+        with self._lock:
+            self._journal({
+                'position': position,
+                'url': url,
+                'domain': domain,
+                'failed': True,
+                'failure_reason': failure_reason,
+                'links': 0,
+            })
+
+    def failures(self) -> List[dict]:
+        return [
+            {'failure_reason': entry['failure_reason'], 'url': entry['url']}
+            for _, entry in sorted(self.completed.items())
+            if entry['failed']
+        ]
+
+    def domains(self) -> List[str]:
+        return sorted(self.urls)
+
+    def load(self, domain: str) -> Optional[pd.DataFrame]:
+        """
+        Load the links of a domain as a DataFrame, in page order, or None if it has no links.
+        """
+        import pandas as pd
+        if domain not in self.urls:
+            return None
+        pages = dict()
+        with open(self._filename(domain), 'r') as fp:
+            for line in fp:
+                try:
+                    page = json.loads(line)
+                except ValueError:
+                    continue
+                # only journaled pages count; a page scraped again after a restart replaces the earlier one
+                entry = self.completed.get(page['position'])
+                if entry is not None and not entry['failed']:
+                    pages[page['position']] = page
+        frames = [PageLinks.from_columns(pages[position]['links']).to_frame() for position in sorted(pages)]
+        links = pd.concat(frames, ignore_index=True)
+        if len(links) == 0:
+            return None
+        return links.drop_duplicates().reset_index(drop=True)
+
+    def remove(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
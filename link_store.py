@@ -0,0 +1,173 @@
+"""
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sqlite3
+from typing import TYPE_CHECKING, Iterable, List
+
+import constants
+from log import log
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# SQLite limits the number of bound parameters per statement
+QUERY_BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS links (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    label TEXT,
+    domain TEXT,
+    link TEXT,
+    full_link TEXT,
+    link_text TEXT,
+    link_class_name TEXT,
+    removed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS links_domain_url ON links (domain, url);
+"""
+
+UPSERT = """
+INSERT INTO links (key, url, label, domain, link, full_link, link_text, link_class_name, removed)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)
+ON CONFLICT (key) DO UPDATE SET
+    label = excluded.label,
+    link = excluded.link,
+    link_text = excluded.link_text,
+    link_class_name = excluded.link_class_name,
+    removed = 0
+WHERE
+    links.removed = 1
+    OR links.link_text IS NOT excluded.link_text
+    OR links.label IS NOT excluded.label
+    OR links.link_class_name IS NOT excluded.link_class_name
+"""
+
+
+def make_store_keys(df: pd.DataFrame) -> pd.Series:
+    # a link is identified by its page, absolute href, and the order in which it occurs on that page
+    pre_key = df['url'].astype(str) + '_' + df['full_link'].astype(str)
+    return pre_key + '_' + pre_key.groupby(pre_key, sort=False).cumcount().astype(str)
+
+
+def batches(items: List, size: int = QUERY_BATCH_SIZE) -> Iterable[List]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class LinkStore:
+    """
+    Indexed, on-disk link history.
+
+    Only the rows of the pages being reconciled are read, and only changed rows are written. Links
+    that disappear are marked as removed rather than deleted.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def load(self, urls: Iterable[str]) -> pd.DataFrame:
+        """
+        Load the current links of the given pages, in the ALL_LINKS_FILE_HEADER layout.
+        """
+        import pandas as pd
+        urls = sorted(set(urls))
+        frames = [pd.DataFrame([], columns=constants.ALL_LINKS_FILE_HEADER + ['rowid'])]
+        for batch in batches(urls):
+            frames.append(pd.read_sql_query(
+                f"SELECT rowid, {', '.join(constants.ALL_LINKS_FILE_HEADER)} FROM links "
+                f"WHERE removed = 0 AND url IN ({', '.join('?' * len(batch))})",
+                self.connection,
+                params=batch
+            ))
+        # keep the order in which links were first stored
+        links = pd.concat(frames).sort_values('rowid', kind='stable')
+        return links.loc[:, constants.ALL_LINKS_FILE_HEADER].reset_index(drop=True)
+
+    def save(self, urls: Iterable[str], all_links: pd.DataFrame):
+        """
+        Make ``all_links`` the current state of the given pages: upsert its rows, and mark every
+        other link of those pages as removed.
+        """
+        urls = sorted(set(urls))
+        all_links = all_links.loc[all_links['url'].isin(urls), constants.ALL_LINKS_FILE_HEADER].fillna('')
+        keys = make_store_keys(all_links)
+        rows = zip(keys, *(all_links[column] for column in constants.ALL_LINKS_FILE_HEADER))
+        with self.connection:
+            self.connection.execute('CREATE TEMP TABLE IF NOT EXISTS current_keys (key TEXT PRIMARY KEY)')
+            self.connection.execute('DELETE FROM current_keys')
+            self.connection.executemany('INSERT OR IGNORE INTO current_keys VALUES (?)', ((key,) for key in keys))
+            self.connection.executemany(UPSERT, rows)
+            for batch in batches(urls):
+                self.connection.execute(
+                    f"UPDATE links SET removed = 1 WHERE removed = 0 AND url IN ({', '.join('?' * len(batch))}) "
+                    "AND key NOT IN (SELECT key FROM current_keys)",
+                    batch
+                )
+        log.info(f'Saved {len(all_links)} links of {len(urls)} pages to {self.filename}.')
+
+    def import_csv(self, filename: str):
+        import pandas as pd
+        all_links = pd.read_csv(filename).fillna('')
+        self.save(all_links['url'].unique(), all_links)
+
+    def export_csv(self, filename: str):
+        import pandas as pd
+        all_links = pd.read_sql_query(
+            f"SELECT {', '.join(constants.ALL_LINKS_FILE_HEADER)} FROM links WHERE removed = 0 ORDER BY rowid",
+            self.connection
+        )
+        all_links.to_csv(filename, index=False)
+        log.info(f'Exported {len(all_links)} links to {filename}.')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Migrate link history between all_links CSV files and a link store')
+    parser.add_argument(
+        dest='command',
+        choices=['import', 'export']
+    )
+    parser.add_argument(
+        dest='csv_file',
+        type=str
+    )
+    parser.add_argument(
+        dest='store_file',
+        type=str
+    )
+    return parser.parse_args()
+
+
+def cli():
+    args = parse_args()
+    if args.command == 'import' and not os.path.isfile(args.csv_file):
+        raise RuntimeError(f"File {args.csv_file} does not exist")
+    store = LinkStore(args.store_file)
+    try:
+        if args.command == 'import':
+            store.import_csv(args.csv_file)
+        else:
+            store.export_csv(args.csv_file)
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    rc = 0
+    try:
+        cli()
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        rc = 1
+    os.sys.exit(rc)
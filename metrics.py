@@ -0,0 +1,140 @@
+"""
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+
+class RunMetrics:
+    """
+    Per-url and per-run stage timers and counters.
+
+    Timers accumulate into ``{stage}_seconds`` and counters into their own name, either for a url
+    or, when no url is given, for the run as a whole. A disabled instance records nothing.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.pages: Dict[str, OrderedDict] = OrderedDict()
+        self.run: Dict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def page(self, url: str, **fields):
+        """
+        Set descriptive fields (domain, render mode, outcome...) of a url's metrics.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.pages.setdefault(url, OrderedDict(url=url)).update(fields)
+
+    def add(self, name: str, value: float, url: Optional[str] = None):
+        if not self.enabled:
+            return
+        with self._lock:
+            target = self.run if url is None else self.pages.setdefault(url, OrderedDict(url=url))
+            target[name] = target.get(name, 0) + value
+
+    @contextmanager
+    def timer(self, stage: str, url: Optional[str] = None) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(f'{stage}_seconds', time.perf_counter() - start, url)
+
+    def page_records(self) -> List[dict]:
+        with self._lock:
+            return [dict(page) for page in self.pages.values()]
+
+    def summary(self) -> dict:
+        import pandas as pd
+        pages = pd.DataFrame(self.page_records())
+        summary = {'run': dict(self.run), 'totals': dict(), 'domains': dict()}
+        if len(pages) == 0:
+            return summary
+        numeric = pages.select_dtypes('number')
+        summary['totals'] = {column: float(value) for column, value in numeric.sum().items()}
+        summary['totals']['pages'] = len(pages)
+        if 'failed' in pages.columns:
+            summary['totals']['failed_pages'] = int(pages['failed'].fillna(False).astype(bool).sum())
+        if 'domain' in pages.columns:
+            # slowest domains first
+            by_domain = numeric.groupby(pages['domain'].fillna('')).sum()
+            by_domain['pages'] = pages.groupby(pages['domain'].fillna('')).size()
+            time_columns = [column for column in by_domain.columns if column.endswith('_seconds')]
+            by_domain = by_domain.assign(total_seconds=by_domain[time_columns].sum(axis=1))
+            by_domain = by_domain.sort_values('total_seconds', ascending=False)
+            summary['domains'] = {
+                domain: {column: float(value) for column, value in values.items()}
+                for domain, values in by_domain.iterrows()
+            }
+        return summary
+
+    def write(self, prefix: str):
+        """
+        Write ``{prefix}.csv`` with a row per url, and ``{prefix}.json`` with the run summary.
+        """
+        if not self.enabled:
+            return
+        import pandas as pd
+        pd.DataFrame(self.page_records()).to_csv(f'{prefix}.csv', index=False)
+        with open(f'{prefix}.json', 'w') as fp:
+            json.dump(self.summary(), fp, indent=4)
+
+    def write_prometheus(self, filename: str):
+        """
+        Write the run summary in the Prometheus text format, e.g. for node_exporter's textfile collector.
+        """
+        if not self.enabled:
+            return
+        summary = self.summary()
+        lines = list()
+
+        def gauge(name: str, help_text: str, samples: Dict[str, float], label: Optional[str] = None):
+            lines.append(f'# HELP link_scraper_{name} {help_text}')
+            lines.append(f'# TYPE link_scraper_{name} gauge')
+            for key, value in samples.items():
+                labels = '{%s="%s"}' % (label, escape_label(key)) if label else ''
+                lines.append(f'link_scraper_{name}{labels} {value}')
+
+        run_stages = {name[:-len('_seconds')]: value for name, value in summary['run'].items() if name.endswith('_seconds')}
+        page_stages = {
+            name[:-len('_seconds')]: value for name, value in summary['totals'].items() if name.endswith('_seconds')
+        }
+        counters = {
+            name: value
+            for name, value in {**summary['totals'], **summary['run']}.items()
+            if not name.endswith('_seconds')
+        }
+        gauge('run_stage_seconds', 'Wall time of each stage of the last run.', run_stages, 'stage')
+        gauge('page_stage_seconds', 'Time spent in each per-page stage of the last run, summed over pages.', page_stages, 'stage')
+        for name, value in counters.items():
+            gauge(name, f'Total {name.replace("_", " ")} in the last run.', {'': value})
+        gauge(
+            'domain_seconds',
+            'Time spent on each domain in the last run, summed over its pages.',
+            {domain: values['total_seconds'] for domain, values in summary['domains'].items()},
+            'domain'
+        )
+        gauge('last_run_timestamp_seconds', 'Unix time at which the last run finished.', {'': time.time()})
+
+        # write to a temporary file first, so collectors never read a half-written file
+        tmp_filename = f'{filename}.tmp'
+        with open(tmp_filename, 'w') as fp:
+            fp.write('\n'.join(lines) + '\n')
+        os.replace(tmp_filename, filename)
+
+
+def escape_label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# shared by code paths that run without instrumentation
+NO_METRICS = RunMetrics(enabled=False)
@@ -0,0 +1,92 @@
+"""
+"""
+from __future__ import annotations
+
+import sys
+from typing import TYPE_CHECKING, List
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# per-link fields, in the order they appear in link records
+LINK_FIELDS = ['link', 'full_link', 'link_class_name', 'link_text']
+# fields shared by every link of a page
+PAGE_FIELDS = ['url', 'domain', 'label']
+# the order of fields in link records and DataFrames
+RECORD_FIELDS = ['link', 'url', 'domain', 'label', 'full_link', 'link_class_name', 'link_text']
+
+
+def intern(value) -> str:
+    # repeated hrefs, classes and texts share a single string object
+    return sys.intern(str(value)) if value is not None else None
+
+
+class PageLinks:
+    """
+    Links parsed from one page, stored column-wise.
+
+    Page-level fields are stored once, and per-link strings are interned. Links only become dicts
+    or DataFrame rows when they leave the scraper, through ``to_records`` or ``to_frame``.
+    """
+
+    __slots__ = PAGE_FIELDS + LINK_FIELDS
+
+    def __init__(self, url: str, domain: str, label: str):
+        self.url = intern(url)
+        self.domain = intern(domain)
+        self.label = intern(label)
+        for field in LINK_FIELDS:
+            setattr(self, field, list())
+
+    def append(self, link: str, full_link: str, link_class_name: str, link_text: str):
+        self.link.append(intern(link))
+        self.full_link.append(intern(full_link))
+        self.link_class_name.append(intern(link_class_name))
+        self.link_text.append(intern(link_text))
+
+    def __len__(self) -> int:
+        return len(self.link)
+
+    def __repr__(self) -> str:
+        return f'PageLinks(url={self.url!r}, links={len(self)})'
+
+    def to_records(self) -> List[dict]:
+        return [
+            {
+                'link': link,
+                'url': self.url,
+                'domain': self.domain,
+                'label': self.label,
+                'full_link': full_link,
+                'link_class_name': link_class_name,
+                'link_text': link_text,
+            }
+            for link, full_link, link_class_name, link_text
+            in zip(self.link, self.full_link, self.link_class_name, self.link_text)
+        ]
+
+    def to_frame(self) -> pd.DataFrame:
+        import pandas as pd
+        columns = {field: getattr(self, field) for field in LINK_FIELDS}
+        for field in PAGE_FIELDS:
+            columns[field] = [getattr(self, field)] * len(self)
+        return pd.DataFrame(columns, columns=RECORD_FIELDS)
+
+    def to_columns(self) -> dict:
+        # a compact, JSON-serializable form
+        return {field: getattr(self, field) for field in PAGE_FIELDS + LINK_FIELDS}
+
+    @classmethod
+    def from_columns(cls, columns: dict) -> 'PageLinks':
+        page_links = cls(columns['url'], columns['domain'], columns['label'])
+        for values in zip(*(columns[field] for field in LINK_FIELDS)):
+            page_links.append(*values)
+        return page_links
+
+    @classmethod
+    def from_records(cls, url: str, domain: str, label: str, records: List[dict]) -> 'PageLinks':
+        page_links = cls(url, domain, label)
+        for record in records:
+            page_links.append(*(record[field] for field in LINK_FIELDS))
+        return page_links
@@ -0,0 +1,67 @@
+"""
+"""
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from log import log
+
+
+class ParsePool:
+    """
+    Runs CPU-bound work, such as parsing page sources, on a pool of processes.
+
+    Fetchers hand off a page and move on to the next one, while parsing scales with cores. At most
+    ``max_pending`` items are queued or in progress at once: submitting another blocks until one is
+    done, so fetchers can't run ahead of the parsers and fill memory with page sources.
+    """
+
+    def __init__(self, workers: int, max_pending: Optional[int] = None):
+        if workers < 1:
+            raise RuntimeError(f'Expected at least 1 parse worker, got {workers}')
+        self.workers = workers
+        self.max_pending = max_pending or 2 * workers
+        self.restarted = 0
+        self._executor = self._start()
+        self._pending = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+
+    def _start(self) -> ProcessPoolExecutor:
+        # spawned rather than forked, as forking a process that runs browser threads isn't safe
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def _submit(self, fn: Callable[..., Any], *args) -> Future:
+        with self._lock:
+            executor = self._executor
+        try:
+            return executor.submit(fn, *args)
+        except BrokenProcessPool:
+            # a worker died (e.g. out of memory on a huge page), which breaks the whole pool for good;
+            # the items it was running fail with BrokenProcessPool, and later ones go to a fresh pool
+            with self._lock:
+                if self._executor is executor:
+                    log.warning('A parse worker died, restarting the parse pool.')
+                    executor.shutdown(wait=False)
+                    self._executor = self._start()
+                    self.restarted += 1
+                executor = self._executor
+            return executor.submit(fn, *args)
+
+    def submit(self, fn: Callable[..., Any], *args) -> Future:
+        """
+        Run ``fn(*args)`` in a worker process, waiting first if too many items are pending.
+        """
+        self._pending.acquire()
+        try:
+            future = self._submit(fn, *args)
+        except Exception:
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda _: self._pending.release())
+        return future
+
+    def close(self):
+        with self._lock:
+            self._executor.shutdown()
@@ -0,0 +1,105 @@
+"""
+"""
+from __future__ import annotations
+
+import json
+from typing import TYPE_CHECKING, List, Optional
+
+import constants
+from log import log
+
+if TYPE_CHECKING:
+    from selenium import webdriver
+    from selenium.webdriver.chrome.webdriver import WebDriver
+
+
+# blocked by url pattern, as the browser only lets requests be blocked by url
+IMAGE_EXTENSIONS = ['png', 'jpg', 'jpeg', 'gif', 'webp', 'avif', 'svg', 'ico', 'bmp']
+MEDIA_EXTENSIONS = ['mp4', 'webm', 'ogg', 'ogv', 'mp3', 'wav', 'm4a', 'mov', 'm3u8']
+FONT_EXTENSIONS = ['woff', 'woff2', 'ttf', 'otf', 'eot']
+STYLESHEET_EXTENSIONS = ['css']
+# from least to most blocked
+RESOURCE_POLICIES = [
+    constants.ResourcePolicies.NONE,
+    constants.ResourcePolicies.TRACKERS,
+    constants.ResourcePolicies.MEDIA,
+    constants.ResourcePolicies.STRICT,
+]
+DEFAULT_TRACKER_PATTERNS = [
+    '*google-analytics.com/*',
+    '*googletagmanager.com/*',
+    '*googlesyndication.com/*',
+    '*googleadservices.com/*',
+    '*doubleclick.net/*',
+    '*adservice.google.com/*',
+    '*connect.facebook.net/*',
+    '*amazon-adsystem.com/*',
+    '*scorecardresearch.com/*',
+    '*quantserve.com/*',
+    '*hotjar.com/*',
+    '*taboola.com/*',
+    '*outbrain.com/*',
+    '*criteo.com/*',
+    '*chartbeat.com/*',
+    '*segment.io/*',
+]
+
+
+def extension_patterns(extensions: List[str]) -> List[str]:
+    # with and without a query string
+    return [pattern for extension in extensions for pattern in (f'*.{extension}', f'*.{extension}?*')]
+
+
+def blocked_url_patterns(policy: str, tracker_patterns: Optional[List[str]] = None) -> List[str]:
+    tracker_patterns = DEFAULT_TRACKER_PATTERNS if tracker_patterns is None else tracker_patterns
+    # each policy blocks everything the one before it does, and more
+    level = RESOURCE_POLICIES.index(policy)
+    patterns = list()
+    if level >= RESOURCE_POLICIES.index(constants.ResourcePolicies.TRACKERS):
+        patterns.extend(tracker_patterns)
+    if level >= RESOURCE_POLICIES.index(constants.ResourcePolicies.MEDIA):
+        patterns.extend(extension_patterns(IMAGE_EXTENSIONS + MEDIA_EXTENSIONS + FONT_EXTENSIONS))
+    if level >= RESOURCE_POLICIES.index(constants.ResourcePolicies.STRICT):
+        patterns.extend(extension_patterns(STYLESHEET_EXTENSIONS))
+    return patterns
+
+
+def load_tracker_patterns(filename: str) -> List[str]:
+    # one url pattern per line, with * wildcards; blank lines and # comments are ignored
+    with open(filename, 'r') as fp:
+        lines = [line.strip() for line in fp]
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+def apply_resource_policy(browser: WebDriver, policy: str, tracker_patterns: Optional[List[str]] = None):
+    """
+    Block the requests that the policy rules out, for the browser's next navigations.
+    """
+    if not hasattr(browser, 'execute_cdp_cmd'):
+        # only Chrome can block requests
+        return
+    browser.execute_cdp_cmd('Network.enable', dict())
+    browser.execute_cdp_cmd('Network.setBlockedURLs', {'urls': blocked_url_patterns(policy, tracker_patterns)})
+
+
+def log_blocked_requests(options: webdriver.ChromeOptions):
+    # only network events are logged, so that blocked requests can be counted
+    options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    options.add_experimental_option('perfLoggingPrefs', {'enableNetwork': True, 'enablePage': False})
+
+
+def count_blocked_requests(browser: WebDriver) -> int:
+    """
+    Count the requests blocked since the last call, draining the browser's performance log.
+    """
+    try:
+        entries = browser.get_log('performance')
+    except Exception:
+        log.debug('Browser has no performance log, not counting blocked requests.')
+        return 0
+    blocked = 0
+    for entry in entries:
+        message = json.loads(entry['message'])['message']
+        if message['method'] == 'Network.loadingFailed' and message['params'].get('blockedReason'):
+            blocked += 1
+    return blocked
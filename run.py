@@ -1,22 +1,86 @@
 """
 """
+from __future__ import annotations
+
 import argparse
+import hashlib
+import json
 import os
+import shutil
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import nullcontext
 from datetime import datetime
-from typing import Optional, List
-from urllib.parse import urlparse
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Iterator, Optional, List, Tuple, Union
+from urllib.parse import urljoin, urlparse
 
+import lxml.etree
 import lxml.html
-import pandas as pd
-import requests
-from selenium import webdriver
-from selenium.webdriver.chrome.webdriver import WebDriver
 
 import constants
+import waits
+from browser_pool import DEFAULT_MAX_PAGES, DEFAULT_MAX_RSS_MB, BrowserPool, browser_crash_errors
+from host_health import CIRCUIT_OPEN_REASON, DEFAULT_FAILURE_THRESHOLD, DEFAULT_TTL, NEGATIVE_CACHE_REASON, HostHealth
+from link_partitions import LinkPartitions, partition_batches
+from link_matchers import clean_selector, compile_selector, get_matcher
+from link_spool import LinkSpool
+from link_store import LinkStore
 from log import log
+from metrics import NO_METRICS, RunMetrics
+from page_links import PageLinks
+from parse_pool import ParsePool
+from resources import (
+    RESOURCE_POLICIES,
+    apply_resource_policy,
+    count_blocked_requests,
+    load_tracker_patterns,
+    log_blocked_requests
+)
+from scheduler import (
+    DEFAULT_DOMAIN_CONCURRENCY,
+    DEFAULT_DOMAIN_RATE,
+    DomainScheduler,
+    bounded_map,
+    interleave_by_domain,
+)
+from validator_cache import DEFAULT_MAX_ENTRIES, ValidatorCache
 
+# pandas, requests and selenium are imported by the functions that use them, so that
+# run.py -h and offline diffs don't pay for loading a scraper
+if TYPE_CHECKING:
+    import pandas as pd
+    import requests
+    from selenium.webdriver.chrome.webdriver import WebDriver
 
 RUN_TIMESTAMP = datetime.now().isoformat().replace(':', '')
+STATIC_FETCH_TIMEOUT = 30
+HEAD_TIMEOUT = 10
+# highly repetitive columns, dictionary encoded in parquet outputs
+PARQUET_DICTIONARY_COLUMNS = ['url', 'label', 'domain']
+# rows read at a time when only part of a CSV file is kept
+CSV_CHUNK_ROWS = 100000
+# on-disk partitions of link files diffed out of core, removed once diffed
+PARTITIONS_DIRECTORY = os.path.join('data', f'.partitions_{RUN_TIMESTAMP}')
+# manifests of sharded runs: data/shards/{run_id}/shard-{shard}-of-{shards}.json
+SHARDS_DIRECTORY = os.path.join('data', 'shards')
+
+# a page's HTML: the browser's page source, or the raw bytes of a static response
+PageSource = Union[str, bytes]
+# a page's result, or while the page is parsed on a parse pool, the Future of its result
+ParseResult = Union[dict, Future]
+# the fields of a row that parsing needs, handed to parse workers instead of the whole row
+PARSE_FIELDS = ['url', 'domain', 'label', 'include_nav_links', 'include_selector', 'exclude_selector']
+
+# HTTP status of the browser's last navigation, 0 for Chrome's own error page, or null when unknown
+NAVIGATION_STATUS_SCRIPT = """
+var entries = performance.getEntriesByType('navigation');
+if (entries.length > 0 && entries[0].responseStatus !== undefined) {
+    return entries[0].responseStatus;
+}
+return document.URL.indexOf('chrome-error://') === 0 ? 0 : null;
+"""
 
 
 def is_truthy(value: any) -> bool:
@@ -26,20 +90,77 @@ def is_truthy(value: any) -> bool:
 
 
 def validate_input_url_data(input_urls: pd.DataFrame):
-    if sorted(input_urls.columns) != ['include_nav_links', 'label', 'url']:
-        raise RuntimeError('Expected fields url, label, and include_nav_links, got %s' % repr(input_urls.columns))
+    columns = set(input_urls.columns)
+    required = set(constants.INPUT_URLS_REQUIRED_FIELDS)
+    if not required.issubset(columns) or not columns.issubset(required | set(constants.INPUT_URLS_OPTIONAL_FIELDS)):
+        raise RuntimeError(
+            'Expected fields url, label, and include_nav_links, optionally %s, got %s'
+            % (', '.join(constants.INPUT_URLS_OPTIONAL_FIELDS), repr(input_urls.columns))
+        )
 
 
-def clean_input_url_data(input_urls: pd.DataFrame) -> pd.DataFrame:
+def clean_choice_field(input_urls: pd.DataFrame, field: str, choices: set):
+    input_urls[field] = input_urls[field].astype(str).str.strip().str.lower()
+    unknown = set(input_urls[field]) - choices
+    if unknown:
+        raise RuntimeError(f'Unknown {field} value(s) {sorted(unknown)}, expected one of {sorted(choices)}')
+
+
+def clean_input_url_data(input_urls: pd.DataFrame, defaults: Optional[dict] = None) -> pd.DataFrame:
     # convert include_nav_links based on truthiness
     input_urls['include_nav_links'] = input_urls['include_nav_links'].map(is_truthy)
+    # fill in defaults for optional fields, letting the caller override the built-in ones
+    defaults = {**constants.INPUT_URLS_OPTIONAL_FIELDS, **(defaults or {})}
+    for field, default in defaults.items():
+        if field not in input_urls.columns:
+            input_urls[field] = default
+        input_urls[field] = input_urls[field].fillna(default)
+    clean_choice_field(
+        input_urls,
+        'render_mode',
+        {constants.RenderModes.BROWSER, constants.RenderModes.STATIC, constants.RenderModes.AUTO}
+    )
+    clean_choice_field(input_urls, 'wait_strategy', set(waits.WAIT_STRATEGIES))
+    clean_choice_field(input_urls, 'resource_policy', set(RESOURCE_POLICIES))
+    for field in ('include_selector', 'exclude_selector'):
+        input_urls[field] = input_urls[field].map(clean_selector)
+        # compiled up front, so a bad selector fails the run before anything is scraped
+        for selector in input_urls[field].unique():
+            if selector:
+                compile_selector(selector)
     return input_urls
 
 
-def get_links(xml_tree: lxml.html.HtmlElement, include_nav_links: bool = False) -> List[lxml.html.HtmlElement]:
-    if include_nav_links:
-        return xml_tree.xpath(constants.XPathMatchers.LINKS)
-    return xml_tree.xpath(constants.XPathMatchers.LINKS_NOT_UNDER_NAV)
+# compiled once, rather than on every call
+BASE_HREF_XPATH = lxml.etree.XPath(
+    '//base[@href]/@href|//x:base[@href]/@href',
+    namespaces={'x': 'http://www.w3.org/1999/xhtml'}
+)
+# characters removed from link text
+LINK_TEXT_DELETIONS = str.maketrans('', '', '\n\t')
+
+
+def get_links(
+        xml_tree: lxml.html.HtmlElement,
+        include_nav_links: bool = False,
+        include_selector: Optional[str] = None,
+        exclude_selector: Optional[str] = None) -> List[lxml.html.HtmlElement]:
+    matcher = get_matcher(bool(include_nav_links), clean_selector(include_selector), clean_selector(exclude_selector))
+    return matcher(xml_tree)
+
+
+def get_base_href(xml_tree: lxml.html.HtmlElement) -> Optional[str]:
+    # like lxml's make_links_absolute, the last <base href> in the document wins
+    base_hrefs = BASE_HREF_XPATH(xml_tree)
+    return str(base_hrefs[-1]) if base_hrefs else None
+
+
+def make_link_absolute(href: str, page_url: str, base_href: Optional[str] = None) -> str:
+    # mirrors lxml's make_links_absolute, applied to a single href
+    href = href.strip()
+    if base_href:
+        href = urljoin(base_href, href).strip()
+    return urljoin(page_url, href)
 
 
 def get_site_domain(site: str) -> str:
@@ -51,23 +172,156 @@ def get_site_domain(site: str) -> str:
     return ''
 
 
-def parse_link(link: lxml.html.HtmlElement, parsed_info: dict):
+def shard_of(domain: str, shards: int) -> int:
+    # a stable hash (unlike hash()), so every node agrees on the shard of a domain
+    return int(hashlib.md5(str(domain).encode()).hexdigest(), 16) % shards
+
+
+def in_shard(domains: pd.Series, shard: int, shards: int) -> pd.Series:
+    domains = domains.fillna('')
+    return domains.map({domain: shard_of(domain, shards) == shard for domain in domains.unique()})
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    # "3/8" is the fourth of eight shards
+    try:
+        shard, shards = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{value} is not a shard, e.g. 0/8')
+    if not 0 <= shard < shards:
+        raise argparse.ArgumentTypeError(f'Shard {shard} is not between 0 and {shards - 1}')
+    return shard, shards
+
+
+def shard_manifest_filename(run_id: str, shard: int, shards: int) -> str:
+    return os.path.join(SHARDS_DIRECTORY, run_id, f'shard-{shard}-of-{shards}.json')
+
+
+def journal_directory(run_id: str, shard: Optional[Tuple[int, int]] = None) -> str:
+    # the spooled links and journal of a run, kept until the run completes
+    if shard is not None:
+        run_id = f'{run_id}_shard-{shard[0]}-of-{shard[1]}'
+    return os.path.join('data', f'.run_{run_id}')
+
+
+def write_shard_manifest(run_id: str, shard: int, shards: int, output_format: str, urls: int, links: int):
+    """
+    Record that a shard of a run is complete, and where its outputs are, for the merge step.
+    """
+    filename = shard_manifest_filename(run_id, shard, shards)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    manifest = {
+        'run_id': run_id,
+        'shard': shard,
+        'shards': shards,
+        'timestamp': RUN_TIMESTAMP,
+        'output_format': output_format,
+        'urls': urls,
+        'links': links,
+    }
+    # write to a temporary file first, so the merge never reads a half-written manifest
+    tmp_filename = f'{filename}.tmp'
+    with open(tmp_filename, 'w') as fp:
+        json.dump(manifest, fp, indent=4)
+    os.replace(tmp_filename, filename)
+    log.info(f'Shard {shard} of {shards} of run {run_id} is complete.')
+
+
+def parse_link(
+        link: lxml.html.HtmlElement,
+        parsed_info: dict,
+        page_url: Optional[str] = None,
+        base_href: Optional[str] = None):
     href = link.get('href')
-    parsed_info['full_link'] = href
+    parsed_info['full_link'] = make_link_absolute(href, page_url, base_href) if page_url else href
     parsed_info['link_class_name'] = link.get('link_class_name', '')
-    parsed_info['link_text'] = link.text_content().lower().strip().replace('  ', ' ').replace('\n', '').replace('\t', '')
+    parsed_info['link_text'] = normalize_link_text(link.text_content())
+
+
+def normalize_link_text(text: str) -> str:
+    return text.lower().strip().replace('  ', ' ').translate(LINK_TEXT_DELETIONS)
+
+
+def prefetch_failed(url: str, status_check: str, session: Optional[requests.Session] = None) -> bool:
+    import requests
+    http = session or requests
+    if status_check == constants.StatusChecks.GET:
+        return http.get(url).status_code >= 400
+    if status_check == constants.StatusChecks.HEAD:
+        response = http.head(url, allow_redirects=True, timeout=HEAD_TIMEOUT)
+        if response.status_code in (405, 501):
+            # HEAD not supported; fall back to GET, without downloading the body
+            with http.get(url, stream=True, timeout=HEAD_TIMEOUT) as response:
+                return response.status_code >= 400
+        return response.status_code >= 400
+    # checked after navigating instead
+    return False
+
 
+def navigation_failed(browser: WebDriver) -> bool:
+    status = browser.execute_script(NAVIGATION_STATUS_SCRIPT)
+    if status is None:
+        log.debug('Browser did not report a navigation status.')
+        return False
+    return status == 0 or status >= 400
 
-def process_item(row: pd.Series, browser: WebDriver) -> dict:
+
+def process_item(
+        row: pd.Series,
+        browser: WebDriver,
+        wait_timeout: float = waits.DEFAULT_TIMEOUT,
+        status_check: str = constants.StatusChecks.GET,
+        session: Optional[requests.Session] = None,
+        cache: Optional[ValidatorCache] = None,
+        metrics: RunMetrics = NO_METRICS,
+        tracker_patterns: Optional[List[str]] = None,
+        parser: Optional[ParsePool] = None) -> ParseResult:
+    import requests
     # get current URL content
+    url = row['url']
+    response = None
     try:
-        log.info(f"Parsing links from {row['url']}")
-        response = requests.get(row['url'])
-        fail = response.status_code >= 400
+        log.info(f"Parsing links from {url}")
+        if cache is not None and status_check == constants.StatusChecks.GET:
+            # a conditional GET doubles as the status check, and skips the browser for unchanged pages;
+            # the cheaper status checks are left as they are, without the cache
+            with metrics.timer('fetch', url):
+                response = (session or requests).get(url, headers=cache.request_headers(row))
+            metrics.add('bytes_fetched', len(response.content), url)
+            fail = response.status_code >= 400
+            cached_links = None if fail else cache.lookup(row, response)
+            if cached_links is not None:
+                metrics.add('cache_hits', 1, url)
+                metrics.add('anchors', len(cached_links), url)
+                return {
+                    'failed': False,
+                    'failure_reason': '',
+                    'links': cached_links
+                }
+        else:
+            with metrics.timer('fetch', url):
+                fail = prefetch_failed(url, status_check, session)
         if not fail:
-            browser.get(row['url'])
-            import time
-            time.sleep(3)
+            with metrics.timer('render', url):
+                policy = row.get('resource_policy', constants.INPUT_URLS_OPTIONAL_FIELDS['resource_policy'])
+                apply_resource_policy(browser, policy, tracker_patterns)
+                browser.get(url)
+                if status_check == constants.StatusChecks.BROWSER:
+                    fail = navigation_failed(browser)
+            # timed apart from the render, since per-domain totals add up every stage
+            if not fail:
+                strategy = row.get('wait_strategy', constants.INPUT_URLS_OPTIONAL_FIELDS['wait_strategy'])
+                waited, settled = waits.wait_for_page(browser, strategy, timeout=wait_timeout)
+                metrics.add('wait_seconds', waited, url)
+            metrics.add('blocked_requests', count_blocked_requests(browser), url)
+        if not fail:
+            if settled:
+                log.info(f"Waited {waited:.2f}s for {row['url']} to settle ({strategy}).")
+            else:
+                log.warning(f"Timed out after {waited:.2f}s waiting for {row['url']} to settle ({strategy}).")
+    except browser_crash_errors():
+        # let the browser pool replace a dead browser
+        raise
     except Exception:
         import traceback
         log.warning(f"Error navigating to url {row['url']}.")
@@ -81,13 +335,167 @@ def process_item(row: pd.Series, browser: WebDriver) -> dict:
             'url': row['url'],
             'links': []
         }
-    return process_page(row, browser.page_source)
+    with metrics.timer('page_source', url):
+        page_source = browser.page_source
+    metrics.add('rendered_chars', len(page_source), url)
 
+    def on_parsed(result: dict):
+        if response is not None and not result['failed']:
+            cache.store(row, response, result['links'])
+    return parse_page(row, page_source, metrics, parser, on_parsed)
 
-def process_page(row: pd.Series, page_source: str) -> dict:
+
+def get_session(pool_size: int, hosts: int = 10) -> requests.Session:
+    import requests
+    # keep-alive connections are shared by every request to the same host, with a pool kept per host
+    adapter = requests.adapters.HTTPAdapter(pool_connections=max(hosts, 1), pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def process_static_item(
+        row: pd.Series,
+        session: requests.Session,
+        cache: Optional[ValidatorCache] = None,
+        metrics: RunMetrics = NO_METRICS,
+        parser: Optional[ParsePool] = None) -> ParseResult:
+    # get current URL content, parsing the server HTML without rendering it
+    try:
+        log.info(f"Parsing static links from {row['url']}")
+        headers = cache.request_headers(row) if cache is not None else None
+        with metrics.timer('fetch', row['url']):
+            response = session.get(row['url'], headers=headers, timeout=STATIC_FETCH_TIMEOUT)
+        metrics.add('bytes_fetched', len(response.content), row['url'])
+        fail = response.status_code >= 400
+    except Exception:
+        import traceback
+        log.warning(f"Error fetching url {row['url']}.")
+        log.warning(traceback.format_exc(limit=5))
+        fail = True
+
+    if fail:
+        return {
+            'failed': True,
+            'failure_reason': 'URL navigation',
+            'url': row['url'],
+            'links': []
+        }
+    cached_links = cache.lookup(row, response) if cache is not None else None
+    if cached_links is not None:
+        metrics.add('cache_hits', 1, row['url'])
+        metrics.add('anchors', len(cached_links), row['url'])
+        return {
+            'failed': False,
+            'failure_reason': '',
+            'links': cached_links
+        }
+
+    def on_parsed(result: dict):
+        # auto rows headed for the browser are cached once rendered there
+        if cache is not None and not result['failed'] and not needs_browser(row, result):
+            cache.store(row, response, result['links'])
+    return parse_page(row, response_source(response), metrics, parser, on_parsed)
+
+
+def process_static_items(
+        rows: List[pd.Series],
+        concurrency: int,
+        cache: Optional[ValidatorCache] = None,
+        metrics: RunMetrics = NO_METRICS,
+        session: Optional[requests.Session] = None,
+        scheduler: Optional[DomainScheduler] = None,
+        hosts: Optional[HostHealth] = None,
+        parser: Optional[ParsePool] = None) -> Iterator[ParseResult]:
+    # results are yielded in input order as they complete, with only a window of rows in flight
+    if len(rows) == 0:
+        return
+    session_context = nullcontext(session) if session is not None else get_session(concurrency)
+    with session_context as session, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        fn = partial(process_static_item, session=session, cache=cache, metrics=metrics, parser=parser)
+        if scheduler is not None:
+            fn = throttled(fn, scheduler, metrics, hosts)
+        yield from bounded_map(executor, fn, rows, 2 * concurrency)
+
+
+def throttled(
+        fn: Callable[..., ParseResult],
+        scheduler: DomainScheduler,
+        metrics: RunMetrics = NO_METRICS,
+        hosts: Optional[HostHealth] = None) -> Callable[..., ParseResult]:
+    # the row's domain slot is held for the whole fetch of the page
+    def throttled_fn(row: pd.Series, *args, **kwargs) -> ParseResult:
+        skipped = skipped_result(row, hosts)
+        if skipped is not None:
+            return skipped
+        with scheduler.slot(row['domain']) as waited:
+            metrics.add('throttle_seconds', waited, row['url'])
+            # the host's circuit may have opened while waiting for the slot
+            skipped = skipped_result(row, hosts)
+            if skipped is not None:
+                return skipped
+            result = fn(row, *args, **kwargs)
+            if hosts is not None:
+                # only failing to reach the page counts against its host; a page still being parsed was reached
+                unreachable = (
+                    not isinstance(result, Future)
+                    and result['failed']
+                    and result['failure_reason'] == 'URL navigation'
+                )
+                hosts.record(row['domain'], unreachable)
+        return result
+    return throttled_fn
+
+
+def skipped_result(row: pd.Series, hosts: Optional[HostHealth]) -> Optional[dict]:
+    # rows of failing hosts are reported as failed without being fetched
+    reason = hosts.skip_reason(row['domain']) if hosts is not None else None
+    if reason is None:
+        return None
+    log.info(f"Skipping {row['url']}: {reason}.")
+    return {
+        'failed': True,
+        'failure_reason': reason,
+        'url': row['url'],
+        'links': []
+    }
+
+
+def needs_browser(row: pd.Series, result: Optional[dict]) -> bool:
+    if result is None:
+        return True
+    # in auto mode, fall back to the browser only when the server HTML had no links to offer,
+    # not when the page was unreachable or its host is being skipped
+    return (
+        row['render_mode'] == constants.RenderModes.AUTO
+        and result['failure_reason'] not in ('URL navigation', CIRCUIT_OPEN_REASON, NEGATIVE_CACHE_REASON)
+        and len(result['links']) == 0
+    )
+
+
+def browser_failure(row: pd.Series, error: Exception) -> dict:
+    return {
+        'failed': True,
+        'failure_reason': 'Browser crash',
+        'url': row['url'],
+        'links': []
+    }
+
+
+def response_source(response: requests.Response) -> PageSource:
+    # requests decodes as ISO-8859-1 when the Content-Type names no charset, so the raw bytes are
+    # parsed instead, leaving lxml to honour the page's own <meta charset>
+    if 'charset=' in response.headers.get('Content-Type', '').lower():
+        return response.text
+    return response.content
+
+
+def process_page(row: pd.Series, page_source: PageSource, metrics: RunMetrics = NO_METRICS) -> dict:
     # try to parse the HTML. if something crazy went wrong, report that and continue
     try:
-        page_xml = lxml.html.fromstring(page_source)
+        with metrics.timer('parse', row['url']):
+            page_xml = lxml.html.fromstring(page_source)
     except Exception:
         log.warning(f'Error parsing HTML content of {row["url"]}', exc_info=True)
         return {
@@ -98,7 +506,9 @@ def process_page(row: pd.Series, page_source: str) -> dict:
         }
 
     try:
-        links = parse_page_links(row, page_xml)
+        with metrics.timer('parse', row['url']):
+            links = parse_page_links(row, page_xml)
+        metrics.add('anchors', len(links['links']), row['url'])
     except Exception:
         log.warning(f'Unexpected error processing {row["url"]}', exc_info=True)
         return {
@@ -110,23 +520,93 @@ def process_page(row: pd.Series, page_source: str) -> dict:
     return links
 
 
-def parse_page_links(row: pd.Series, page_xml: lxml.html.HtmlElement) -> dict:
-    include_nav_links = row.get('include_nav_links')
+def process_page_in_worker(row: dict, page_source: PageSource) -> Tuple[dict, dict]:
+    # runs in a parse pool process, so its metrics are handed back with the result
+    metrics = RunMetrics()
+    result = process_page(row, page_source, metrics)
+    return result, metrics.pages.get(row['url'], dict())
+
+
+def parse_page(
+        row: pd.Series,
+        page_source: PageSource,
+        metrics: RunMetrics = NO_METRICS,
+        parser: Optional[ParsePool] = None,
+        on_parsed: Optional[Callable[[dict], None]] = None) -> ParseResult:
+    """
+    process_page, on the parse pool if there is one, calling ``on_parsed`` with the result.
 
-    # get original href tags before making them absolute
-    parsed_links = list()
-    for link in get_links(page_xml, include_nav_links=include_nav_links):
-        parsed_links.append({
-            'link': link.get('href'),
+    On a parse pool, a Future of the result is returned straight away, so the fetcher can move on.
+    """
+    if parser is None:
+        result = process_page(row, page_source, metrics)
+        if on_parsed is not None:
+            on_parsed(result)
+        return result
+
+    parsed = Future()
+
+    def done(future: Future):
+        try:
+            result, page_metrics = future.result()
+            for name, value in page_metrics.items():
+                if name != 'url':
+                    metrics.add(name, value, row['url'])
+            if on_parsed is not None:
+                on_parsed(result)
+            parsed.set_result(result)
+        except Exception as e:
+            parsed.set_exception(e)
+
+    try:
+        # waits while the parse pool has too many pages queued
+        with metrics.timer('parse_queue', row['url']):
+            fields = {field: row.get(field) for field in PARSE_FIELDS}
+            future = parser.submit(process_page_in_worker, fields, page_source)
+    except BrokenProcessPool:
+        # the pool broke again as soon as it was restarted, so this page is parsed here instead
+        log.warning(f'Parse pool unavailable, parsing {row["url"]} on the fetch thread.', exc_info=True)
+        return parse_page(row, page_source, metrics, None, on_parsed)
+    future.add_done_callback(done)
+    return parsed
+
+
+def resolve_result(row: pd.Series, result: ParseResult) -> dict:
+    # a page handed to the parse pool is only waited for once its result is needed
+    if not isinstance(result, Future):
+        return result
+    try:
+        return result.result()
+    except Exception:
+        log.warning(f'Error parsing {row["url"]} in the parse pool', exc_info=True)
+        return {
+            'failed': True,
+            'failure_reason': 'HTML parse failure',
             'url': row['url'],
-            'domain': row['domain'],
-            'label': row['label']
-        })
+            'links': []
+        }
+
+
+def parse_page_links(row: pd.Series, page_xml: lxml.html.HtmlElement) -> dict:
+    include_nav_links = row.get('include_nav_links')
+    base_href = get_base_href(page_xml)
 
-    # make href tags absolute and finish parsing links
-    page_xml.make_links_absolute(row['url'])
-    for i, link in enumerate(get_links(page_xml, include_nav_links=include_nav_links)):
-        parse_link(link, parsed_links[i])
+    # resolve each original href as it is visited, leaving the document untouched
+    parsed_links = PageLinks(row['url'], row['domain'], row['label'])
+    links = get_links(
+        page_xml,
+        include_nav_links=include_nav_links,
+        include_selector=row.get('include_selector'),
+        exclude_selector=row.get('exclude_selector')
+    )
+    for link in links:
+        href = link.get('href')
+        parsed_links.append(
+            href,
+            make_link_absolute(href, row['url'], base_href),
+            link.get('link_class_name', ''),
+            normalize_link_text(link.text_content())
+        )
 
     return {
         'failed': False,
@@ -135,52 +615,243 @@ def parse_page_links(row: pd.Series, page_xml: lxml.html.HtmlElement) -> dict:
     }
 
 
-def write_csv_dataframe(df, prefix):
-    df.to_csv(f'data/{prefix}_{RUN_TIMESTAMP}.csv', index=False)
+def output_path(prefix: str, output_format: str = constants.OutputFormats.CSV, partial: bool = False) -> str:
+    """
+    Where an output goes: data/{prefix}_{RUN_TIMESTAMP}.csv, or data/{prefix}/run={RUN_TIMESTAMP}/ for parquet.
+
+    Outputs are written under a hidden partial name next to it, and only renamed into place once
+    complete, so an interrupted run never leaves truncated outputs for the next run to pick up.
+    """
+    if output_format == constants.OutputFormats.PARQUET:
+        name = f'run={RUN_TIMESTAMP}'
+        return os.path.join('data', prefix, f'.{name}.partial' if partial else name)
+    name = f'{prefix}_{RUN_TIMESTAMP}.csv'
+    return os.path.join('data', f'.{name}.partial' if partial else name)
+
+
+def publish_output(prefix: str, output_format: str = constants.OutputFormats.CSV):
+    partial = output_path(prefix, output_format, partial=True)
+    path = output_path(prefix, output_format)
+    if os.path.isdir(path):
+        # a dataset directory can't be replaced in one step, so the previous one is moved aside first
+        previous = f'{partial}.previous'
+        os.replace(path, previous)
+        os.replace(partial, path)
+        shutil.rmtree(previous)
+    else:
+        os.replace(partial, path)
+
+
+def discard_output(prefix: str, output_format: str = constants.OutputFormats.CSV):
+    partial = output_path(prefix, output_format, partial=True)
+    if os.path.isdir(partial):
+        shutil.rmtree(partial)
+    elif os.path.isfile(partial):
+        os.remove(partial)
+
+
+def write_csv_dataframe(df, prefix, path: Optional[str] = None):
+    df.to_csv(path or output_path(prefix), index=False)
+
+
+def write_parquet_dataframe(df, prefix, path: Optional[str] = None, part: int = 0):
+    # data/{prefix}/run={RUN_TIMESTAMP}/domain={domain}/part-{part}-{i}.parquet; parts are numbered in
+    # the order they are written, so that the rows of a domain are read back in that order
+    path = path or output_path(prefix, constants.OutputFormats.PARQUET)
+    os.makedirs(path, exist_ok=True)
+    if len(df) == 0:
+        return
+    if 'domain' not in df.columns:
+        df = df.assign(domain=df['url'].map(get_site_domain))
+    df.to_parquet(
+        path,
+        engine='pyarrow',
+        compression='zstd',
+        index=False,
+        partition_cols=['domain'],
+        basename_template=f'part-{part:05d}-{{i}}.parquet',
+        use_dictionary=[column for column in PARQUET_DICTIONARY_COLUMNS if column in df.columns]
+    )
+
+
+class OutputWriter:
+    """
+    Appends chunks of the run's outputs as they are produced.
+
+    CSV chunks are appended straight away. Parquet chunks are buffered up to ``chunk_rows`` rows,
+    so that small appends don't produce a swarm of tiny files.
 
+    When ``staged``, outputs are written under their partial names, and only renamed into place by
+    ``close``; ``discard`` removes them instead, e.g. when the run fails partway.
+    """
 
-def handle_failures(failures: List[dict]):
+    def __init__(
+            self,
+            output_format: str = constants.OutputFormats.CSV,
+            chunk_rows: int = 10000,
+            staged: bool = True):
+        self.output_format = output_format
+        self.chunk_rows = chunk_rows
+        self.staged = staged
+        self.buffers = dict()
+        self.columns = dict()
+        self.written = set()
+        # parquet flushes so far, per output
+        self.parts = dict()
+
+    def path(self, prefix: str) -> str:
+        return output_path(prefix, self.output_format, partial=self.staged)
+
+    def append(self, prefix: str, df: pd.DataFrame):
+        self.columns.setdefault(prefix, list(df.columns))
+        if len(df) == 0:
+            return
+        if self.output_format == constants.OutputFormats.PARQUET:
+            buffer = self.buffers.setdefault(prefix, list())
+            buffer.append(df)
+            if sum(len(chunk) for chunk in buffer) >= self.chunk_rows:
+                self.flush(prefix)
+        else:
+            df.to_csv(self.path(prefix), index=False, mode='a', header=prefix not in self.written)
+            self.written.add(prefix)
+
+    def flush(self, prefix: str):
+        import pandas as pd
+        buffer = self.buffers.pop(prefix, list())
+        if len(buffer) > 0:
+            part = self.parts.get(prefix, 0)
+            write_parquet_dataframe(pd.concat(buffer, ignore_index=True), prefix, self.path(prefix), part)
+            self.parts[prefix] = part + 1
+            self.written.add(prefix)
+
+    def close(self):
+        import pandas as pd
+        for prefix in list(self.buffers):
+            self.flush(prefix)
+        # outputs that never received a row are still written, empty
+        for prefix, columns in self.columns.items():
+            if prefix not in self.written:
+                empty = pd.DataFrame([], columns=columns)
+                if self.output_format == constants.OutputFormats.PARQUET:
+                    write_parquet_dataframe(empty, prefix, self.path(prefix))
+                else:
+                    write_csv_dataframe(empty, prefix, self.path(prefix))
+                self.written.add(prefix)
+        if self.staged:
+            for prefix in self.columns:
+                publish_output(prefix, self.output_format)
+        self.columns.clear()
+
+    def discard(self):
+        # once closed there is nothing left to discard, so this is safe to call either way
+        self.buffers.clear()
+        if self.staged:
+            for prefix in self.columns:
+                discard_output(prefix, self.output_format)
+        self.columns.clear()
+
+
+def write_dataframe(df, prefix, output_format: str = constants.OutputFormats.CSV):
+    # written whole under the partial name, so the output is never seen half written
+    discard_output(prefix, output_format)
+    if output_format == constants.OutputFormats.PARQUET:
+        write_parquet_dataframe(df, prefix, output_path(prefix, output_format, partial=True))
+    else:
+        write_csv_dataframe(df, prefix, output_path(prefix, output_format, partial=True))
+    publish_output(prefix, output_format)
+
+
+def handle_failures(failures: List[dict], output_format: str = constants.OutputFormats.CSV):
+    import pandas as pd
     if len(failures) > 0:
         failures = pd.DataFrame(failures)
         failures.drop(['links', 'failed'], axis=1, inplace=True)
     else:
         failures = pd.DataFrame([], columns=['failure_reason', 'url'])
-    write_csv_dataframe(failures, 'failed')
+    write_dataframe(failures, 'failed', output_format)
+
 
+def handle_links(
+        cur_links: pd.DataFrame,
+        all_links: pd.DataFrame,
+        output_format: str = constants.OutputFormats.CSV,
+        metrics: RunMetrics = NO_METRICS):
+    with metrics.timer('diff'):
+        new_links, all_links = find_new_links(cur_links, all_links)
+    metrics.add('new_links', len(new_links))
+    write_dataframe(new_links, 'new_links', output_format)
+    write_dataframe(all_links, 'all_links', output_format)
+
+
+def handle_spooled_links(
+        spool: LinkSpool,
+        all_links: Optional[pd.DataFrame],
+        writer: OutputWriter,
+        store: Optional[LinkStore] = None,
+        metrics: RunMetrics = NO_METRICS,
+        history: Optional[LinkPartitions] = None,
+        memory_budget: Optional[float] = None):
+    import pandas as pd
+    # diff one domain at a time, so only a single domain's links are in memory at once
+    run_has_links = spool.link_count > 0
+    writer.append('new_links', pd.DataFrame([], columns=constants.NEW_LINKS_FILE_HEADER))
+    if store is None:
+        writer.append('all_links', pd.DataFrame([], columns=constants.ALL_LINKS_FILE_HEADER))
+
+    def diff_domain(domain: str, previous_links: Optional[pd.DataFrame]):
+        cur_links = spool.load(domain)
+        with metrics.timer('diff'):
+            new_links, domain_links = find_domain_links(cur_links, previous_links, run_has_links)
+        metrics.add('new_links', len(new_links))
+        writer.append('new_links', new_links)
+        if store is not None:
+            store.save(spool.urls[domain], domain_links)
+        else:
+            writer.append('all_links', domain_links)
 
-def handle_links(cur_links: pd.DataFrame, all_links: pd.DataFrame):
-    new_links, all_links = find_new_links(cur_links, all_links)
-    write_csv_dataframe(new_links, 'new_links')
-    write_csv_dataframe(all_links, 'all_links')
+    if store is not None:
+        for domain in spool.domains():
+            diff_domain(domain, store.load(spool.urls[domain]))
+        return
+    if history is not None:
+        # an out-of-core history is read a batch of partitions at a time, within the memory budget
+        spooled = dict()
+        for domain in spool.domains():
+            spooled.setdefault(history.partition_of(domain), list()).append(domain)
+        batches = (
+            (history.load(batch), [domain for partition in batch for domain in spooled.get(partition, list())])
+            for batch in partition_batches(history.sizes, memory_budget)
+        )
+    else:
+        batches = [(all_links, spool.domains())]
+    for previous, domains in batches:
+        if previous is not None and len(previous) > 0:
+            indices = previous.groupby(previous['domain'].fillna(''), sort=False).indices
+        else:
+            indices = dict()
+        for domain in sorted(set(domains) | set(indices)):
+            previous_links = previous.iloc[indices[domain]].reset_index(drop=True) if domain in indices else None
+            diff_domain(domain, previous_links)
 
 
 def make_element_ids(df: pd.DataFrame) -> str:
     # form the "pre-id" of links as their domain and absolute href
-    df['pre_id'] = df.apply(
-        lambda row: f"{row['domain']}_{row['full_link']}",
-        axis=1
-    )
-    # form a unique id by the ordering inwhich each item occurs in the pageq2""" ÇÇÇ """
-    df['id'] = ''
-    for pre_id, group in df.groupby('pre_id'):
-        df.loc[group.index, 'id'] = [f"{pre_id}{number}" for number in range(len(group))]
-    del df['pre_id']
+    pre_id = df['domain'].astype(str) + '_' + df['full_link'].astype(str)
+    # form a unique id by the order in which each item occurs in the page
+    df['id'] = pre_id + pre_id.groupby(pre_id, sort=False).cumcount().astype(str)
 
 
-def find_new_links(cur_links: pd.DataFrame, all_links: pd.DataFrame) -> List[pd.DataFrame]:
-
-    # quick helper method (D.R.Y) for cleaning a DataFrame
-    def clean(df, column_order):
-        return (
-            df
-            .drop_duplicates()
-            .loc[:, column_order]
-            .reset_index(drop=True)
-        )
+def clean_links(df: pd.DataFrame, column_order: List[str]) -> pd.DataFrame:
+    return (
+        df
+        .drop_duplicates()
+        .loc[:, column_order]
+        .reset_index(drop=True)
+    )
 
-    new_links = list()
-    changes = list()
 
+def find_new_links(cur_links: pd.DataFrame, all_links: pd.DataFrame) -> List[pd.DataFrame]:
+    import pandas as pd
     no_cur_links = cur_links is None or len(cur_links) == 0
     no_all_links = all_links is None or len(all_links) == 0
 
@@ -195,10 +866,10 @@ def find_new_links(cur_links: pd.DataFrame, all_links: pd.DataFrame) -> List[pd.
     # if no previous links, all current links are new
     if no_all_links:
         log.info('No previous links to merge with.')
-        all_links = clean(cur_links, constants.ALL_LINKS_FILE_HEADER)
+        all_links = clean_links(cur_links, constants.ALL_LINKS_FILE_HEADER)
         cur_links['defined_change'] = 'new link'
         return (
-            clean(cur_links, constants.NEW_LINKS_FILE_HEADER),
+            clean_links(cur_links, constants.NEW_LINKS_FILE_HEADER),
             all_links
         )
 
@@ -207,94 +878,474 @@ def find_new_links(cur_links: pd.DataFrame, all_links: pd.DataFrame) -> List[pd.
         log.info('No new links to consider.')
         return pd.DataFrame([], columns=constants.NEW_LINKS_FILE_HEADER), all_links
 
-    # otherwise, parse current links to reconcile new ones
+    # otherwise, reconcile current links against previous ones with keyed joins on the element id
     all_links.fillna('', inplace=True)
     make_element_ids(cur_links)
     make_element_ids(all_links)
-    for _, row in cur_links.iterrows():
-        existing_link = all_links.loc[all_links['id'] == row['id']]
-        if len(existing_link) == 0:
-            # link is new
-            item = row.to_dict()
-            item['defined_change'] = 'new link'
-            new_links.append(item)
-        elif len(existing_link) > 1:
-            # should never happen. if it does, then logic is broken to determine state changes of link text.
-            raise RuntimeError("Multiple matches found for HTML (domain, link, order).")
-        else:
-            existing_link = existing_link.iloc[0]
-            index = existing_link.name
-
-            if row['link_text'] != existing_link['link_text']:
-                # text has changed for same link
-                item = row.to_dict()
-                item['defined_change'] = 'text change'
-                changes.append(item)
-                log.info(f"Link {row['id']} changed text from {existing_link['link_text']} to {row['link_text']}.")
-                all_links.loc[index, 'link_text'] = row['link_text']
-
-    removed_link_ids = list(set(all_links['id']) - set(cur_links['id']))
-    if len(removed_link_ids) > 0:
-        for _id in removed_link_ids:
-            log.info(f'Link {_id} removed.')
-            index = all_links.index[all_links['id'] == _id]
-            item = all_links.loc[index].to_dict(orient='records')[0]
-            item['defined_change'] = 'removed link'
-            changes.append(item)
-            all_links.drop(index, inplace=True)
-
-    new_links = pd.DataFrame(new_links, columns=constants.NEW_LINKS_FILE_HEADER)
-    changes = pd.DataFrame(changes, columns=constants.NEW_LINKS_FILE_HEADER).append(new_links)
+    if all_links['id'].duplicated().any():
+        # should never happen. if it does, then logic is broken to determine state changes of link text.
+        raise RuntimeError("Multiple matches found for HTML (domain, link, order).")
+
+    previous = all_links[['id', 'link_text']].rename(columns={'link_text': 'previous_link_text'})
+    matched = cur_links[['id', 'link_text']].merge(previous, on='id', how='left', indicator=True)
+    is_new = (matched['_merge'] == 'left_only').to_numpy()
+    is_changed = (
+        (matched['_merge'] == 'both') & (matched['link_text'] != matched['previous_link_text'])
+    ).to_numpy()
+
+    # links whose id has never been seen before
+    new_links = cur_links.loc[is_new].copy()
+    new_links['defined_change'] = 'new link'
+
+    # text has changed for same link
+    changes = cur_links.loc[is_changed].copy()
+    changes['defined_change'] = 'text change'
+    for _id, old_text, new_text in zip(
+            changes['id'], matched.loc[is_changed, 'previous_link_text'], changes['link_text']):
+        log.info(f"Link {_id} changed text from {old_text} to {new_text}.")
+    changed_text = changes.set_index('id')['link_text']
+    to_update = all_links['id'].isin(changed_text.index)
+    all_links.loc[to_update, 'link_text'] = all_links.loc[to_update, 'id'].map(changed_text)
+
+    # links that were previously seen, but are no longer present
+    is_removed = ~all_links['id'].isin(cur_links['id'])
+    removed_links = all_links.loc[is_removed].copy()
+    removed_links['defined_change'] = 'removed link'
+    for _id in removed_links['id']:
+        log.info(f'Link {_id} removed.')
+    all_links = all_links.loc[~is_removed]
+
+    # change records carry no element id, so identical links collapse when cleaned
+    new_links = new_links.loc[:, constants.NEW_LINKS_FILE_HEADER]
+    changes = pd.concat([
+        changes.loc[:, constants.NEW_LINKS_FILE_HEADER],
+        removed_links.loc[:, constants.NEW_LINKS_FILE_HEADER],
+        new_links
+    ])
     log.info(f'{len(changes)} changes detected.')
 
-    all_links = all_links.append(new_links)
+    all_links = pd.concat([all_links, new_links])
 
     return (
-        clean(changes, constants.NEW_LINKS_FILE_HEADER),
-        clean(all_links, constants.ALL_LINKS_FILE_HEADER)
+        clean_links(changes, constants.NEW_LINKS_FILE_HEADER),
+        clean_links(all_links, constants.ALL_LINKS_FILE_HEADER)
     )
 
 
-def get_browser(headless: bool = True) -> WebDriver:
+def find_domain_links(
+        cur_links: Optional[pd.DataFrame],
+        all_links: Optional[pd.DataFrame],
+        run_has_links: bool) -> List[pd.DataFrame]:
+    """
+    find_new_links for a single domain (or a batch of whole domains), giving the same result as
+    diffing the whole run at once.
+    """
+    import pandas as pd
+    if (cur_links is None or len(cur_links) == 0) and run_has_links and all_links is not None and len(all_links) > 0:
+        # the run found links, just none for this domain, so every previous link was removed
+        removed_links = all_links.fillna('')
+        removed_links['defined_change'] = 'removed link'
+        log.info(f'{len(removed_links)} links of {removed_links["domain"].nunique()} domain(s) removed.')
+        return (
+            clean_links(removed_links, constants.NEW_LINKS_FILE_HEADER),
+            pd.DataFrame([], columns=constants.ALL_LINKS_FILE_HEADER)
+        )
+    return find_new_links(cur_links, all_links)
+
+
+def get_browser(
+        headless: bool = True,
+        resource_policy: str = constants.INPUT_URLS_OPTIONAL_FIELDS['resource_policy'],
+        tracker_patterns: Optional[List[str]] = None) -> WebDriver:
+    from selenium import webdriver
     options = webdriver.ChromeOptions()
     options.add_argument('--no-sandbox')
     options.add_argument('--disable-gpu')
     if headless:
         log.info('Running browser as headless')
         options.add_argument('--headless')
-    return webdriver.Chrome(options=options)
+    log_blocked_requests(options)
+    browser = webdriver.Chrome(options=options)
+    # rows may pick another policy before they navigate
+    apply_resource_policy(browser, resource_policy, tracker_patterns)
+    return browser
 
 
-def main(browser: WebDriver, input_urls: pd.DataFrame, all_links: Optional[pd.DataFrame]):
+def scrape_rows(
+        rows: List[pd.Series],
+        indices: List[int],
+        pool: BrowserPool,
+        session: requests.Session,
+        scheduler: DomainScheduler,
+        hosts: HostHealth,
+        cache: Optional[ValidatorCache] = None,
+        metrics: RunMetrics = NO_METRICS,
+        static_concurrency: int = 16,
+        wait_timeout: float = waits.DEFAULT_TIMEOUT,
+        status_check: str = constants.StatusChecks.GET,
+        tracker_patterns: Optional[List[str]] = None,
+        parser: Optional[ParsePool] = None) -> Iterator[Tuple[int, dict]]:
+    """
+    Scrape the rows at ``indices``, yielding each row's index and result as soon as it is known.
+    """
+    # static and auto rows are parsed from the server HTML first
+    static = [i for i in indices if rows[i]['render_mode'] != constants.RenderModes.BROWSER]
+    rendered = [i for i in indices if rows[i]['render_mode'] == constants.RenderModes.BROWSER]
+    log.info(f'Fetching {len(static)} URLs without a browser.')
+    with metrics.timer('static'):
+        # work is spread over domains, so that their limits don't hold up the other workers
+        static = [static[j] for j in interleave_by_domain([rows[i]['domain'] for i in static])]
+        static_rows = [rows[i] for i in static]
+        static_results = process_static_items(
+            static_rows,
+            static_concurrency,
+            cache,
+            metrics,
+            session,
+            scheduler,
+            hosts,
+            parser
+        )
+        for i, result in zip(static, static_results):
+            result = resolve_result(rows[i], result)
+            if needs_browser(rows[i], result):
+                rendered.append(i)
+            else:
+                yield i, result
+
+    # everything else (including auto rows with no static links) is rendered in the browser
+    log.info(f'Rendering {len(rendered)} URLs in the browser.')
+    with metrics.timer('browser'):
+        rendered = [rendered[j] for j in interleave_by_domain([rows[i]['domain'] for i in rendered])]
+        rendered_results = pool.map(
+            throttled(
+                partial(
+                    process_item,
+                    wait_timeout=wait_timeout,
+                    status_check=status_check,
+                    session=session,
+                    cache=cache,
+                    metrics=metrics,
+                    tracker_patterns=tracker_patterns,
+                    parser=parser
+                ),
+                scheduler,
+                metrics,
+                hosts
+            ),
+            [rows[i] for i in rendered],
+            on_error=browser_failure
+        )
+        for i, result in zip(rendered, rendered_results):
+            yield i, resolve_result(rows[i], result)
+
+
+def main(
+        browser_factory: Callable[[], WebDriver],
+        input_urls: pd.DataFrame,
+        all_links: Optional[pd.DataFrame],
+        workers: int = 1,
+        static_concurrency: int = 16,
+        wait_strategy: Optional[str] = None,
+        wait_timeout: float = waits.DEFAULT_TIMEOUT,
+        status_check: str = constants.StatusChecks.GET,
+        cache: Optional[ValidatorCache] = None,
+        store: Optional[LinkStore] = None,
+        output_format: str = constants.OutputFormats.CSV,
+        metrics: Optional[RunMetrics] = None,
+        prometheus_file: Optional[str] = None,
+        shard: Optional[Tuple[int, int]] = None,
+        run_id: Optional[str] = None,
+        domain_concurrency: int = DEFAULT_DOMAIN_CONCURRENCY,
+        domain_rate: float = DEFAULT_DOMAIN_RATE,
+        hosts: Optional[HostHealth] = None,
+        resource_policy: Optional[str] = None,
+        tracker_patterns: Optional[List[str]] = None,
+        browser_max_pages: Optional[int] = DEFAULT_MAX_PAGES,
+        browser_max_rss_mb: Optional[float] = DEFAULT_MAX_RSS_MB,
+        resume: bool = False,
+        history: Optional[LinkPartitions] = None,
+        memory_budget_mb: Optional[float] = None,
+        parse_workers: int = 0):
+    import pandas as pd
+    metrics = metrics if metrics is not None else NO_METRICS
+    # without a negative cache file, failing hosts are still cut off within the run
+    hosts = hosts if hosts is not None else HostHealth()
+    run_start = time.perf_counter()
     validate_input_url_data(input_urls)
     # validate_links(all_links)
-    clean_input_url_data(input_urls)
+    run_id = run_id or RUN_TIMESTAMP
+    spool_directory = journal_directory(run_id, shard)
+    if resume and not os.path.isdir(spool_directory):
+        raise RuntimeError(f'Run {run_id} has no journal in {spool_directory} to resume from')
+    if not resume and os.path.isdir(spool_directory):
+        raise RuntimeError(f'Run {run_id} already has a journal in {spool_directory}, pass --resume {run_id}')
+    defaults = {'wait_strategy': wait_strategy, 'resource_policy': resource_policy}
+    clean_input_url_data(input_urls, defaults={field: value for field, value in defaults.items() if value})
+    pool = BrowserPool(browser_factory, workers=workers, max_pages=browser_max_pages, max_rss_mb=browser_max_rss_mb)
+    scheduler = DomainScheduler(domain_concurrency, domain_rate)
+    # one pooled session serves both the static fetches and the browser's status checks
+    host_count = input_urls['url'].map(get_site_domain).nunique()
+    session = get_session(max(workers, static_concurrency), hosts=host_count)
+    # without parse workers, pages are parsed on the thread that fetched them
+    parser = ParsePool(parse_workers) if parse_workers > 0 else None
+    writer = OutputWriter(output_format)
+    spool = LinkSpool(spool_directory)
+    log.info(f'Journaling run {run_id} to {spool_directory}; if it is interrupted, resume it with --resume {run_id}.')
+    completed = False
     try:
-        links = list()
-        failed = list()
-        log.info(f'Scraping {len(input_urls)} URLs.')
         input_urls['domain'] = input_urls['url'].map(get_site_domain)
-        for _, row in input_urls.iterrows():
-            result = process_item(row, browser)
+        if shard is not None:
+            # each shard scrapes its own domains, and diffs them against only their history
+            input_urls = input_urls[in_shard(input_urls['domain'], *shard)].reset_index(drop=True)
+            if all_links is not None:
+                all_links = all_links[in_shard(all_links['domain'], *shard)].reset_index(drop=True)
+            log.info(f'Scraping shard {shard[0]} of {shard[1]} of run {run_id}.')
+        log.info(f'Scraping {len(input_urls)} URLs with {workers} browser(s).')
+        rows = [row for _, row in input_urls.iterrows()]
+        writer.append('failed', pd.DataFrame([], columns=['failure_reason', 'url']))
+        if resume:
+            for position, entry in spool.completed.items():
+                if position >= len(rows) or rows[position]['url'] != entry['url']:
+                    raise RuntimeError(f'Input urls differ from those of run {run_id} at row {position}')
+            # pages finished before the interruption are not scraped again
+            writer.append('failed', pd.DataFrame(spool.failures(), columns=['failure_reason', 'url']))
+            log.info(f'Resuming run {run_id}: {len(spool.completed)} of {len(rows)} URLs already finished.')
+            metrics.add('resumed_pages', len(spool.completed))
+
+        # each result is written out as soon as it arrives, rather than held until the end of the run
+        def collect(i: int, result: dict):
+            metrics.page(
+                rows[i]['url'],
+                domain=rows[i]['domain'],
+                render_mode=rows[i]['render_mode'],
+                failed=result['failed'],
+                failure_reason=result['failure_reason']
+            )
             if result['failed']:
-                failed.append(result)
+                writer.append('failed', pd.DataFrame([result], columns=['failure_reason', 'url']))
+                spool.append_failure(rows[i]['domain'], i, rows[i]['url'], result['failure_reason'])
             else:
-                links += result['links']
-        links = pd.DataFrame(links).drop_duplicates().reset_index(drop=True)
+                spool.append(rows[i]['domain'], i, rows[i]['url'], result['links'])
+
+        remaining = [i for i in range(len(rows)) if i not in spool.completed]
+        scraped = scrape_rows(
+            rows,
+            remaining,
+            pool,
+            session,
+            scheduler,
+            hosts,
+            cache=cache,
+            metrics=metrics,
+            static_concurrency=static_concurrency,
+            wait_timeout=wait_timeout,
+            status_check=status_check,
+            tracker_patterns=tracker_patterns,
+            parser=parser
+        )
+        for i, result in scraped:
+            collect(i, result)
 
-        handle_failures(failed)
-        handle_links(links, all_links)
+        metrics.add('links', spool.link_count)
+        with metrics.timer('output'):
+            handle_spooled_links(
+                spool,
+                all_links,
+                writer,
+                store,
+                metrics,
+                history,
+                memory_budget_mb * 2 ** 20 if memory_budget_mb else float('inf')
+            )
+        # the outputs are only put in place once complete, and the journal only removed after that
+        writer.close()
+        spool.remove()
+        completed = True
     except Exception:
         log.error('Uncaught error in main method. Exiting.', exc_info=True)
     finally:
-        browser.close()
+        # an interrupted run leaves only its journal, to --resume from
+        writer.discard()
+        if completed and shard is not None:
+            write_shard_manifest(run_id, *shard, output_format, len(input_urls), spool.link_count)
+        session.close()
+        pool.close()
+        if parser is not None:
+            parser.close()
+            metrics.add('parse_pool_restarted', parser.restarted)
+        log.info(f'Browsers: {pool.summary()}.')
+        metrics.add('browsers_recycled', pool.recycled)
+        metrics.add('browsers_restarted', pool.restarted)
+        if cache is not None:
+            log.info(f'Page cache: {cache.summary()}.')
+            cache.save()
+        hosts.save()
+        log.info(f'Failing hosts: {hosts.summary()}.')
+        if store is not None:
+            store.close()
+        metrics.add('run_seconds', time.perf_counter() - run_start)
+        write_metrics(metrics, prometheus_file)
+
+
+def validate_links(links: pd.DataFrame, filename: str):
+    missing = [column for column in constants.ALL_LINKS_FILE_HEADER if column not in links.columns]
+    if missing:
+        raise RuntimeError(f'Expected the all_links fields in {filename}, missing {", ".join(missing)}')
+
 
+def diff_links(
+        cur_links_file: str,
+        all_links_file: Optional[str],
+        output_format: str = constants.OutputFormats.CSV,
+        memory_budget_mb: Optional[float] = None):
+    """
+    Reconcile a snapshot of current links against an all_links file, as a run would, without scraping.
+    """
+    if memory_budget_mb:
+        diff_partitioned_links(cur_links_file, all_links_file, output_format, memory_budget_mb)
+        return
+    cur_links = load_csv(cur_links_file, missing_ok=False, columns=constants.ALL_LINKS_FILE_HEADER)
+    validate_links(cur_links, cur_links_file)
+    # read back from a file, empty fields are NaN and numeric-looking ones are numbers, unlike scraped links
+    cur_links = cur_links.fillna('').astype(str)
+    all_links = load_csv(all_links_file, missing_ok=True, columns=constants.ALL_LINKS_FILE_HEADER)
+    if all_links is not None:
+        validate_links(all_links, all_links_file)
+        all_links = all_links.fillna('').astype(str)
+    log.info(f'Diffing {cur_links_file} against {all_links_file or "no previous links"}.')
+    handle_links(cur_links, all_links, output_format)
 
-def load_csv(filename: str, missing_ok: bool = False) -> Optional[pd.DataFrame]:
+
+def diff_partitioned_links(
+        cur_links_file: str,
+        all_links_file: Optional[str],
+        output_format: str,
+        memory_budget_mb: float):
+    """
+    diff_links for files larger than memory: both files are partitioned by domain on disk, then
+    diffed a batch of partitions at a time, within the memory budget.
+    """
+    import pandas as pd
+    directory = PARTITIONS_DIRECTORY
+    writer = OutputWriter(output_format)
+    try:
+        cur_partitions = partition_links(cur_links_file, os.path.join(directory, 'current'))
+        all_partitions = (
+            partition_links(all_links_file, os.path.join(directory, 'all_links'))
+            if all_links_file else LinkPartitions(os.path.join(directory, 'all_links'))
+        )
+        log.info(f'Diffing {cur_links_file} against {all_links_file or "no previous links"}, by partition.')
+        writer.append('new_links', pd.DataFrame([], columns=constants.NEW_LINKS_FILE_HEADER))
+        writer.append('all_links', pd.DataFrame([], columns=constants.ALL_LINKS_FILE_HEADER))
+        sizes = [cur + previous for cur, previous in zip(cur_partitions.sizes, all_partitions.sizes)]
+        for batch in partition_batches(sizes, memory_budget_mb * 2 ** 20):
+            cur_links = cur_partitions.load(batch)
+            all_links = all_partitions.load(batch)
+            # as in diff_links, fields read back from files are compared as text
+            new_links, batch_links = find_domain_links(
+                cur_links.fillna('').astype(str) if cur_links is not None else None,
+                all_links.fillna('').astype(str) if all_links is not None else None,
+                cur_partitions.rows > 0
+            )
+            writer.append('new_links', new_links)
+            writer.append('all_links', batch_links)
+        writer.close()
+    finally:
+        writer.discard()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def write_metrics(metrics: RunMetrics, prometheus_file: Optional[str] = None):
+    if not metrics.enabled:
+        return
+    prefix = os.path.join('data', f'metrics_{RUN_TIMESTAMP}')
+    metrics.write(prefix)
+    log.info(f'Wrote run metrics to {prefix}.csv and {prefix}.json.')
+    if prometheus_file:
+        metrics.write_prometheus(prometheus_file)
+
+
+def load_parquet(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    import pandas as pd
+    # a run directory with no partitions holds an empty output
+    if os.path.isdir(path) and not any(files for _, _, files in os.walk(path)):
+        return pd.DataFrame([], columns=columns)
+    df = pd.read_parquet(path, engine='pyarrow', columns=columns)
+    # partition columns are read back as categoricals
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype(str)
+    return df
+
+
+def read_chunks(
+        filename: str,
+        columns: Optional[List[str]] = None,
+        chunk_rows: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """
+    Read a file that load_csv would load, a chunk of rows at a time.
+    """
+    import pandas as pd
+    chunk_rows = chunk_rows or CSV_CHUNK_ROWS
+    if not os.path.exists(filename):
+        raise RuntimeError(f"File {filename} does not exist")
+    if os.path.isdir(filename) or filename.endswith('.parquet'):
+        import pyarrow.dataset as ds
+        # a run directory with no partitions holds an empty output
+        if os.path.isdir(filename) and not any(files for _, _, files in os.walk(filename)):
+            return
+        dataset = ds.dataset(filename, format='parquet', partitioning='hive')
+        for batch in dataset.to_batches(columns=columns, batch_size=chunk_rows):
+            chunk = batch.to_pandas()
+            # partition columns are read back as categoricals
+            for column in chunk.columns:
+                if isinstance(chunk[column].dtype, pd.CategoricalDtype):
+                    chunk[column] = chunk[column].astype(str)
+            yield chunk
+    else:
+        yield from pd.read_csv(filename, chunksize=chunk_rows)
+
+
+def partition_links(
+        filename: str,
+        directory: str,
+        keep: Optional[Callable[[pd.DataFrame], pd.Series]] = None) -> LinkPartitions:
+    """
+    Copy a links file to on-disk partitions by domain, streaming it, for diffing out of core.
+    """
+    partitions = LinkPartitions(directory)
+    for chunk in read_chunks(filename, columns=constants.ALL_LINKS_FILE_HEADER):
+        validate_links(chunk, filename)
+        partitions.append(chunk[keep(chunk)] if keep is not None else chunk)
+    log.info(f'Partitioned {partitions.rows} links of {filename} into {directory}.')
+    return partitions
+
+
+def load_csv(
+        filename: str,
+        missing_ok: bool = False,
+        columns: Optional[List[str]] = None,
+        keep: Optional[Callable[[pd.DataFrame], pd.Series]] = None) -> Optional[pd.DataFrame]:
+    import pandas as pd
+    # keep, if given, selects the rows to load, e.g. the links of a shard's domains
     if filename:
+        # parquet outputs are a run directory (data/all_links/run=...), or a single .parquet file
+        if os.path.isdir(filename) or filename.endswith('.parquet'):
+            if not os.path.exists(filename):
+                raise RuntimeError(f"File {filename} does not exist")
+            df = load_parquet(filename, columns=columns)
+            return df[keep(df)].reset_index(drop=True) if keep is not None else df
         # if you pass a filename, but it doesn't exist, bad dog...
         if not os.path.isfile(filename):
             raise RuntimeError(f"File {filename} does not exist")
+        if keep is not None:
+            # filter while reading, so rows that aren't kept are never all in memory
+            chunks = [chunk[keep(chunk)] for chunk in pd.read_csv(filename, chunksize=CSV_CHUNK_ROWS)]
+            if len(chunks) == 0:
+                # a header-only file, e.g. the history of a run that found no links, keeps its columns
+                return pd.read_csv(filename, nrows=0)
+            return pd.concat(chunks, ignore_index=True)
         return pd.read_csv(filename)
     # only throw an error if specified that an unspecified file is unacceptable
     if not missing_ok:
@@ -302,8 +1353,10 @@ def load_csv(filename: str, missing_ok: bool = False) -> Optional[pd.DataFrame]:
     return None
 
 
-def parse_args():
-    parser = argparse.ArgumentParser()
+def add_scrape_args(parser: argparse.ArgumentParser):
+    """
+    Add the input files and the options of how pages are scraped, shared by run.py and watch.py.
+    """
     parser.add_argument(
         dest='new_urls_file',
         type=str
@@ -321,16 +1374,335 @@ def parse_args():
         default=False,
         required=False
     )
+    parser.add_argument(
+        '--workers',
+        dest='workers',
+        type=int,
+        default=1,
+        required=False,
+        help='Number of browsers to scrape with concurrently'
+    )
+    parser.add_argument(
+        '--browser-max-pages',
+        dest='browser_max_pages',
+        type=int,
+        default=DEFAULT_MAX_PAGES,
+        required=False,
+        help='Restart each browser after it has loaded this many pages, to keep its memory in check (0 to never)'
+    )
+    parser.add_argument(
+        '--browser-max-rss-mb',
+        dest='browser_max_rss_mb',
+        type=float,
+        default=DEFAULT_MAX_RSS_MB,
+        required=False,
+        help='Restart a browser once its processes use more than this much memory, in MB (0 to never; Linux only)'
+    )
+    parser.add_argument(
+        '--static-concurrency',
+        dest='static_concurrency',
+        type=int,
+        default=16,
+        required=False,
+        help='Number of concurrent HTTP requests for static and auto render modes'
+    )
+    parser.add_argument(
+        '--parse-workers',
+        dest='parse_workers',
+        type=int,
+        default=0,
+        required=False,
+        help='Number of processes that parse page sources, so that fetching and parsing overlap '
+             '(default: 0, parse each page on the thread that fetched it)'
+    )
+    parser.add_argument(
+        '--domain-concurrency',
+        dest='domain_concurrency',
+        type=int,
+        default=DEFAULT_DOMAIN_CONCURRENCY,
+        required=False,
+        help='Maximum number of pages fetched from the same domain at once, across browsers and static fetches'
+    )
+    parser.add_argument(
+        '--domain-rate',
+        dest='domain_rate',
+        type=float,
+        default=DEFAULT_DOMAIN_RATE,
+        required=False,
+        help='Maximum pages per second fetched from the same domain (default: no limit)'
+    )
+    parser.add_argument(
+        '--wait-strategy',
+        dest='wait_strategy',
+        choices=sorted(waits.WAIT_STRATEGIES),
+        default=None,
+        required=False,
+        help='How to wait for rendered pages to settle, for rows without a wait_strategy '
+             f'(default: {constants.INPUT_URLS_OPTIONAL_FIELDS["wait_strategy"]})'
+    )
+    parser.add_argument(
+        '--resource-policy',
+        dest='resource_policy',
+        choices=RESOURCE_POLICIES,
+        default=None,
+        required=False,
+        help='Which requests rendered pages may not make, for rows without a resource_policy: none, trackers, '
+             'media (trackers, images, audio, video and fonts) or strict (media and stylesheets) '
+             f'(default: {constants.INPUT_URLS_OPTIONAL_FIELDS["resource_policy"]})'
+    )
+    parser.add_argument(
+        '--tracker-patterns',
+        dest='tracker_patterns_file',
+        type=str,
+        default=None,
+        required=False,
+        help='File of url patterns to block as trackers, one per line with * wildcards, '
+             'instead of the built-in list'
+    )
+    parser.add_argument(
+        '--wait-timeout',
+        dest='wait_timeout',
+        type=float,
+        default=waits.DEFAULT_TIMEOUT,
+        required=False,
+        help='Maximum seconds to wait for a rendered page to settle'
+    )
+    parser.add_argument(
+        '--status-check',
+        dest='status_check',
+        choices=[constants.StatusChecks.GET, constants.StatusChecks.HEAD, constants.StatusChecks.BROWSER],
+        default=constants.StatusChecks.GET,
+        required=False,
+        help='How to detect failing urls before scraping them: a full GET, a HEAD request, '
+             "or the status of the browser's own navigation (no extra request)"
+    )
+    parser.add_argument(
+        '--cache-file',
+        dest='cache_file',
+        type=str,
+        default=None,
+        required=False,
+        help='Cache of page validators and links; unchanged pages are not re-rendered'
+    )
+    parser.add_argument(
+        '--cache-size',
+        dest='cache_size',
+        type=int,
+        default=DEFAULT_MAX_ENTRIES,
+        required=False,
+        help='Maximum number of pages kept in the cache'
+    )
+    parser.add_argument(
+        '--host-cache-file',
+        dest='host_cache_file',
+        type=str,
+        default=None,
+        required=False,
+        help='Negative cache of failing hosts; their urls are skipped by later runs until it expires'
+    )
+    parser.add_argument(
+        '--host-cache-ttl',
+        dest='host_cache_ttl',
+        type=float,
+        default=DEFAULT_TTL,
+        required=False,
+        help='Seconds a failing host is skipped for, doubling with each run that still finds it failing'
+    )
+    parser.add_argument(
+        '--host-failure-threshold',
+        dest='host_failure_threshold',
+        type=int,
+        default=DEFAULT_FAILURE_THRESHOLD,
+        required=False,
+        help="Failures in a row after which the rest of a host's urls are skipped for the run (or watch pass)"
+    )
+    parser.add_argument(
+        '--output-format',
+        dest='output_format',
+        choices=[constants.OutputFormats.CSV, constants.OutputFormats.PARQUET],
+        default=constants.OutputFormats.CSV,
+        required=False,
+        help='Format of the new_links, all_links and failed outputs; parquet outputs are written to '
+             'data/{output}/run={timestamp}/domain={domain}/'
+    )
+    parser.add_argument(
+        '--prometheus-file',
+        dest='prometheus_file',
+        type=str,
+        default=None,
+        required=False,
+        help="Also write the metrics of the run (or of each watch pass) to this Prometheus textfile, "
+             "e.g. for node_exporter's textfile collector"
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        epilog='To diff a snapshot of links against an all_links file without scraping, see run.py diff -h. '
+               'To scrape an input file named diff, pass it as ./diff'
+    )
+    add_scrape_args(parser)
+    parser.add_argument(
+        '--store',
+        dest='store_file',
+        type=str,
+        default=None,
+        required=False,
+        help='SQLite link history to reconcile against, instead of an all_links file '
+             '(see link_store.py to import or export the CSV layout)'
+    )
+    parser.add_argument(
+        '--memory-budget-mb',
+        dest='memory_budget_mb',
+        type=float,
+        default=None,
+        required=False,
+        help='Diff against an all_links file larger than memory: partition it by domain on disk, and hold '
+             'only about this much of it in memory at once (default: load it whole)'
+    )
+    parser.add_argument(
+        '--no-metrics',
+        dest='metrics',
+        action='store_false',
+        default=True,
+        required=False,
+        help='Do not write the per-url timing metrics to data/metrics_{timestamp}.csv and .json'
+    )
+    parser.add_argument(
+        '--shard',
+        dest='shard',
+        type=parse_shard,
+        default=None,
+        required=False,
+        help='Scrape only one shard of the input urls, split by domain, e.g. 3/8 for the fourth of eight; '
+             'combine the shards with shards.py merge'
+    )
+    parser.add_argument(
+        '--run-id',
+        dest='run_id',
+        type=str,
+        default=None,
+        required=False,
+        help='Name of the run, shared by all shards of a sharded run (default: the run timestamp)'
+    )
+    parser.add_argument(
+        '--resume',
+        dest='resume_run_id',
+        type=str,
+        default=None,
+        required=False,
+        help='Resume an interrupted run from its journal, skipping the URLs it already finished; '
+             'pass the same input urls (and --shard) as the interrupted run'
+    )
     return parser.parse_args()
 
 
+def parse_diff_args(argv: List[str]):
+    parser = argparse.ArgumentParser(
+        prog='run.py diff',
+        description='Diff a snapshot of current links against an all_links file, without scraping or a browser'
+    )
+    parser.add_argument(
+        dest='cur_links_file',
+        type=str,
+        help='Current links, in the all_links layout (csv, or a parquet output)'
+    )
+    parser.add_argument(
+        dest='all_links_file',
+        type=str,
+        nargs='?',
+        default=None,
+        help='Previous links to diff against; without them, every current link is new'
+    )
+    parser.add_argument(
+        '--output-format',
+        dest='output_format',
+        choices=[constants.OutputFormats.CSV, constants.OutputFormats.PARQUET],
+        default=constants.OutputFormats.CSV,
+        required=False,
+        help='Format of the new_links and all_links outputs'
+    )
+    parser.add_argument(
+        '--memory-budget-mb',
+        dest='memory_budget_mb',
+        type=float,
+        default=None,
+        required=False,
+        help='Diff out of core: partition both files by domain on disk, and hold only about this much '
+             'of them in memory at once (default: load them whole)'
+    )
+    return parser.parse_args(argv)
+
+
+def is_diff_command(argv: List[str]) -> bool:
+    # diff is only a subcommand when followed by its own arguments; an input file named diff is passed as ./diff
+    return len(argv) > 1 and argv[0] == 'diff'
+
+
 def cli():
+    if is_diff_command(os.sys.argv[1:]):
+        args = parse_diff_args(os.sys.argv[2:])
+        diff_links(args.cur_links_file, args.all_links_file, args.output_format, args.memory_budget_mb)
+        return
     args = parse_args()
-    main(
-        get_browser(args.headless),
-        load_csv(args.new_urls_file, missing_ok=False),
-        load_csv(args.all_links_file, missing_ok=True),
-    )
+    if args.store_file and args.all_links_file:
+        raise RuntimeError('Pass either an all_links file or --store, not both')
+    if args.resume_run_id and args.run_id and args.resume_run_id != args.run_id:
+        raise RuntimeError('Pass either --run-id or --resume, not both')
+    run_id = args.resume_run_id or args.run_id
+    if args.shard and not run_id:
+        raise RuntimeError('Sharded runs need a --run-id, shared by all of their shards')
+    if args.shard and args.store_file:
+        raise RuntimeError('Sharded runs diff against an all_links file, not --store')
+    if args.memory_budget_mb and args.store_file:
+        raise RuntimeError('--memory-budget-mb diffs against an all_links file; --store is read a page at a time')
+    keep = (lambda df: in_shard(df['domain'], *args.shard)) if args.shard else None
+    tracker_patterns = load_tracker_patterns(args.tracker_patterns_file) if args.tracker_patterns_file else None
+    resource_policy = args.resource_policy or constants.INPUT_URLS_OPTIONAL_FIELDS['resource_policy']
+    input_urls = load_csv(args.new_urls_file, missing_ok=False)
+    if args.memory_budget_mb and args.all_links_file:
+        # the history is streamed to disk by domain, and read back a batch of domains at a time
+        history = partition_links(args.all_links_file, PARTITIONS_DIRECTORY, keep=keep)
+        all_links = None
+    else:
+        history = None
+        all_links = load_csv(args.all_links_file, missing_ok=True, columns=constants.ALL_LINKS_FILE_HEADER, keep=keep)
+    try:
+        main(
+            partial(get_browser, args.headless, resource_policy, tracker_patterns),
+            input_urls,
+            all_links,
+            workers=args.workers,
+            static_concurrency=args.static_concurrency,
+            wait_strategy=args.wait_strategy,
+            wait_timeout=args.wait_timeout,
+            status_check=args.status_check,
+            cache=ValidatorCache(args.cache_file, max_entries=args.cache_size) if args.cache_file else None,
+            store=LinkStore(args.store_file) if args.store_file else None,
+            output_format=args.output_format,
+            metrics=RunMetrics(enabled=args.metrics),
+            prometheus_file=args.prometheus_file,
+            shard=args.shard,
+            run_id=run_id,
+            domain_concurrency=args.domain_concurrency,
+            domain_rate=args.domain_rate,
+            hosts=HostHealth(
+                args.host_cache_file,
+                ttl=args.host_cache_ttl,
+                failure_threshold=args.host_failure_threshold
+            ),
+            resource_policy=args.resource_policy,
+            tracker_patterns=tracker_patterns,
+            browser_max_pages=args.browser_max_pages,
+            browser_max_rss_mb=args.browser_max_rss_mb,
+            resume=bool(args.resume_run_id),
+            history=history,
+            memory_budget_mb=args.memory_budget_mb,
+            parse_workers=args.parse_workers,
+        )
+    finally:
+        if history is not None:
+            history.remove()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,104 @@
+"""
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+
+DEFAULT_DOMAIN_CONCURRENCY = 2
+# requests per second per domain; 0 for no limit
+DEFAULT_DOMAIN_RATE = 0.0
+
+
+class DomainScheduler:
+    """
+    Limits how many requests each domain gets at once, and how often, across every worker.
+
+    A worker holds one of a domain's slots for the whole fetch of a page. Slots of different
+    domains are independent, so total concurrency stays high as long as work is spread over domains.
+    """
+
+    def __init__(self, max_per_domain: int = DEFAULT_DOMAIN_CONCURRENCY, rate: float = DEFAULT_DOMAIN_RATE):
+        if max_per_domain < 1:
+            raise RuntimeError(f'Expected at least 1 request per domain at once, got {max_per_domain}')
+        if rate < 0:
+            raise RuntimeError(f'Expected a non-negative request rate, got {rate}')
+        self.max_per_domain = max_per_domain
+        self.min_interval = 1 / rate if rate > 0 else 0.0
+        self._condition = threading.Condition()
+        self._active: Dict[str, int] = dict()
+        self._next_start: Dict[str, float] = dict()
+
+    def acquire(self, domain: str) -> float:
+        """
+        Block until the domain has a free slot and its rate allows another request, returning the time waited.
+        """
+        start = time.monotonic()
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                timeout: Optional[float] = None
+                if self._active.get(domain, 0) < self.max_per_domain:
+                    timeout = self._next_start.get(domain, 0.0) - now
+                    if timeout <= 0:
+                        self._active[domain] = self._active.get(domain, 0) + 1
+                        self._next_start[domain] = now + self.min_interval
+                        return now - start
+                self._condition.wait(timeout)
+
+    def release(self, domain: str):
+        with self._condition:
+            self._active[domain] -= 1
+            if self._active[domain] == 0:
+                del self._active[domain]
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, domain: str) -> Iterator[float]:
+        waited = self.acquire(domain)
+        try:
+            yield waited
+        finally:
+            self.release(domain)
+
+
+def interleave_by_domain(domains: List[str]) -> List[int]:
+    """
+    Positions of ``domains`` in round-robin order by domain, so that consecutive items hit different domains.
+    """
+    queues = OrderedDict()
+    for position, domain in enumerate(domains):
+        queues.setdefault(domain, deque()).append(position)
+    order = list()
+    while queues:
+        for domain in list(queues):
+            queue = queues[domain]
+            order.append(queue.popleft())
+            if not queue:
+                del queues[domain]
+    return order
+
+
+def bounded_map(executor: Executor, fn: Callable[[Any], Any], items: Iterable[Any], window: int) -> Iterator[Any]:
+    """
+    Like ``executor.map``, yielding results in input order, but with at most ``window`` items submitted
+    and not yet yielded.
+
+    Items are submitted as results are consumed, rather than all up front, so a slow item only holds
+    back a window of finished results in memory.
+    """
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # a consumer that stops early doesn't leave queued items to run
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,150 @@
+"""
+"""
+import argparse
+import json
+import os
+from typing import Iterator, List
+
+import pandas as pd
+import pyarrow.dataset as ds
+
+import constants
+import run
+from log import log
+
+
+# the outputs of each shard, and their columns when a shard has none
+SHARD_OUTPUTS = {
+    'new_links': constants.NEW_LINKS_FILE_HEADER,
+    'all_links': constants.ALL_LINKS_FILE_HEADER,
+    'failed': ['failure_reason', 'url'],
+}
+
+
+def split_input_urls(filename: str, shards: int) -> List[str]:
+    """
+    Split an input urls file into one file per shard, next to it, as run.py --shard would.
+    """
+    input_urls = run.load_csv(filename, missing_ok=False)
+    domains = input_urls['url'].map(run.get_site_domain)
+    root, ext = os.path.splitext(filename)
+    filenames = list()
+    for shard in range(shards):
+        shard_filename = f'{root}_shard-{shard}-of-{shards}{ext}'
+        input_urls[run.in_shard(domains, shard, shards)].to_csv(shard_filename, index=False)
+        filenames.append(shard_filename)
+    return filenames
+
+
+def load_manifests(run_id: str) -> List[dict]:
+    """
+    Load the manifests of every shard of a run, in shard order, failing unless all of them are complete.
+    """
+    directory = os.path.join(run.SHARDS_DIRECTORY, run_id)
+    if not os.path.isdir(directory):
+        raise RuntimeError(f'No shards of run {run_id} in {directory}')
+    manifests = list()
+    for filename in sorted(os.listdir(directory)):
+        if filename.startswith('shard-') and filename.endswith('.json'):
+            with open(os.path.join(directory, filename), 'r') as fp:
+                manifests.append(json.load(fp))
+    shard_counts = {manifest['shards'] for manifest in manifests}
+    if len(shard_counts) != 1:
+        raise RuntimeError(f'Shards of run {run_id} disagree on the number of shards: {sorted(shard_counts)}')
+    shards = shard_counts.pop()
+    missing = sorted(set(range(shards)) - {manifest['shard'] for manifest in manifests})
+    if missing:
+        raise RuntimeError(f'Shards {missing} of {shards} of run {run_id} are not complete')
+    return sorted(manifests, key=lambda manifest: manifest['shard'])
+
+
+def read_shard_output(manifest: dict, prefix: str, chunk_rows: int = run.CSV_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    if manifest['output_format'] == constants.OutputFormats.PARQUET:
+        path = os.path.join('data', prefix, f'run={manifest["timestamp"]}')
+        if not any(files for _, _, files in os.walk(path)):
+            return
+        dataset = ds.dataset(path, format='parquet', partitioning='hive')
+        for batch in dataset.to_batches(batch_size=chunk_rows):
+            chunk = batch.to_pandas()
+            for column in chunk.columns:
+                if isinstance(chunk[column].dtype, pd.CategoricalDtype):
+                    chunk[column] = chunk[column].astype(str)
+            yield chunk
+    else:
+        yield from pd.read_csv(f'data/{prefix}_{manifest["timestamp"]}.csv', chunksize=chunk_rows)
+
+
+def merge_shards(run_id: str, output_format: str = constants.OutputFormats.CSV):
+    """
+    Combine the outputs of every shard of a run into a single set of outputs.
+
+    Shards hold disjoint domains, so their outputs are concatenated in shard order, and merging
+    the same shards always gives the same outputs.
+    """
+    manifests = load_manifests(run_id)
+    writer = run.OutputWriter(output_format)
+    try:
+        for prefix, columns in SHARD_OUTPUTS.items():
+            writer.append(prefix, pd.DataFrame([], columns=columns))
+            for manifest in manifests:
+                for chunk in read_shard_output(manifest, prefix):
+                    # parquet outputs move the domain partition column last, or add it to failures
+                    writer.append(prefix, chunk[columns])
+        writer.close()
+    finally:
+        writer.discard()
+    log.info(
+        f'Merged {len(manifests)} shards of run {run_id}: '
+        f'{sum(manifest["urls"] for manifest in manifests)} urls, '
+        f'{sum(manifest["links"] for manifest in manifests)} links.'
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Split input urls into shards, or merge the outputs of a sharded run')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    split_parser = subparsers.add_parser('split', help='Split an input urls file into a file per shard')
+    split_parser.add_argument(
+        dest='new_urls_file',
+        type=str
+    )
+    split_parser.add_argument(
+        dest='shards',
+        type=int
+    )
+    merge_parser = subparsers.add_parser('merge', help='Merge the outputs of every shard of a run')
+    merge_parser.add_argument(
+        dest='run_id',
+        type=str
+    )
+    merge_parser.add_argument(
+        '--output-format',
+        dest='output_format',
+        choices=[constants.OutputFormats.CSV, constants.OutputFormats.PARQUET],
+        default=constants.OutputFormats.CSV,
+        required=False,
+        help='Format of the merged new_links, all_links and failed outputs'
+    )
+    return parser.parse_args()
+
+
+def cli():
+    args = parse_args()
+    if args.command == 'split':
+        if args.shards < 1:
+            raise RuntimeError('Split into at least one shard')
+        for filename in split_input_urls(args.new_urls_file, args.shards):
+            log.info(f'Wrote {filename}')
+    else:
+        merge_shards(args.run_id, args.output_format)
+
+
+if __name__ == '__main__':
+    rc = 0
+    try:
+        cli()
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        rc = 1
+    os.sys.exit(rc)
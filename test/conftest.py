@@ -6,6 +6,9 @@ import pandas as pd
 from lxml import html
 from selenium import webdriver
 
+import run
+import waits
+
 FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
 
 
@@ -230,3 +233,117 @@ def find_new_links_data():
         ]
     )
     return cur_links, all_links, new_links_expected, all_links_expected
+
+
+class FakeResponse:
+    def __init__(self, status_code, text=""):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode()
+        self.headers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class FakeSession:
+    """
+    Answers every GET with ``response`` and every HEAD with ``head_response``, or with ``pages``,
+    serves those by url and 404s any other. Records the methods called and the urls fetched.
+    """
+
+    def __init__(self, response=None, head_response=None, pages=None):
+        self.response = response
+        self.head_response = head_response or response
+        self.pages = pages
+        self.calls = list()
+        self.urls = list()
+
+    def get(self, url, **kwargs):
+        self.calls.append("get")
+        self.urls.append(url)
+        if self.pages is None:
+            return self.response
+        if url not in self.pages:
+            return FakeResponse(404)
+        return FakeResponse(200, self.pages[url])
+
+    def head(self, url, **kwargs):
+        self.calls.append("head")
+        self.urls.append(url)
+        return self.head_response
+
+    def close(self):
+        pass
+
+
+class FakeBrowser:
+    """
+    Serves ``page_source`` for any url, and answers the navigation status and readiness scripts,
+    the latter from canned sequences that repeat their last value once exhausted.
+    """
+
+    def __init__(
+            self,
+            page_source="",
+            navigation_status=200,
+            blocked_requests=0,
+            ready_states=("complete",),
+            anchor_counts=(0,),
+            mutation_ages=(10000,)):
+        self.page_source = page_source
+        self.navigation_status = navigation_status
+        self.visited = list()
+        self.blocked_urls = None
+        self.blocked_requests = blocked_requests
+        self.answers = {
+            waits.READY_STATE_SCRIPT: list(ready_states),
+            waits.ANCHOR_COUNT_SCRIPT: list(anchor_counts),
+            waits.MUTATION_AGE_SCRIPT: list(mutation_ages),
+        }
+        self.quit_called = False
+        self.alive = True
+
+    @property
+    def current_url(self):
+        if not self.alive:
+            raise ConnectionError("browser died")
+        return "about:blank"
+
+    def execute_cdp_cmd(self, command, params):
+        if command == "Network.setBlockedURLs":
+            self.blocked_urls = params["urls"]
+
+    def get_log(self, log_type):
+        message = {"message": {"method": "Network.loadingFailed", "params": {"blockedReason": "inspector"}}}
+        return [{"message": json.dumps(message)}] * self.blocked_requests
+
+    def get(self, url):
+        self.visited.append(url)
+
+    def execute_script(self, script):
+        if script == run.NAVIGATION_STATUS_SCRIPT:
+            return self.navigation_status
+        answers = self.answers[script]
+        return answers.pop(0) if len(answers) > 1 else answers[0]
+
+    def quit(self):
+        self.quit_called = True
+
+
+@pytest.fixture(scope="session")
+def fake_response():
+    return FakeResponse
+
+
+@pytest.fixture(scope="session")
+def fake_session():
+    return FakeSession
+
+
+@pytest.fixture(scope="session")
+def fake_browser():
+    return FakeBrowser
@@ -0,0 +1,35 @@
+import lxml.html
+
+import benchmark
+import run
+
+
+def test_generate_page():
+    page = lxml.html.fromstring(benchmark.generate_page(100, with_nav=True))
+    assert len(run.get_links(page, include_nav_links=True)) == 100
+    assert len(run.get_links(page)) == 80
+
+
+def test_generate_history():
+    cur_links, all_links = benchmark.generate_history(1000, churn=0.2)
+    assert len(all_links) == 1000
+    # 50 links removed and 50 added
+    assert len(cur_links) == 1000
+    new_links, _ = run.find_new_links(cur_links, all_links)
+    assert set(new_links['defined_change']) == {'new link', 'text change', 'removed link'}
+
+
+def test_find_regressions():
+    baseline = {'fn': {'seconds': 1.0, 'peak_mb': 10.0}}
+    assert benchmark.find_regressions({'fn': {'seconds': 1.1, 'peak_mb': 10.0}}, baseline, 0.25) == []
+    regressions = benchmark.find_regressions({'fn': {'seconds': 2.0, 'peak_mb': 10.0}}, baseline, 0.25)
+    assert len(regressions) == 1
+    assert regressions[0].startswith('fn seconds')
+    # new benchmarks have nothing to regress against
+    assert benchmark.find_regressions({'other': {'seconds': 2.0, 'peak_mb': 1.0}}, baseline) == []
+
+
+def test_run_benchmarks_quick():
+    results = benchmark.run_benchmarks(quick=True, repeat=1)
+    assert len(results) == 4
+    assert all(result['seconds'] > 0 and result['peak_mb'] > 0 for result in results.values())
@@ -0,0 +1,107 @@
+import os
+import threading
+
+import pytest
+
+from browser_pool import BrowserPool, process_tree_rss
+
+
+def test_browser_pool_map_preserves_order(fake_browser):
+    pool = BrowserPool(fake_browser, workers=4)
+    results = list(pool.map(lambda item, browser: item * 2, range(20), on_error=lambda item, e: None))
+    pool.close()
+    assert results == [i * 2 for i in range(20)]
+
+
+def test_browser_pool_one_browser_per_worker(fake_browser):
+    created = list()
+    lock = threading.Lock()
+
+    def factory():
+        with lock:
+            created.append(fake_browser())
+            return created[-1]
+
+    pool = BrowserPool(factory, workers=2)
+    list(pool.map(lambda item, browser: item, range(10), on_error=lambda item, e: None))
+    pool.close()
+    assert 1 <= len(created) <= 2
+    assert all(browser.quit_called for browser in created)
+
+
+def test_browser_pool_isolates_crashes(fake_browser):
+    created = list()
+
+    def factory():
+        created.append(fake_browser())
+        return created[-1]
+
+    def fn(item, browser):
+        if item == 1:
+            raise ConnectionError('browser died')
+        return item
+
+    pool = BrowserPool(factory, workers=1)
+    results = list(pool.map(fn, range(3), on_error=lambda item, e: f'failed {item}'))
+    pool.close()
+    assert results == [0, 'failed 1', 2]
+    # the crashed browser is shut down and replaced, and the item retried once on a fresh one
+    assert len(created) == 3
+    assert created[0].quit_called and created[1].quit_called
+    assert (pool.restarted, pool.retried) == (2, 1)
+
+
+def test_browser_pool_retries_after_crash(fake_browser):
+    created = list()
+
+    def factory():
+        created.append(fake_browser())
+        return created[-1]
+
+    def fn(item, browser):
+        if item == 1 and browser is created[0]:
+            raise ConnectionError('browser died')
+        return item
+
+    pool = BrowserPool(factory, workers=1)
+    results = list(pool.map(fn, range(3), on_error=lambda item, e: f'failed {item}'))
+    pool.close()
+    assert results == [0, 1, 2]
+    assert len(created) == 2
+
+
+def test_browser_pool_recycles(fake_browser):
+    created = list()
+
+    def factory():
+        created.append(fake_browser())
+        return created[-1]
+
+    pool = BrowserPool(factory, workers=1, max_pages=2)
+    list(pool.map(lambda item, browser: item, range(5), on_error=lambda item, e: None))
+    pool.close()
+    assert len(created) == 3
+    assert pool.recycled == 2
+
+    # a browser that stops responding between items is replaced before the next one
+    def kill(item, browser):
+        browser.alive = False
+        return item
+
+    pool = BrowserPool(factory, workers=1, max_pages=None)
+    assert list(pool.map(kill, range(2), on_error=lambda item, e: None)) == [0, 1]
+    pool.close()
+    assert pool.restarted == 1
+    assert len(created) == 5
+
+
+def test_process_tree_rss():
+    if not os.path.isdir('/proc'):
+        pytest.skip('Needs /proc')
+    # at least the memory of this process
+    assert process_tree_rss(os.getpid()) > 0
+
+
+def test_browser_pool_requires_workers(fake_browser):
+    with pytest.raises(RuntimeError):
+        BrowserPool(fake_browser, workers=0)
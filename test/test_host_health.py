@@ -0,0 +1,53 @@
+import os
+import time
+
+import pytest
+
+from host_health import CIRCUIT_OPEN_REASON, NEGATIVE_CACHE_REASON, HostHealth
+
+
+def test_host_health_circuit():
+    hosts = HostHealth(failure_threshold=2)
+    hosts.record('a.com', True)
+    hosts.record('a.com', False)
+    hosts.record('a.com', True)
+    # a success in between resets the count
+    assert hosts.skip_reason('a.com') is None
+    hosts.record('a.com', True)
+    assert hosts.skip_reason('a.com') == CIRCUIT_OPEN_REASON
+    assert hosts.skip_reason('b.com') is None
+    assert hosts.skipped == 1
+
+
+def test_host_health_negative_cache(tmp_path):
+    filename = os.path.join(tmp_path, 'hosts.json')
+    hosts = HostHealth(filename, ttl=60)
+    hosts.record('dead.com', True)
+    hosts.record('flaky.com', True)
+    hosts.record('flaky.com', False)
+    hosts.save()
+
+    # only hosts that never succeeded are remembered
+    hosts = HostHealth(filename, ttl=60)
+    assert hosts.skip_reason('dead.com') == NEGATIVE_CACHE_REASON
+    assert hosts.skip_reason('flaky.com') is None
+    assert hosts.entries['dead.com']['strikes'] == 1
+
+    # once expired, the host is tried again, and skipped for twice as long if it still fails
+    hosts.entries['dead.com']['until'] = time.time() - 1
+    assert hosts.skip_reason('dead.com') is None
+    hosts.record('dead.com', True)
+    hosts.save()
+    assert hosts.entries['dead.com']['strikes'] == 2
+    assert hosts.entries['dead.com']['until'] > time.time() + 100
+
+    # and forgotten once it works
+    hosts.entries['dead.com']['until'] = time.time() - 1
+    hosts.record('dead.com', False)
+    hosts.save()
+    assert 'dead.com' not in HostHealth(filename).entries
+
+
+def test_host_health_invalid_threshold():
+    with pytest.raises(RuntimeError):
+        HostHealth(failure_threshold=0)
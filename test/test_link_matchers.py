@@ -0,0 +1,77 @@
+import lxml.html
+import pandas as pd
+import pytest
+
+import run
+from link_matchers import LinkMatcher, compile_selector, get_matcher
+
+PAGE = '''
+<html><body>
+  <nav><a href="/home">Home</a></nav>
+  <main>
+    <a href="/story" class="story">Story</a>
+    <div class="related"><a href="/related">Related</a></div>
+    <nav><a href="/next">Next</a></nav>
+  </main>
+  <aside><a href="/ad">Ad</a></aside>
+  <footer><a href="/about">About</a></footer>
+</body></html>
+'''
+
+
+def hrefs(links):
+    return [link.get('href') for link in links]
+
+
+@pytest.mark.parametrize('include_nav_links,include,exclude,expected', [
+    (False, '', '', ['/story', '/related', '/ad', '/about']),
+    (True, '', '', ['/home', '/story', '/related', '/next', '/ad', '/about']),
+    (False, 'main', '', ['/story', '/related']),
+    (False, '//main', '', ['/story', '/related']),
+    (True, 'main', '.related', ['/story', '/next']),
+    (False, '', 'footer, aside', ['/story', '/related']),
+    (False, '', '//footer|//aside', ['/story', '/related']),
+    (False, 'a.story', '', ['/story']),
+    (False, 'article', '', []),
+])
+def test_link_matcher(include_nav_links, include, exclude, expected):
+    matcher = LinkMatcher(include_nav_links, include, exclude)
+    assert hrefs(matcher(lxml.html.fromstring(PAGE))) == expected
+
+
+def test_compile_selector_cached():
+    assert compile_selector('main') is compile_selector('main')
+    assert get_matcher(False, 'main', 'footer') is get_matcher(False, 'main', 'footer')
+    assert get_matcher(False, 'main', '').include is get_matcher(True, 'main', 'footer').include
+
+
+@pytest.mark.parametrize('selector', ['main[', '//main[', 'a::b'])
+def test_compile_selector_invalid(selector):
+    with pytest.raises(RuntimeError):
+        compile_selector(selector)
+
+
+def test_clean_input_url_data_selectors():
+    df = pd.DataFrame({'include_nav_links': [0, 0], 'include_selector': [' main ', None]})
+    run.clean_input_url_data(df)
+    assert list(df['include_selector']) == ['main', '']
+    assert list(df['exclude_selector']) == ['', '']
+    df = pd.DataFrame({'include_nav_links': [0], 'exclude_selector': ['footer[']})
+    with pytest.raises(RuntimeError):
+        run.clean_input_url_data(df)
+
+
+def test_parse_page_links_selectors():
+    row = pd.Series({
+        'url': 'https://www.website.com',
+        'label': 'label',
+        'domain': 'www.website.com',
+        'include_nav_links': False,
+        'include_selector': 'main',
+        'exclude_selector': '',
+    })
+    result = run.parse_page_links(row, lxml.html.fromstring(PAGE))
+    assert [link['full_link'] for link in result['links'].to_records()] == [
+        'https://www.website.com/story',
+        'https://www.website.com/related',
+    ]
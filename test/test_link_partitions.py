@@ -0,0 +1,43 @@
+import os
+
+import pandas as pd
+
+from link_partitions import DIFF_MEMORY_OVERHEAD, LinkPartitions, partition_batches
+
+
+def test_link_partitions(tmp_path, find_new_links_data):
+    _, all_links, _, _ = find_new_links_data
+    links = pd.concat([
+        all_links,
+        all_links.assign(domain='other.website.com'),
+        all_links.assign(domain=None),
+    ], ignore_index=True)
+    partitions = LinkPartitions(os.path.join(tmp_path, 'partitions'), partitions=8)
+    # appended a chunk at a time, as files are read
+    partitions.append(links.iloc[:3])
+    partitions.append(links.iloc[3:])
+    assert partitions.rows == len(links)
+    assert sum(partitions.sizes) > 0
+
+    loaded = [partitions.load([partition]) for partition in range(8)]
+    assert sum(len(chunk) for chunk in loaded if chunk is not None) == len(links)
+    for partition, chunk in enumerate(loaded):
+        if chunk is None:
+            assert partitions.sizes[partition] == 0
+            continue
+        # every link of a domain is in the partition of that domain
+        assert {partitions.partition_of(domain) for domain in chunk['domain'].fillna('')} == {partition}
+    pd.testing.assert_frame_equal(
+        partitions.load(list(range(8))).sort_values(['domain', 'full_link']).reset_index(drop=True),
+        links.sort_values(['domain', 'full_link']).reset_index(drop=True)
+    )
+    partitions.remove()
+    assert not os.path.exists(os.path.join(tmp_path, 'partitions'))
+
+
+def test_partition_batches():
+    sizes = [10, 0, 20, 50, 5, 5]
+    assert list(partition_batches(sizes, float('inf'))) == [[0, 1, 2, 3, 4, 5]]
+    assert list(partition_batches(sizes, 30 * DIFF_MEMORY_OVERHEAD)) == [[0, 1, 2], [3], [4, 5]]
+    # a partition over the budget is still diffed, on its own
+    assert list(partition_batches(sizes, 1)) == [[0], [1], [2], [3], [4], [5]]
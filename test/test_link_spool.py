@@ -0,0 +1,56 @@
+import json
+import os
+
+from link_spool import LinkSpool
+from page_links import PageLinks
+
+
+def page(url, hrefs):
+    return PageLinks.from_records(url, 'domain', 'label', [
+        {'link': href, 'full_link': href, 'link_class_name': '', 'link_text': ''} for href in hrefs
+    ])
+
+
+def test_link_spool(tmp_path):
+    spool = LinkSpool(os.path.join(tmp_path, 'spool'))
+    spool.append('b.com', 2, 'https://b.com', page('https://b.com', ['/b']))
+    spool.append('a.com', 1, 'https://a.com/2', page('https://a.com/2', ['/2', '/2']))
+    spool.append('a.com', 0, 'https://a.com/1', page('https://a.com/1', ['/1']))
+    spool.append('c.com', 3, 'https://c.com', page('https://c.com', []))
+
+    assert spool.domains() == ['a.com', 'b.com', 'c.com']
+    assert spool.link_count == 4
+    assert spool.urls['a.com'] == ['https://a.com/2', 'https://a.com/1']
+    # pages come back in position order, without duplicate links
+    assert list(spool.load('a.com')['link']) == ['/1', '/2']
+    # a domain whose pages had no links, or that was never scraped, has none
+    assert spool.load('c.com') is None
+    assert spool.load('d.com') is None
+
+    spool.remove()
+    assert not os.path.exists(spool.directory)
+
+
+def test_link_spool_journal(tmp_path):
+    directory = os.path.join(tmp_path, 'spool')
+    spool = LinkSpool(directory)
+    spool.append('a.com', 0, 'https://a.com/1', page('https://a.com/1', ['/1']))
+    spool.append_failure('b.com', 1, 'https://b.com', 'URL navigation')
+    # a page whose links were spooled, but that was interrupted before it was journaled
+    with open(spool._filename('a.com'), 'a') as fp:
+        fp.write(json.dumps({'position': 2, 'links': page('https://a.com/2', ['/stale']).to_columns()}) + '\n')
+    with open(os.path.join(directory, 'journal.jsonl'), 'a') as fp:
+        fp.write('{"position": 2, "url"')
+
+    # reopening the spool picks up the finished pages only
+    spool = LinkSpool(directory)
+    assert sorted(spool.completed) == [0, 1]
+    assert spool.failures() == [{'failure_reason': 'URL navigation', 'url': 'https://b.com'}]
+    assert spool.urls == {'a.com': ['https://a.com/1']}
+    assert spool.link_count == 1
+    assert list(spool.load('a.com')['link']) == ['/1']
+
+    # scraped again after the restart, the page replaces its stale links
+    spool.append('a.com', 2, 'https://a.com/2', page('https://a.com/2', ['/2']))
+    assert list(spool.load('a.com')['link']) == ['/1', '/2']
+    spool.remove()
@@ -0,0 +1,55 @@
+import os
+
+import pandas as pd
+import pytest
+
+import constants
+import run
+from link_store import LinkStore
+
+
+@pytest.fixture(scope="function")
+def store(tmp_path):
+    store = LinkStore(os.path.join(tmp_path, 'links.db'))
+    yield store
+    store.close()
+
+
+def test_link_store_load_empty(store):
+    links = store.load(['website.com'])
+    assert len(links) == 0
+    assert list(links.columns) == constants.ALL_LINKS_FILE_HEADER
+
+
+def test_link_store_round_trip(store, find_new_links_data):
+    _, all_links, _, _ = find_new_links_data
+    store.save(['website.com'], all_links)
+    pd.testing.assert_frame_equal(store.load(['website.com']), all_links)
+    # other pages are not read
+    assert len(store.load(['other.com'])) == 0
+
+
+def test_link_store_reconcile(store, find_new_links_data):
+    cur_links, all_links, new_links_expected, all_links_expected = find_new_links_data
+    store.save(['website.com'], all_links)
+
+    new_links, all_links = run.find_new_links(cur_links, store.load(['website.com']))
+    store.save(['website.com'], all_links)
+    pd.testing.assert_frame_equal(new_links, new_links_expected)
+    pd.testing.assert_frame_equal(store.load(['website.com']), all_links_expected)
+
+    # links missing from the page are marked removed, and come back if they reappear
+    store.save(['website.com'], all_links_expected.iloc[:1])
+    assert list(store.load(['website.com'])['link']) == ['/path']
+    store.save(['website.com'], all_links_expected)
+    pd.testing.assert_frame_equal(store.load(['website.com']), all_links_expected)
+
+
+def test_link_store_csv(store, tmp_path, find_new_links_data):
+    _, _, _, all_links_expected = find_new_links_data
+    csv_in = os.path.join(tmp_path, 'all_links_in.csv')
+    csv_out = os.path.join(tmp_path, 'all_links_out.csv')
+    all_links_expected.to_csv(csv_in, index=False)
+    store.import_csv(csv_in)
+    store.export_csv(csv_out)
+    pd.testing.assert_frame_equal(pd.read_csv(csv_out), all_links_expected)
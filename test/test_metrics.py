@@ -0,0 +1,64 @@
+import json
+import os
+
+from metrics import RunMetrics, escape_label
+
+
+def test_run_metrics():
+    metrics = RunMetrics()
+    metrics.page('https://a.com/1', domain='a.com', failed=False)
+    metrics.page('https://a.com/2', domain='a.com', failed=True)
+    metrics.page('https://b.com', domain='b.com', failed=False)
+    metrics.add('fetch_seconds', 1.0, 'https://a.com/1')
+    metrics.add('fetch_seconds', 2.0, 'https://a.com/2')
+    metrics.add('fetch_seconds', 0.5, 'https://b.com')
+    metrics.add('anchors', 10, 'https://a.com/1')
+    metrics.add('anchors', 5, 'https://a.com/1')
+    with metrics.timer('diff'):
+        pass
+
+    assert metrics.pages['https://a.com/1']['anchors'] == 15
+    assert metrics.run['diff_seconds'] >= 0
+    summary = metrics.summary()
+    assert summary['totals']['fetch_seconds'] == 3.5
+    assert summary['totals']['pages'] == 3
+    assert summary['totals']['failed_pages'] == 1
+    # slowest domains come first
+    assert list(summary['domains']) == ['a.com', 'b.com']
+    assert summary['domains']['a.com']['total_seconds'] == 3.0
+    assert summary['domains']['a.com']['pages'] == 2
+
+
+def test_run_metrics_disabled():
+    metrics = RunMetrics(enabled=False)
+    metrics.page('https://a.com', domain='a.com')
+    with metrics.timer('fetch', 'https://a.com'):
+        pass
+    assert metrics.page_records() == []
+    assert metrics.run == {}
+
+
+def test_run_metrics_write(tmp_path):
+    metrics = RunMetrics()
+    metrics.page('https://a.com', domain='a.com', failed=False)
+    metrics.add('fetch_seconds', 1.5, 'https://a.com')
+    metrics.add('run_seconds', 2.0)
+    prefix = os.path.join(tmp_path, 'metrics')
+    metrics.write(prefix)
+    with open(f'{prefix}.json', 'r') as fp:
+        assert json.load(fp)['run'] == {'run_seconds': 2.0}
+    with open(f'{prefix}.csv', 'r') as fp:
+        assert fp.readline().strip() == 'url,domain,failed,fetch_seconds'
+
+    filename = os.path.join(tmp_path, 'link_scraper.prom')
+    metrics.write_prometheus(filename)
+    with open(filename, 'r') as fp:
+        lines = fp.read().splitlines()
+    assert 'link_scraper_run_stage_seconds{stage="run"} 2.0' in lines
+    assert 'link_scraper_page_stage_seconds{stage="fetch"} 1.5' in lines
+    assert 'link_scraper_domain_seconds{domain="a.com"} 1.5' in lines
+    assert not os.path.exists(f'{filename}.tmp')
+
+
+def test_escape_label():
+    assert escape_label('a"b\\c\nd') == 'a\\"b\\\\c\\nd'
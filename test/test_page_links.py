@@ -0,0 +1,54 @@
+import pandas as pd
+
+from page_links import PageLinks
+
+
+RECORDS = [
+    {
+        'link': '/path',
+        'url': 'https://www.website.com',
+        'domain': 'www.website.com',
+        'label': 'label',
+        'full_link': 'https://www.website.com/path',
+        'link_class_name': '',
+        'link_text': 'path',
+    },
+    {
+        'link': '#id',
+        'url': 'https://www.website.com',
+        'domain': 'www.website.com',
+        'label': 'label',
+        'full_link': 'https://www.website.com#id',
+        'link_class_name': 'class',
+        'link_text': 'path',
+    },
+]
+
+
+def make_page_links():
+    return PageLinks.from_records('https://www.website.com', 'www.website.com', 'label', RECORDS)
+
+
+def test_page_links_records():
+    page_links = make_page_links()
+    assert len(page_links) == 2
+    assert page_links.to_records() == RECORDS
+    # record keys keep their historical order
+    assert list(page_links.to_records()[0]) == list(RECORDS[0])
+
+
+def test_page_links_frame():
+    pd.testing.assert_frame_equal(make_page_links().to_frame(), pd.DataFrame(RECORDS))
+    assert list(PageLinks('url', 'domain', 'label').to_frame().columns) == list(RECORDS[0])
+
+
+def test_page_links_columns():
+    page_links = make_page_links()
+    assert PageLinks.from_columns(page_links.to_columns()).to_records() == RECORDS
+
+
+def test_page_links_interned():
+    page_links = make_page_links()
+    text = ''.join(['pa', 'th'])
+    page_links.append('/other', '/other', '', text)
+    assert page_links.link_text[-1] is page_links.link_text[0]
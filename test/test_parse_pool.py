@@ -0,0 +1,49 @@
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from parse_pool import ParsePool
+
+
+def test_parse_pool():
+    pool = ParsePool(2)
+    try:
+        futures = [pool.submit(pow, i, 2) for i in range(8)]
+        assert [future.result() for future in futures] == [i ** 2 for i in range(8)]
+    finally:
+        pool.close()
+
+
+def test_parse_pool_back_pressure():
+    pool = ParsePool(1, max_pending=1)
+    try:
+        # warm up the worker, so its start isn't counted below
+        pool.submit(pow, 2, 2).result()
+        started = time.perf_counter()
+        first = pool.submit(time.sleep, 0.3)
+        # blocks until the first sleep is done
+        second = pool.submit(pow, 3, 2)
+        assert first.done()
+        assert time.perf_counter() - started >= 0.25
+        assert second.result() == 9
+    finally:
+        pool.close()
+
+
+def test_parse_pool_workers():
+    with pytest.raises(RuntimeError):
+        ParsePool(0)
+
+
+def test_parse_pool_worker_dies():
+    pool = ParsePool(1)
+    try:
+        # the item whose worker died fails, and the pool is restarted for the items after it
+        with pytest.raises(BrokenProcessPool):
+            pool.submit(os._exit, 1).result()
+        assert pool.submit(pow, 3, 2).result() == 9
+        assert pool.restarted == 1
+    finally:
+        pool.close()
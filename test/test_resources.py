@@ -0,0 +1,64 @@
+import json
+import os
+
+import constants
+import resources
+
+
+class FakeChrome:
+    def __init__(self, log_entries=None):
+        self.commands = list()
+        self.log_entries = log_entries or list()
+
+    def execute_cdp_cmd(self, command, params):
+        self.commands.append((command, params))
+
+    def get_log(self, log_type):
+        entries, self.log_entries = self.log_entries, list()
+        return entries
+
+
+def log_entry(method, **params):
+    return {'message': json.dumps({'message': {'method': method, 'params': params}})}
+
+
+def test_blocked_url_patterns():
+    assert resources.blocked_url_patterns(constants.ResourcePolicies.NONE) == []
+    trackers = resources.blocked_url_patterns(constants.ResourcePolicies.TRACKERS, ['*tracker.com/*'])
+    assert trackers == ['*tracker.com/*']
+    media = resources.blocked_url_patterns(constants.ResourcePolicies.MEDIA, ['*tracker.com/*'])
+    assert media[0] == '*tracker.com/*'
+    assert {'*.png', '*.png?*', '*.mp4', '*.woff2'} <= set(media)
+    assert '*.css' not in media
+    strict = resources.blocked_url_patterns(constants.ResourcePolicies.STRICT)
+    # each policy blocks everything the one before it does
+    assert set(resources.blocked_url_patterns(constants.ResourcePolicies.MEDIA)) < set(strict)
+    assert '*.css' in strict
+
+
+def test_apply_resource_policy():
+    browser = FakeChrome()
+    resources.apply_resource_policy(browser, constants.ResourcePolicies.TRACKERS, ['*tracker.com/*'])
+    assert browser.commands[-1] == ('Network.setBlockedURLs', {'urls': ['*tracker.com/*']})
+    # browsers that can't block requests are left alone
+    resources.apply_resource_policy(object(), constants.ResourcePolicies.MEDIA)
+
+
+def test_count_blocked_requests():
+    browser = FakeChrome([
+        log_entry('Network.loadingFailed', blockedReason='inspector'),
+        log_entry('Network.loadingFailed', errorText='net::ERR_FAILED'),
+        log_entry('Network.requestWillBeSent'),
+        log_entry('Network.loadingFailed', blockedReason='inspector'),
+    ])
+    assert resources.count_blocked_requests(browser) == 2
+    # the log is drained
+    assert resources.count_blocked_requests(browser) == 0
+    assert resources.count_blocked_requests(object()) == 0
+
+
+def test_load_tracker_patterns(tmp_path):
+    filename = os.path.join(tmp_path, 'trackers.txt')
+    with open(filename, 'w') as fp:
+        fp.write('# ad networks\n*ads.example.com/*\n\n  *pixel.example.com/*  \n')
+    assert resources.load_tracker_patterns(filename) == ['*ads.example.com/*', '*pixel.example.com/*']
@@ -1,4 +1,9 @@
+import argparse
 import os
+import subprocess
+import sys
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
 from random import random
 import pytest
 
@@ -7,6 +12,19 @@ import pandas as pd
 
 import run
 import constants
+from host_health import CIRCUIT_OPEN_REASON, NEGATIVE_CACHE_REASON, HostHealth
+from link_partitions import LinkPartitions
+from link_spool import LinkSpool
+from metrics import RunMetrics
+from page_links import PageLinks
+from parse_pool import ParsePool
+from scheduler import DomainScheduler
+from validator_cache import ValidatorCache
+
+def _as_records(result):
+    # parsed links are compact PageLinks; compare them as plain link records
+    return {**result, 'links': result['links'].to_records()}
+
 
 def _test_frame_equal(fn, expected):
     try:
@@ -131,7 +149,7 @@ def test_process_page(page_xml_tree, processed_page_records):
     # with open('test/fixtures/processed_page.json', 'w') as fp:
     #     import json
     #     json.dump(result, fp, indent=4)
-    assert result == processed_page_records
+    assert _as_records(result) == processed_page_records
 
 
 def test_handle_failures(failures):
@@ -171,3 +189,623 @@ def test_find_new_links_empty_both():
     assert all(new_links.columns == constants.NEW_LINKS_FILE_HEADER)
     assert len(all_links) == 0
     assert all(all_links.columns == constants.ALL_LINKS_FILE_HEADER)
+
+
+def test_find_new_links_removed(find_new_links_data):
+    cur_links, all_links, _, _ = find_new_links_data
+    # drop the "/other" link from the current page, so it is reported as removed
+    cur_links = cur_links[cur_links['link'] != '/other'].reset_index(drop=True)
+    new_links, all_links = run.find_new_links(cur_links, all_links)
+    removed = new_links[new_links['defined_change'] == 'removed link']
+    assert list(removed['link']) == ['/other']
+    assert '/other' not in set(all_links['link'])
+    assert list(new_links['defined_change']) == ['text change', 'removed link', 'new link', 'new link']
+
+
+def test_make_element_ids():
+    df = pd.DataFrame({
+        'domain': ['a.com', 'a.com', 'b.com', 'a.com'],
+        'full_link': ['https://a.com/x', 'https://a.com/x', 'https://a.com/x', 'https://a.com/y'],
+    })
+    run.make_element_ids(df)
+    assert list(df['id']) == [
+        'a.com_https://a.com/x0',
+        'a.com_https://a.com/x1',
+        'b.com_https://a.com/x0',
+        'a.com_https://a.com/y0',
+    ]
+
+
+def test_validate_input_url_data_optional_fields(input_urls):
+    input_urls['render_mode'] = 'static'
+    run.validate_input_url_data(input_urls)
+    input_urls['unknown'] = 'value'
+    with pytest.raises(RuntimeError):
+        run.validate_input_url_data(input_urls)
+
+
+def test_clean_input_url_data_render_mode():
+    df = pd.DataFrame({'include_nav_links': [0, 1]})
+    run.clean_input_url_data(df)
+    assert list(df['render_mode']) == ['browser', 'browser']
+
+    df = pd.DataFrame({'include_nav_links': [0, 1, 0], 'render_mode': ['Static', None, 'auto']})
+    run.clean_input_url_data(df)
+    assert list(df['render_mode']) == ['static', 'browser', 'auto']
+
+    df = pd.DataFrame({'include_nav_links': [0], 'render_mode': ['bogus']})
+    with pytest.raises(RuntimeError):
+        run.clean_input_url_data(df)
+
+
+def test_process_static_item(page_content, processed_page_records, fake_response, fake_session):
+    row = pd.Series({
+        'url': 'https://www.website.com',
+        'label': 'label',
+        'domain': 'www.website.com',
+        'include_nav_links': False
+    })
+    result = run.process_static_item(row, fake_session(fake_response(200, page_content)))
+    assert _as_records(result) == processed_page_records
+
+
+@pytest.mark.parametrize('content_type,encoding', [
+    ('text/html', 'utf-8'),
+    ('text/html; charset=iso-8859-1', 'iso-8859-1'),
+])
+def test_process_static_item_charset(content_type, encoding, fake_response, fake_session):
+    row = pd.Series({
+        'url': 'https://www.website.com',
+        'label': 'label',
+        'domain': 'www.website.com',
+        'include_nav_links': False
+    })
+    meta = '<meta charset="utf-8">' if encoding == 'utf-8' else ''
+    page = f'<html><head>{meta}</head><body><a href="/cafe">Café Ünïcode</a></body></html>'
+    # requests' own decoding: the header's charset, or ISO-8859-1 without one
+    response = fake_response(200, page.encode(encoding).decode('iso-8859-1'))
+    response.content = page.encode(encoding)
+    response.headers = {'Content-Type': content_type}
+    result = run.process_static_item(row, fake_session(response))
+    assert [link['link_text'] for link in result['links'].to_records()] == ['café ünïcode']
+
+def test_process_static_item_metrics(page_content, processed_page_records, fake_response, fake_session):
+    row = pd.Series({
+        'url': 'https://www.website.com',
+        'label': 'label',
+        'domain': 'www.website.com',
+        'include_nav_links': False
+    })
+    metrics = RunMetrics()
+    run.process_static_item(row, fake_session(fake_response(200, page_content)), metrics=metrics)
+    page = metrics.pages['https://www.website.com']
+    assert page['bytes_fetched'] == len(page_content.encode())
+    assert page['anchors'] == len(processed_page_records['links'])
+    assert page['fetch_seconds'] >= 0
+    assert page['parse_seconds'] >= 0
+
+
+def test_parse_page_pool(page_content, processed_page_records):
+    row = pd.Series({
+        'url': 'https://www.website.com',
+        'label': 'label',
+        'domain': 'www.website.com',
+        'include_nav_links': False,
+        'render_mode': 'static'
+    })
+    metrics = RunMetrics()
+    parsed = list()
+    parser = ParsePool(1)
+    try:
+        future = run.parse_page(row, page_content, metrics, parser, parsed.append)
+        result = run.resolve_result(row, future)
+    finally:
+        parser.close()
+    # parsed in a worker process just as on the fetch thread, with its metrics handed back
+    assert _as_records(result) == processed_page_records
+    assert parsed == [result]
+    page = metrics.pages['https://www.website.com']
+    assert page['anchors'] == len(processed_page_records['links'])
+    assert page['parse_seconds'] >= 0
+    assert page['parse_queue_seconds'] >= 0
+
+
+def test_parse_page_pool_broken(page_content, processed_page_records):
+    class BrokenParsePool:
+        def submit(self, fn, *args):
+            raise BrokenProcessPool('A child process terminated abruptly')
+
+    row = pd.Series({
+        'url': 'https://www.website.com',
+        'label': 'label',
+        'domain': 'www.website.com',
+        'include_nav_links': False
+    })
+    parsed = list()
+    # without a working pool, the page is parsed on the fetch thread rather than failing the run
+    result = run.parse_page(row, page_content, RunMetrics(), BrokenParsePool(), parsed.append)
+    assert _as_records(result) == processed_page_records
+    assert parsed == [result]
+
+def test_resolve_result_error():
+    row = pd.Series({'url': 'https://www.website.com'})
+    future = Future()
+    future.set_exception(ValueError('unparseable'))
+    assert run.resolve_result(row, future) == {
+        'failed': True,
+        'failure_reason': 'HTML parse failure',
+        'url': 'https://www.website.com',
+        'links': []
+    }
+    result = {'failed': False, 'failure_reason': '', 'url': 'https://www.website.com', 'links': []}
+    assert run.resolve_result(row, result) is result
+
+
+def test_process_static_item_error(fake_response, fake_session):
+    row = pd.Series({'url': 'https://www.website.com', 'label': 'label', 'domain': 'www.website.com'})
+    result = run.process_static_item(row, fake_session(fake_response(404)))
+    assert result['failed']
+    assert result['failure_reason'] == 'URL navigation'
+
+
+@pytest.mark.parametrize(['render_mode', 'result', 'expected'], [
+    ('browser', None, True),
+    ('static', {'failed': False, 'failure_reason': '', 'links': []}, False),
+    ('auto', {'failed': False, 'failure_reason': '', 'links': [{}]}, False),
+    ('auto', {'failed': False, 'failure_reason': '', 'links': []}, True),
+    ('auto', {'failed': True, 'failure_reason': 'URL navigation', 'links': []}, False),
+    ('auto', {'failed': True, 'failure_reason': CIRCUIT_OPEN_REASON, 'links': []}, False),
+    ('auto', {'failed': True, 'failure_reason': NEGATIVE_CACHE_REASON, 'links': []}, False),
+])
+def test_needs_browser(render_mode, result, expected):
+    assert run.needs_browser(pd.Series({'render_mode': render_mode}), result) == expected
+
+
+def test_clean_input_url_data_wait_strategy():
+    df = pd.DataFrame({'include_nav_links': [0, 1], 'wait_strategy': ['Ready', None]})
+    run.clean_input_url_data(df, defaults={'wait_strategy': 'sleep'})
+    assert list(df['wait_strategy']) == ['ready', 'sleep']
+
+    df = pd.DataFrame({'include_nav_links': [0], 'wait_strategy': ['bogus']})
+    with pytest.raises(RuntimeError):
+        run.clean_input_url_data(df)
+
+
+@pytest.mark.parametrize(['status_check', 'status', 'head_status', 'expected', 'calls'], [
+    ('get', 200, None, False, ['get']),
+    ('get', 404, None, True, ['get']),
+    ('head', 200, 200, False, ['head']),
+    ('head', 200, 503, True, ['head']),
+    ('head', 404, 405, True, ['head', 'get']),
+    ('browser', 404, None, False, []),
+])
+def test_prefetch_failed(status_check, status, head_status, expected, calls, fake_response, fake_session):
+    head_response = fake_response(head_status) if head_status else None
+    session = fake_session(fake_response(status), head_response)
+    assert run.prefetch_failed('https://www.website.com', status_check, session) == expected
+    assert session.calls == calls
+
+
+@pytest.mark.parametrize(['status', 'expected'], [(200, False), (404, True), (0, True), (None, False)])
+def test_navigation_failed(status, expected, fake_browser):
+    assert run.navigation_failed(fake_browser(navigation_status=status)) == expected
+
+
+def test_process_item_browser_status(page_content, processed_page_records, fake_response, fake_session, fake_browser):
+    row = pd.Series({
+        'url': 'https://www.website.com',
+        'label': 'label',
+        'domain': 'www.website.com',
+        'include_nav_links': False,
+        'wait_strategy': 'ready',
+    })
+    session = fake_session(fake_response(200))
+    browser = fake_browser(page_content)
+    result = run.process_item(row, browser, status_check='browser', session=session)
+    assert _as_records(result) == processed_page_records
+    # the url is only fetched once, by the browser
+    assert session.calls == []
+    assert browser.visited == ['https://www.website.com']
+
+    result = run.process_item(row, fake_browser(page_content, 404), status_check='browser', session=session)
+    assert result['failure_reason'] == 'URL navigation'
+
+
+def test_process_item_wait_metrics(page_content, monkeypatch, fake_browser):
+    row = pd.Series({
+        'url': 'https://www.website.com',
+        'label': 'label',
+        'domain': 'www.website.com',
+        'include_nav_links': False,
+        'wait_strategy': 'ready',
+    })
+    monkeypatch.setattr(run.waits, 'wait_for_page', lambda *args, **kwargs: (5.0, True))
+    metrics = RunMetrics()
+    run.process_item(row, fake_browser(page_content), status_check='browser', metrics=metrics)
+    page = metrics.pages['https://www.website.com']
+    # the wait isn't also counted in the render, or the domain's total would count it twice
+    assert page['wait_seconds'] == 5.0
+    assert page['render_seconds'] < 5.0
+
+
+@pytest.mark.parametrize('status_check,calls', [('get', ['get']), ('head', ['head']), ('browser', [])])
+def test_process_item_cached_status_check(page_content, status_check, calls, fake_response, fake_session, fake_browser):
+    row = pd.Series({
+        'url': 'https://www.website.com',
+        'label': 'label',
+        'domain': 'www.website.com',
+        'include_nav_links': False,
+        'wait_strategy': 'ready',
+    })
+    response = fake_response(200, page_content)
+    session = fake_session(response)
+    cache = ValidatorCache()
+    run.process_item(row, fake_browser(page_content), status_check=status_check, session=session, cache=cache)
+    # only the GET status check is made conditional; the others send no extra request for the cache
+    assert session.calls == calls
+    assert len(cache.entries) == (1 if status_check == 'get' else 0)
+
+
+def test_process_static_item_cached(page_content, processed_page_records, fake_response, fake_session):
+    row = pd.Series({
+        'url': 'https://www.website.com',
+        'label': 'label',
+        'domain': 'www.website.com',
+        'include_nav_links': False,
+        'render_mode': 'static',
+    })
+    response = fake_response(200, page_content)
+    response.content = page_content.encode()
+    response.headers = {}
+    cache = ValidatorCache()
+    assert _as_records(run.process_static_item(row, fake_session(response), cache)) == processed_page_records
+    # the unchanged page is served from the cache
+    assert _as_records(run.process_static_item(row, fake_session(response), cache)) == processed_page_records
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_process_static_item_cached_changed_row(page_content, processed_page_records, fake_response, fake_session):
+    row = pd.Series({
+        'url': 'https://www.website.com',
+        'label': 'label',
+        'domain': 'www.website.com',
+        'include_nav_links': True,
+        'render_mode': 'static',
+    })
+    response = fake_response(200, page_content)
+    response.headers = {'ETag': '"abc"'}
+    cache = ValidatorCache()
+    run.process_static_item(row, fake_session(response), cache)
+
+    class ConditionalSession(fake_session):
+        # answers 304 to a conditional request, like a server whose page is unchanged
+        def get(self, url, headers=None, **kwargs):
+            self.calls.append(headers)
+            return fake_response(304) if headers else self.response
+
+    # the row's options changed, so the page is fetched in full and parsed again
+    changed = row.copy()
+    changed['include_nav_links'] = False
+    session = ConditionalSession(response)
+    result = run.process_static_item(changed, session, cache)
+    assert session.calls == [{}]
+    assert _as_records(result) == processed_page_records
+    # and the new links are cached for the changed row
+    assert cache.request_headers(changed) == {'If-None-Match': '"abc"'}
+
+
+@pytest.mark.parametrize(['href', 'base_href', 'expected'], [
+    ('/path', None, 'https://www.website.com/path'),
+    (' other ', None, 'https://www.website.com/dir/other'),
+    ('', None, 'https://www.website.com/dir/page'),
+    ('other', '/base/', 'https://www.website.com/base/other'),
+    ('other', 'https://cdn.website.com/', 'https://cdn.website.com/other'),
+])
+def test_make_link_absolute(href, base_href, expected):
+    assert run.make_link_absolute(href, 'https://www.website.com/dir/page', base_href) == expected
+
+
+def test_parse_page_links_base_href():
+    page_xml = lxml.html.fromstring(
+        '<html><head><base href="/base/"></head><body><a href="path">Path</a></body></html>'
+    )
+    row = pd.Series({'url': 'https://www.website.com', 'label': 'label', 'domain': 'www.website.com'})
+    links = run.parse_page_links(row, page_xml)['links'].to_records()
+    assert links[0]['link'] == 'path'
+    assert links[0]['full_link'] == 'https://www.website.com/base/path'
+    # the document itself is left untouched
+    assert page_xml.xpath('//a/@href') == ['path']
+
+
+def test_handle_links_parquet(tmp_path, monkeypatch, find_new_links_data):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('data')
+    cur_links, all_links, new_links_expected, all_links_expected = find_new_links_data
+    cur_links.loc[3, 'domain'] = 'other.website.com'
+    all_links_expected.loc[3, 'domain'] = 'other.website.com'
+    run.handle_links(cur_links, all_links, output_format='parquet')
+
+    run_dir = os.path.join('data', 'all_links', f'run={run.RUN_TIMESTAMP}')
+    assert sorted(os.listdir(run_dir)) == ['domain=other.website.com', 'domain=www.website.com']
+    # rows come back grouped by domain partition, so compare them in a stable order
+    loaded = run.load_csv(run_dir, columns=constants.ALL_LINKS_FILE_HEADER)
+    assert list(loaded.columns) == constants.ALL_LINKS_FILE_HEADER
+    pd.testing.assert_frame_equal(
+        loaded.sort_values('link').reset_index(drop=True),
+        all_links_expected.sort_values('link').reset_index(drop=True)
+    )
+
+
+def test_handle_failures_parquet_empty(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('data')
+    run.handle_failures([], output_format='parquet')
+    failed = run.load_csv(os.path.join('data', 'failed', f'run={run.RUN_TIMESTAMP}'), columns=['failure_reason', 'url'])
+    assert len(failed) == 0
+
+
+@pytest.mark.parametrize('memory_budget', [None, 1])
+def test_handle_spooled_links(tmp_path, monkeypatch, find_new_links_data, memory_budget):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('data')
+    cur_links, all_links, new_links_expected, all_links_expected = find_new_links_data
+    # a previously seen domain that has no links in this run
+    gone = all_links.iloc[:1].assign(domain='gone.website.com')
+    all_links = pd.concat([all_links, gone], ignore_index=True)
+
+    spool = LinkSpool(os.path.join('data', 'spool'))
+    spool.append(
+        'www.website.com',
+        0,
+        'website.com',
+        PageLinks.from_records('website.com', 'www.website.com', 'label', cur_links.to_dict(orient='records'))
+    )
+    writer = run.OutputWriter()
+    if memory_budget is None:
+        run.handle_spooled_links(spool, all_links, writer)
+    else:
+        # out of core, with every partition diffed on its own
+        history = LinkPartitions(os.path.join('data', 'partitions'), partitions=4)
+        history.append(all_links)
+        run.handle_spooled_links(spool, None, writer, history=history, memory_budget=memory_budget)
+    writer.close()
+
+    new_links = pd.read_csv('data/new_links_%s.csv' % run.RUN_TIMESTAMP)
+    removed = gone.assign(defined_change='removed link')
+    expected = pd.concat([removed, new_links_expected], ignore_index=True)
+    # partitions are diffed in partition order rather than domain order
+    new_links = new_links.sort_values('domain', kind='stable').reset_index(drop=True)
+    pd.testing.assert_frame_equal(new_links, expected)
+    _test_frame_equal('data/all_links_%s.csv' % run.RUN_TIMESTAMP, all_links_expected)
+
+
+def test_output_writer_empty(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('data')
+    writer = run.OutputWriter()
+    writer.append('failed', pd.DataFrame([], columns=['failure_reason', 'url']))
+    writer.close()
+    _test_frame_equal('data/failed_%s.csv' % run.RUN_TIMESTAMP, pd.DataFrame([], columns=['failure_reason', 'url']))
+
+
+def test_output_writer_parquet_order(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('data')
+    # a repeated href, whose ids depend on the order its rows are read back in
+    links = pd.DataFrame([{
+        'url': 'https://www.website.com',
+        'label': 'label',
+        'domain': 'www.website.com',
+        'link': '/same',
+        'full_link': 'https://www.website.com/same',
+        'link_text': f'text {i}',
+        'link_class_name': '',
+    } for i in range(8)], columns=constants.ALL_LINKS_FILE_HEADER)
+    writer = run.OutputWriter(constants.OutputFormats.PARQUET, chunk_rows=2)
+    for i in range(0, 8, 2):
+        writer.append('all_links', links.iloc[i:i + 2])
+    writer.close()
+    path = run.output_path('all_links', constants.OutputFormats.PARQUET)
+    reloaded = run.load_parquet(path, columns=constants.ALL_LINKS_FILE_HEADER)
+    assert list(reloaded['link_text']) == list(links['link_text'])
+    # so diffing the same links again finds no changes
+    new_links, _ = run.find_new_links(links.copy(), reloaded)
+    assert len(new_links) == 0
+
+def test_shard_of():
+    domains = pd.Series([f'www.site{i}.com' for i in range(100)] + [None])
+    shards = [run.in_shard(domains, shard, 4) for shard in range(4)]
+    # every domain is in exactly one shard, and always the same one
+    assert (sum(mask.astype(int) for mask in shards) == 1).all()
+    assert run.shard_of('www.site0.com', 4) == run.shard_of('www.site0.com', 4)
+    assert run.in_shard(domains, run.shard_of('', 4), 4).iloc[-1]
+
+
+@pytest.mark.parametrize(['value', 'expected'], [('0/1', (0, 1)), ('3/8', (3, 8))])
+def test_parse_shard(value, expected):
+    assert run.parse_shard(value) == expected
+
+
+@pytest.mark.parametrize('value', ['3', '8/8', '-1/8', 'a/b', '1/2/3'])
+def test_parse_shard_invalid(value):
+    with pytest.raises(argparse.ArgumentTypeError):
+        run.parse_shard(value)
+
+
+def test_load_csv_keep(tmp_path, monkeypatch, find_new_links_data):
+    _, all_links, _, _ = find_new_links_data
+    filename = os.path.join(tmp_path, 'all_links.csv')
+    all_links.to_csv(filename, index=False)
+    monkeypatch.setattr(run, 'CSV_CHUNK_ROWS', 2)
+    links = run.load_csv(filename, keep=lambda df: df['link_text'] != all_links['link_text'].iloc[0])
+    expected = all_links[all_links['link_text'] != all_links['link_text'].iloc[0]].reset_index(drop=True)
+    pd.testing.assert_frame_equal(links, expected)
+
+
+def test_load_csv_keep_header_only(tmp_path):
+    filename = os.path.join(tmp_path, 'all_links.csv')
+    pd.DataFrame([], columns=constants.ALL_LINKS_FILE_HEADER).to_csv(filename, index=False)
+    links = run.load_csv(filename, keep=lambda df: df['domain'] == 'www.website.com')
+    assert len(links) == 0
+    assert list(links.columns) == constants.ALL_LINKS_FILE_HEADER
+
+
+def test_throttled():
+    scheduler = DomainScheduler(max_per_domain=1)
+    metrics = RunMetrics()
+    row = pd.Series({'url': 'https://www.website.com', 'domain': 'www.website.com'})
+
+    def fetch(row, value):
+        # the domain's only slot is held while fetching
+        assert scheduler._active == {'www.website.com': 1}
+        return {'value': value}
+
+    assert run.throttled(fetch, scheduler, metrics)(row, 1) == {'value': 1}
+    assert scheduler._active == {}
+    assert metrics.pages['https://www.website.com']['throttle_seconds'] >= 0
+
+
+def test_throttled_failing_host():
+    hosts = HostHealth(failure_threshold=2)
+    calls = list()
+
+    def fetch(row):
+        calls.append(row['url'])
+        return {'failed': True, 'failure_reason': 'URL navigation', 'url': row['url'], 'links': []}
+
+    fn = run.throttled(fetch, DomainScheduler(max_per_domain=1), hosts=hosts)
+    rows = [pd.Series({'url': f'https://dead.com/{i}', 'domain': 'dead.com'}) for i in range(4)]
+    results = [fn(row) for row in rows]
+    # the circuit opens after two failures, and the remaining rows are skipped but still reported
+    assert calls == ['https://dead.com/0', 'https://dead.com/1']
+    assert [result['failure_reason'] for result in results] == ['URL navigation'] * 2 + [CIRCUIT_OPEN_REASON] * 2
+    assert [result['url'] for result in results] == [row['url'] for row in rows]
+
+
+def test_process_item_resource_policy(page_content, fake_browser):
+    row = pd.Series({
+        'url': 'https://www.website.com',
+        'label': 'label',
+        'domain': 'www.website.com',
+        'include_nav_links': False,
+        'wait_strategy': 'ready',
+        'resource_policy': 'trackers',
+    })
+    browser = fake_browser(page_content, blocked_requests=3)
+    metrics = RunMetrics()
+    run.process_item(row, browser, status_check='browser', metrics=metrics, tracker_patterns=['*tracker.com/*'])
+    assert browser.blocked_urls == ['*tracker.com/*']
+    assert metrics.pages['https://www.website.com']['blocked_requests'] == 3
+
+
+def test_main_resume(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('data')
+    input_urls = pd.DataFrame({
+        'url': ['https://www.website.com', 'https://www.other.com'],
+        'label': ['website', 'other'],
+        'include_nav_links': [0, 0],
+        'render_mode': ['static', 'browser'],
+    })
+    # the interrupted run finished both pages
+    spool = LinkSpool(run.journal_directory('nightly'))
+    links = [{'link': '/path', 'full_link': 'https://www.website.com/path', 'link_class_name': '', 'link_text': 'text'}]
+    spool.append(
+        'www.website.com',
+        0,
+        'https://www.website.com',
+        PageLinks.from_records('https://www.website.com', 'www.website.com', 'website', links)
+    )
+    spool.append_failure('www.other.com', 1, 'https://www.other.com', 'URL navigation')
+
+    with pytest.raises(RuntimeError):
+        run.main(None, input_urls.copy(), None, run_id='nightly')
+
+    def browser_factory():
+        raise AssertionError('Finished pages are not scraped again')
+
+    def interrupted_diff(spool, all_links, writer, *args):
+        writer.append('all_links', pd.DataFrame({'url': ['https://www.website.com']}))
+        raise KeyboardInterrupt
+
+    # a run interrupted partway through its diff leaves only its journal, not truncated outputs
+    handle_spooled_links = run.handle_spooled_links
+    monkeypatch.setattr(run, 'handle_spooled_links', interrupted_diff)
+    with pytest.raises(KeyboardInterrupt):
+        run.main(browser_factory, input_urls.copy(), None, run_id='nightly', resume=True)
+    assert os.listdir('data') == [os.path.basename(run.journal_directory('nightly'))]
+    monkeypatch.setattr(run, 'handle_spooled_links', handle_spooled_links)
+
+    run.main(browser_factory, input_urls.copy(), None, run_id='nightly', resume=True)
+    all_links = pd.read_csv('data/all_links_%s.csv' % run.RUN_TIMESTAMP)
+    assert list(all_links['full_link']) == ['https://www.website.com/path']
+    failed = pd.read_csv('data/failed_%s.csv' % run.RUN_TIMESTAMP)
+    assert list(failed['url']) == ['https://www.other.com']
+    # the journal is removed once the run completes
+    assert not os.path.exists(run.journal_directory('nightly'))
+
+
+def test_diff_links(tmp_path, monkeypatch, find_new_links_data):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('data')
+    cur_links, all_links, new_links_expected, all_links_expected = find_new_links_data
+    cur_links.to_csv('cur_links.csv', index=False)
+    all_links.to_csv('all_links.csv', index=False)
+    run.diff_links('cur_links.csv', 'all_links.csv')
+    new_links = pd.read_csv('data/new_links_%s.csv' % run.RUN_TIMESTAMP).fillna('')
+    pd.testing.assert_frame_equal(new_links, new_links_expected.fillna(''), check_dtype=False)
+
+    pd.DataFrame({'url': ['website.com']}).to_csv('not_links.csv', index=False)
+    with pytest.raises(RuntimeError):
+        run.diff_links('not_links.csv', 'all_links.csv')
+
+
+@pytest.mark.parametrize('argv,expected', [
+    (['diff', 'cur_links.csv'], True),
+    (['diff', '-h'], True),
+    (['diff'], False),
+    (['./diff', 'all_links.csv'], False),
+    (['input_urls.csv', 'diff'], False),
+])
+def test_is_diff_command(argv, expected):
+    assert run.is_diff_command(argv) == expected
+
+def test_diff_links_out_of_core(tmp_path, monkeypatch, find_new_links_data):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('data')
+    cur_links, all_links, _, _ = find_new_links_data
+    # several domains, some only in one of the files, each diffed in its own batch
+    other = all_links.assign(domain='other.website.com')
+    pd.concat([cur_links, other.iloc[:1]]).to_csv('cur_links.csv', index=False)
+    pd.concat([all_links, other, all_links.assign(domain='gone.website.com')]).to_csv('all_links.csv', index=False)
+    monkeypatch.setattr(run, 'RUN_TIMESTAMP', 'in_memory')
+    run.diff_links('cur_links.csv', 'all_links.csv')
+    monkeypatch.setattr(run, 'RUN_TIMESTAMP', 'out_of_core')
+    monkeypatch.setattr(run, 'CSV_CHUNK_ROWS', 2)
+    run.diff_links('cur_links.csv', 'all_links.csv', memory_budget_mb=1e-6)
+    assert not os.path.exists(run.PARTITIONS_DIRECTORY)
+
+    for prefix in ('new_links', 'all_links'):
+        in_memory = pd.read_csv(f'data/{prefix}_in_memory.csv')
+        out_of_core = pd.read_csv(f'data/{prefix}_out_of_core.csv')
+        assert len(out_of_core) > 0
+        # the same rows, in partition order rather than in file order
+        columns = list(in_memory.columns)
+        pd.testing.assert_frame_equal(
+            out_of_core.sort_values(columns).reset_index(drop=True),
+            in_memory.sort_values(columns).reset_index(drop=True)
+        )
+
+
+def test_import_is_lazy():
+    # run.py -h and offline diffs don't load the scraping libraries
+    heavy = ('pandas', 'requests', 'selenium.webdriver')
+    script = f'import sys, run; print(",".join(m for m in {heavy} if m in sys.modules))'
+    output = subprocess.run(
+        [sys.executable, '-c', script],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    assert output.stdout.strip() == ''
@@ -0,0 +1,75 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from scheduler import DomainScheduler, bounded_map, interleave_by_domain
+
+
+def test_interleave_by_domain():
+    domains = ['a', 'a', 'a', 'b', 'c', 'c']
+    assert interleave_by_domain(domains) == [0, 3, 4, 1, 5, 2]
+    assert interleave_by_domain([]) == []
+
+
+def test_domain_scheduler_concurrency():
+    scheduler = DomainScheduler(max_per_domain=2)
+    active = {'a': 0, 'b': 0}
+    peak = {'a': 0, 'b': 0}
+    lock = threading.Lock()
+
+    def fetch(domain):
+        with scheduler.slot(domain):
+            with lock:
+                active[domain] += 1
+                peak[domain] = max(peak[domain], active[domain])
+            time.sleep(0.02)
+            with lock:
+                active[domain] -= 1
+
+    threads = [threading.Thread(target=fetch, args=(domain,)) for domain in ['a'] * 6 + ['b'] * 6]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # each domain is limited on its own, so both reach their limit at once
+    assert peak == {'a': 2, 'b': 2}
+
+
+def test_domain_scheduler_rate():
+    scheduler = DomainScheduler(max_per_domain=4, rate=20)
+    start = time.monotonic()
+    for _ in range(3):
+        with scheduler.slot('a'):
+            pass
+    # requests to a domain start at least 1 / rate apart, other domains aren't held up
+    assert time.monotonic() - start >= 0.1
+    with scheduler.slot('b') as waited:
+        assert waited < 0.05
+
+
+@pytest.mark.parametrize(['max_per_domain', 'rate'], [(0, 0), (1, -1)])
+def test_domain_scheduler_invalid(max_per_domain, rate):
+    with pytest.raises(RuntimeError):
+        DomainScheduler(max_per_domain, rate)
+
+
+def test_bounded_map():
+    submitted = list()
+    yielded = list()
+    lock = threading.Lock()
+
+    def fn(item):
+        with lock:
+            submitted.append(item)
+        # the first item is slow, so everything after it finishes first
+        time.sleep(0.1 if item == 0 else 0)
+        return item * 2
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for result in bounded_map(executor, fn, range(10), window=4):
+            # no more than the window is ever submitted ahead of what has been yielded
+            assert len(submitted) - len(yielded) <= 4
+            yielded.append(result)
+    assert yielded == [i * 2 for i in range(10)]
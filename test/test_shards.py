@@ -0,0 +1,76 @@
+import os
+
+import pandas as pd
+import pytest
+
+import constants
+import run
+import shards
+
+
+def write_shard(monkeypatch, shard, count, output_format, links):
+    # each shard runs on its own node, with its own run timestamp
+    monkeypatch.setattr(run, 'RUN_TIMESTAMP', f'shard{shard}')
+    writer = run.OutputWriter(output_format)
+    writer.append('new_links', pd.DataFrame([], columns=constants.NEW_LINKS_FILE_HEADER))
+    writer.append('all_links', links)
+    writer.append('failed', pd.DataFrame([{'failure_reason': 'URL navigation', 'url': f'https://fail{shard}.com'}]))
+    writer.close()
+    run.write_shard_manifest('nightly', shard, count, output_format, 2, len(links))
+
+
+def shard_links(shard):
+    return pd.DataFrame([
+        {
+            'url': f'https://www.site{shard}.com',
+            'label': f'site{shard}',
+            'domain': f'www.site{shard}.com',
+            'link': f'/{i}',
+            'full_link': f'https://www.site{shard}.com/{i}',
+            'link_text': f'text {i}',
+            'link_class_name': 'story',
+        }
+        for i in range(3)
+    ], columns=constants.ALL_LINKS_FILE_HEADER)
+
+
+@pytest.mark.parametrize('output_format', ['csv', 'parquet'])
+def test_merge_shards(tmp_path, monkeypatch, output_format):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('data')
+    # shards may finish in any order
+    write_shard(monkeypatch, 1, 2, output_format, shard_links(1))
+    with pytest.raises(RuntimeError):
+        shards.merge_shards('nightly')
+    write_shard(monkeypatch, 0, 2, output_format, shard_links(0))
+
+    monkeypatch.setattr(run, 'RUN_TIMESTAMP', 'merged')
+    shards.merge_shards('nightly')
+    all_links = pd.read_csv('data/all_links_merged.csv')
+    expected = pd.concat([shard_links(0), shard_links(1)], ignore_index=True)
+    pd.testing.assert_frame_equal(all_links, expected)
+    failed = pd.read_csv('data/failed_merged.csv')
+    assert list(failed['url']) == ['https://fail0.com', 'https://fail1.com']
+    assert len(pd.read_csv('data/new_links_merged.csv')) == 0
+
+
+def test_load_manifests_inconsistent(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    run.write_shard_manifest('nightly', 0, 2, 'csv', 0, 0)
+    run.write_shard_manifest('nightly', 1, 3, 'csv', 0, 0)
+    with pytest.raises(RuntimeError):
+        shards.load_manifests('nightly')
+    with pytest.raises(RuntimeError):
+        shards.load_manifests('missing')
+
+
+def test_split_input_urls(tmp_path, input_urls):
+    filename = os.path.join(tmp_path, 'input_urls.csv')
+    input_urls.to_csv(filename, index=False)
+    filenames = shards.split_input_urls(filename, 3)
+    assert filenames == [os.path.join(tmp_path, f'input_urls_shard-{i}-of-3.csv') for i in range(3)]
+    split = pd.concat([pd.read_csv(name) for name in filenames])
+    assert sorted(split['url']) == sorted(input_urls['url'])
+    for shard, name in enumerate(filenames):
+        domains = pd.read_csv(name)['url'].map(run.get_site_domain)
+        assert all(run.shard_of(domain, 3) == shard for domain in domains)
@@ -0,0 +1,73 @@
+import os
+
+import pandas as pd
+import requests
+
+from page_links import PageLinks
+from validator_cache import ValidatorCache
+
+
+def make_response(status_code=200, content=b'<html></html>', headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    response.headers.update(headers or {})
+    return response
+
+
+def make_row(url='https://www.website.com', include_nav_links=False):
+    return pd.Series({'url': url, 'label': 'label', 'include_nav_links': include_nav_links})
+
+
+LINKS = PageLinks.from_records('https://www.website.com', 'www.website.com', 'label', [
+    {'link': '/path', 'full_link': 'https://www.website.com/path', 'link_class_name': '', 'link_text': 'path'}
+])
+
+
+def test_validator_cache_request_headers():
+    cache = ValidatorCache()
+    assert cache.request_headers(make_row()) == {}
+    headers = {'ETag': '"abc"', 'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'}
+    cache.store(make_row(), make_response(headers=headers), LINKS)
+    assert cache.request_headers(make_row()) == {
+        'If-None-Match': '"abc"',
+        'If-Modified-Since': 'Wed, 21 Oct 2015 07:28:00 GMT',
+    }
+    # a differently configured row can't use the cached links, so it isn't sent validators
+    assert cache.request_headers(make_row(include_nav_links=True)) == {}
+
+
+def test_validator_cache_lookup():
+    cache = ValidatorCache()
+    row = make_row()
+    assert cache.lookup(row, make_response()) is None
+    cache.store(row, make_response(), LINKS)
+
+    # not modified, or modified but with the same body
+    assert cache.lookup(row, make_response(304, b'')).to_records() == LINKS.to_records()
+    assert cache.lookup(row, make_response()).to_records() == LINKS.to_records()
+    # a different body, or a differently configured row, is a miss
+    assert cache.lookup(row, make_response(content=b'<html>new</html>')) is None
+    assert cache.lookup(make_row(include_nav_links=True), make_response(304, b'')) is None
+
+    assert (cache.hits, cache.misses) == (2, 3)
+
+
+def test_validator_cache_eviction():
+    cache = ValidatorCache(max_entries=2)
+    for url in ('a', 'b'):
+        cache.store(make_row(url), make_response(), LINKS)
+    # touching "a" makes "b" the least recently used
+    cache.lookup(make_row('a'), make_response(304, b''))
+    cache.store(make_row('c'), make_response(), LINKS)
+    assert list(cache.entries) == ['a', 'c']
+
+
+def test_validator_cache_save_load(tmp_path):
+    filename = os.path.join(tmp_path, 'cache.json')
+    cache = ValidatorCache(filename)
+    cache.store(make_row(), make_response(headers={'ETag': '"abc"'}), LINKS)
+    cache.save()
+
+    cache = ValidatorCache(filename)
+    assert cache.lookup(make_row(), make_response(304, b'')).to_records() == LINKS.to_records()
@@ -0,0 +1,55 @@
+import pytest
+
+import waits
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    monkeypatch.setattr(waits, 'POLL_INTERVAL', 0.001)
+    monkeypatch.setattr(waits, 'QUIET_PERIOD', 0.01)
+    monkeypatch.setattr(waits, 'SLEEP_SECONDS', 0.01)
+
+
+def test_wait_for_ready(fake_browser):
+    browser = fake_browser(ready_states=['loading', 'interactive', 'complete'])
+    _, settled = waits.wait_for_page(browser, 'ready', timeout=1)
+    assert settled
+    assert browser.answers[waits.READY_STATE_SCRIPT] == ['complete']
+
+
+def test_wait_for_ready_timeout(fake_browser):
+    browser = fake_browser(ready_states=['loading'])
+    waited, settled = waits.wait_for_page(browser, 'ready', timeout=0.05)
+    assert not settled
+    assert waited >= 0.05
+
+
+def test_wait_for_anchors(fake_browser):
+    browser = fake_browser(anchor_counts=[1, 5, 12, 12])
+    _, settled = waits.wait_for_page(browser, 'anchors', timeout=1)
+    assert settled
+    assert browser.answers[waits.ANCHOR_COUNT_SCRIPT] == [12]
+
+
+def test_wait_for_anchors_never_stable(fake_browser):
+    browser = fake_browser(anchor_counts=list(range(100000)))
+    _, settled = waits.wait_for_page(browser, 'anchors', timeout=0.05)
+    assert not settled
+
+
+def test_wait_for_mutations(fake_browser):
+    browser = fake_browser(mutation_ages=[0, 3, 1, 50])
+    _, settled = waits.wait_for_page(browser, 'mutations', timeout=1)
+    assert settled
+    assert browser.answers[waits.MUTATION_AGE_SCRIPT] == [50]
+
+
+def test_wait_for_sleep(fake_browser):
+    waited, settled = waits.wait_for_page(fake_browser(), 'sleep', timeout=1)
+    assert settled
+    assert waited >= 0.01
+
+
+def test_wait_for_page_unknown_strategy(fake_browser):
+    with pytest.raises(RuntimeError):
+        waits.wait_for_page(fake_browser(), 'bogus')
@@ -0,0 +1,119 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+import run
+import watch
+
+
+@pytest.mark.parametrize('value,expected', [
+    ('900', 900),
+    (60, 60),
+    ('15m', 900),
+    ('6H', 6 * 60 * 60),
+    (' 1d ', 24 * 60 * 60),
+    ('0.5h', 30 * 60),
+])
+def test_parse_interval(value, expected):
+    assert watch.parse_interval(value) == expected
+
+
+@pytest.mark.parametrize('value', ['', '0', '-5m', '1w', 'daily'])
+def test_parse_interval_invalid(value):
+    with pytest.raises(RuntimeError):
+        watch.parse_interval(value)
+
+
+def test_link_history(find_new_links_data):
+    cur_links, all_links, new_links_expected, all_links_expected = find_new_links_data
+    history = watch.LinkHistory(all_links)
+    # a single page diffs the same as a batch run
+    new_links = history.update('website.com', cur_links)
+    pd.testing.assert_frame_equal(new_links, new_links_expected)
+    pd.testing.assert_frame_equal(history.links('website.com'), all_links_expected)
+    # scraped again unchanged, it has no changes
+    assert len(history.update('website.com', cur_links.drop(columns='id'))) == 0
+    # unknown pages start with every link new
+    assert len(history.update('other.com', cur_links.drop(columns='id').assign(url='other.com'))) == len(cur_links)
+    # a page scraped with no links left has every link removed
+    previous = history.links('website.com')
+    removed = history.update('website.com', cur_links.iloc[0:0])
+    assert len(removed) == len(previous)
+    assert (removed['defined_change'] == 'removed link').all()
+    assert len(history.links('website.com')) == 0
+
+
+def test_watcher(tmp_path, monkeypatch, fake_session):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('data')
+    session = fake_session(pages={
+        'https://www.website.com': '<html><body><a href="/a">A</a></body></html>',
+        'https://www.other.com': '<html><body><a href="/b">B</a></body></html>',
+    })
+    monkeypatch.setattr(run, 'get_session', lambda *args, **kwargs: session)
+    input_urls = pd.DataFrame({
+        'url': ['https://www.website.com', 'https://www.other.com', 'https://www.missing.com'],
+        'label': ['website', 'other', 'missing'],
+        'include_nav_links': [0, 0, 0],
+        'render_mode': ['static', 'static', 'static'],
+        'schedule': ['15m', None, '1h'],
+    })
+
+    def browser_factory():
+        raise AssertionError('Static pages are not rendered')
+
+    watcher = watch.Watcher(browser_factory, input_urls, None, schedule='30m')
+    assert watcher.intervals == [15 * 60, 30 * 60, 60 * 60]
+    assert watcher.run_once() == 3
+    # the history is checkpointed once the checkpoint interval has passed
+    all_links_file = 'data/all_links_%s.csv' % run.RUN_TIMESTAMP
+    assert not os.path.exists(all_links_file)
+    # nothing is due again until its schedule comes round
+    assert watcher.run_once() == 0
+    assert [i for _, i in sorted(watcher.queue)] == [0, 1, 2]
+    now = time.time()
+
+    session.pages['https://www.website.com'] = '<html><body><a href="/a">A</a><a href="/c">C</a></body></html>'
+    watcher.checkpointed -= 15 * 60
+    assert watcher.run_once(now + 20 * 60) == 1
+    assert len(pd.read_csv(all_links_file)) == 3
+    watcher.close()
+
+    new_links = pd.read_csv('data/new_links_%s.csv' % run.RUN_TIMESTAMP)
+    # every link is new on the first pass, then only the link added since
+    assert list(new_links['full_link']) == [
+        'https://www.website.com/a',
+        'https://www.other.com/b',
+        'https://www.website.com/c',
+    ]
+    failed = pd.read_csv('data/failed_%s.csv' % run.RUN_TIMESTAMP)
+    assert list(failed['url']) == ['https://www.missing.com']
+    all_links = pd.read_csv(all_links_file)
+    assert sorted(all_links['full_link']) == [
+        'https://www.other.com/b',
+        'https://www.website.com/a',
+        'https://www.website.com/c',
+    ]
+
+
+def test_watcher_host_failure(tmp_path, monkeypatch, fake_session):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir('data')
+    session = fake_session(pages={})
+    monkeypatch.setattr(run, 'get_session', lambda *args, **kwargs: session)
+    input_urls = pd.DataFrame({
+        'url': ['https://www.flaky.com'],
+        'label': ['flaky'],
+        'include_nav_links': [0],
+        'render_mode': ['static'],
+    })
+    watcher = watch.Watcher(None, input_urls, None, schedule='15m')
+    assert watcher.run_once() == 1
+    # the host failed once, and is still polled on the next pass, where it has recovered
+    session.pages['https://www.flaky.com'] = '<html><body><a href="/a">A</a></body></html>'
+    assert watcher.run_once(time.time() + 20 * 60) == 1
+    assert session.urls == ['https://www.flaky.com'] * 2
+    assert watcher.hosts.skip_reason('www.flaky.com') is None
+    watcher.close()
@@ -0,0 +1,117 @@
+"""
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Optional
+
+from log import log
+from page_links import PageLinks
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import requests
+
+
+DEFAULT_MAX_ENTRIES = 10000
+
+
+def row_signature(row: pd.Series) -> str:
+    # any change to how a row is scraped invalidates its cached links
+    return json.dumps({key: str(value) for key, value in row.items()}, sort_keys=True)
+
+
+def body_hash(response: requests.Response) -> str:
+    return hashlib.sha256(response.content).hexdigest()
+
+
+class ValidatorCache:
+    """
+    Persistent, size-bounded cache of HTTP validators and parsed links per url.
+
+    Entries are kept in least-recently-used order, and the oldest are evicted beyond ``max_entries``.
+    """
+
+    def __init__(self, filename: Optional[str] = None, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.filename = filename
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if filename and os.path.isfile(filename):
+            with open(filename, 'r') as fp:
+                self.entries = OrderedDict(json.load(fp))
+            log.info(f'Loaded {len(self.entries)} cached pages from {filename}.')
+
+    def request_headers(self, row: pd.Series) -> dict:
+        """
+        Conditional request headers for the row's url, if its cached links can stand in for a 304's empty body.
+        """
+        with self._lock:
+            entry = self.entries.get(row['url'])
+        headers = dict()
+        # links parsed for a differently configured row can't be reused, so the page must be fetched in full
+        if entry is None or entry['signature'] != row_signature(row):
+            return headers
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def lookup(self, row: pd.Series, response: requests.Response) -> Optional[PageLinks]:
+        """
+        Return the previously parsed links of the row's url if the response shows the page is unchanged.
+        """
+        url = row['url']
+        with self._lock:
+            entry = self.entries.get(url)
+            unchanged = (
+                entry is not None
+                and entry['signature'] == row_signature(row)
+                and (response.status_code == 304 or entry['body_hash'] == body_hash(response))
+            )
+            if not unchanged:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(url)
+        log.info(f'{url} is unchanged, using its cached links.')
+        return PageLinks.from_columns(entry['links'])
+
+    def store(self, row: pd.Series, response: requests.Response, links: PageLinks):
+        if response.status_code != 200:
+            return
+        url = row['url']
+        with self._lock:
+            self.entries[url] = {
+                'etag': response.headers.get('ETag', ''),
+                'last_modified': response.headers.get('Last-Modified', ''),
+                'body_hash': body_hash(response),
+                'signature': row_signature(row),
+                'links': links.to_columns(),
+            }
+            self.entries.move_to_end(url)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def save(self):
+        if not self.filename:
+            return
+        with self._lock:
+            entries = dict(self.entries)
+        # write to a temporary file first, so a crash never leaves a truncated cache behind
+        tmp_filename = f'{self.filename}.tmp'
+        with open(tmp_filename, 'w') as fp:
+            json.dump(entries, fp)
+        os.replace(tmp_filename, self.filename)
+
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        rate = self.hits / total if total > 0 else 0.0
+        return f'{self.hits} hits, {self.misses} misses ({rate:.0%} hit rate), {len(self.entries)} entries'
@@ -0,0 +1,98 @@
+"""
+"""
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING, Callable, Tuple
+
+import constants
+
+if TYPE_CHECKING:
+    from selenium.webdriver.chrome.webdriver import WebDriver
+
+
+# seconds to wait before giving up and scraping whatever has rendered
+DEFAULT_TIMEOUT = 10.0
+# seconds the page must stay unchanged to be considered settled
+QUIET_PERIOD = 0.5
+# seconds between checks of the page state
+POLL_INTERVAL = 0.1
+# seconds slept by the legacy fixed-sleep strategy
+SLEEP_SECONDS = 3.0
+
+READY_STATE_SCRIPT = "return document.readyState"
+ANCHOR_COUNT_SCRIPT = "return document.getElementsByTagName('a').length"
+# install a mutation observer once per document, and report milliseconds since the last mutation
+MUTATION_AGE_SCRIPT = """
+if (window.__linkScraperLastMutation === undefined) {
+    window.__linkScraperLastMutation = Date.now();
+    new MutationObserver(function () {
+        window.__linkScraperLastMutation = Date.now();
+    }).observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+}
+return Date.now() - window.__linkScraperLastMutation;
+"""
+
+
+def poll(condition: Callable[[], bool], deadline: float) -> bool:
+    while True:
+        if condition():
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(POLL_INTERVAL)
+
+
+def wait_for_ready(browser: WebDriver, deadline: float) -> bool:
+    return poll(lambda: browser.execute_script(READY_STATE_SCRIPT) == 'complete', deadline)
+
+
+def wait_for_mutations(browser: WebDriver, deadline: float) -> bool:
+    if not wait_for_ready(browser, deadline):
+        return False
+    return poll(lambda: browser.execute_script(MUTATION_AGE_SCRIPT) >= QUIET_PERIOD * 1000, deadline)
+
+
+def wait_for_anchors(browser: WebDriver, deadline: float) -> bool:
+    if not wait_for_ready(browser, deadline):
+        return False
+
+    state = {'count': None, 'since': time.monotonic()}
+
+    def anchors_stable() -> bool:
+        count = browser.execute_script(ANCHOR_COUNT_SCRIPT)
+        now = time.monotonic()
+        if count != state['count']:
+            state['count'] = count
+            state['since'] = now
+            return False
+        return now - state['since'] >= QUIET_PERIOD
+
+    return poll(anchors_stable, deadline)
+
+
+def wait_for_sleep(browser: WebDriver, deadline: float) -> bool:
+    time.sleep(max(0.0, min(SLEEP_SECONDS, deadline - time.monotonic())))
+    return True
+
+
+WAIT_STRATEGIES = {
+    constants.WaitStrategies.SLEEP: wait_for_sleep,
+    constants.WaitStrategies.READY: wait_for_ready,
+    constants.WaitStrategies.MUTATIONS: wait_for_mutations,
+    constants.WaitStrategies.ANCHORS: wait_for_anchors,
+}
+
+
+def wait_for_page(browser: WebDriver, strategy: str, timeout: float = DEFAULT_TIMEOUT) -> Tuple[float, bool]:
+    """
+    Wait for the current page to settle according to ``strategy``.
+
+    Returns the seconds waited, and whether the page settled before ``timeout``. Timing out is not
+    an error: the page is scraped in whatever state it reached.
+    """
+    if strategy not in WAIT_STRATEGIES:
+        raise RuntimeError(f'Unknown wait strategy {strategy}, expected one of {sorted(WAIT_STRATEGIES)}')
+    start = time.monotonic()
+    settled = WAIT_STRATEGIES[strategy](browser, start + timeout)
+    return time.monotonic() - start, settled
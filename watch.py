@@ -0,0 +1,382 @@
+"""
+"""
+import argparse
+import heapq
+import os
+import re
+import signal
+import threading
+import time
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+from selenium.webdriver.chrome.webdriver import WebDriver
+
+import constants
+import run
+import waits
+from browser_pool import DEFAULT_MAX_PAGES, DEFAULT_MAX_RSS_MB, BrowserPool
+from host_health import HostHealth
+from link_store import LinkStore
+from log import log
+from metrics import NO_METRICS, RunMetrics
+from parse_pool import ParsePool
+from resources import load_tracker_patterns
+from scheduler import DEFAULT_DOMAIN_CONCURRENCY, DEFAULT_DOMAIN_RATE, DomainScheduler
+from validator_cache import ValidatorCache
+
+
+INTERVAL_UNITS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+# the most urls scraped in one pass, so a long backlog doesn't hold up the next pass's changes
+DEFAULT_BATCH_SIZE = 100
+# how often the link history is written out while watching, so a crash loses at most this much of it
+DEFAULT_CHECKPOINT_INTERVAL = '15m'
+
+
+def parse_interval(value: any) -> float:
+    # seconds, or a number with a unit: 900, 15m, 6h, 1d
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)([smhd]?)', str(value).strip().lower())
+    if match is None or float(match.group(1)) <= 0:
+        raise RuntimeError(f'{value} is not a schedule, expected e.g. 900, 15m, 6h or 1d')
+    return float(match.group(1)) * INTERVAL_UNITS[match.group(2) or 's']
+
+
+class LinkHistory:
+    """
+    The last known links of each watched page, held in memory and keyed by page url.
+
+    A page is diffed against its own previous links only, matching links by element id as a batch
+    run does, so each scrape costs one page's worth of work however large the history grows.
+    """
+
+    def __init__(self, all_links: Optional[pd.DataFrame] = None):
+        self.pages: Dict[str, pd.DataFrame] = dict()
+        if all_links is not None and len(all_links) > 0:
+            for url, links in all_links.groupby('url', sort=False):
+                self.pages[url] = links.reset_index(drop=True)
+
+    def update(self, url: str, cur_links: pd.DataFrame) -> pd.DataFrame:
+        """
+        Replace the links of a page with those just scraped, returning what changed.
+        """
+        # the page was scraped, so finding no links on it means every previous link was removed
+        new_links, all_links = run.find_domain_links(cur_links, self.pages.get(url), True)
+        self.pages[url] = all_links
+        return new_links
+
+    def links(self, url: str) -> pd.DataFrame:
+        return self.pages.get(url, pd.DataFrame([], columns=constants.ALL_LINKS_FILE_HEADER))
+
+    def to_frame(self) -> pd.DataFrame:
+        if len(self.pages) == 0:
+            return pd.DataFrame([], columns=constants.ALL_LINKS_FILE_HEADER)
+        return pd.concat(self.pages.values(), ignore_index=True)
+
+
+class Watcher:
+    """
+    Re-scrapes every input url on its own schedule, keeping its browsers, HTTP session and link
+    history warm between scrapes.
+
+    Urls are queued by when they are next due. Each pass scrapes the urls that are due, diffs each
+    page against its last known links, and appends the changes to the new_links output straight
+    away. The full history is written to all_links (or kept in ``store``) when the watch stops.
+    """
+
+    def __init__(
+            self,
+            browser_factory: Callable[[], WebDriver],
+            input_urls: pd.DataFrame,
+            all_links: Optional[pd.DataFrame],
+            workers: int = 1,
+            static_concurrency: int = 16,
+            wait_strategy: Optional[str] = None,
+            wait_timeout: float = waits.DEFAULT_TIMEOUT,
+            status_check: str = constants.StatusChecks.GET,
+            cache: Optional[ValidatorCache] = None,
+            store: Optional[LinkStore] = None,
+            output_format: str = constants.OutputFormats.CSV,
+            prometheus_file: Optional[str] = None,
+            domain_concurrency: int = DEFAULT_DOMAIN_CONCURRENCY,
+            domain_rate: float = DEFAULT_DOMAIN_RATE,
+            hosts: Optional[HostHealth] = None,
+            resource_policy: Optional[str] = None,
+            tracker_patterns: Optional[List[str]] = None,
+            browser_max_pages: Optional[int] = DEFAULT_MAX_PAGES,
+            browser_max_rss_mb: Optional[float] = DEFAULT_MAX_RSS_MB,
+            schedule: Optional[str] = None,
+            batch_size: int = DEFAULT_BATCH_SIZE,
+            checkpoint_interval: Optional[str] = DEFAULT_CHECKPOINT_INTERVAL,
+            parse_workers: int = 0):
+        if batch_size < 1:
+            raise RuntimeError(f'Expected a batch size of at least 1, got {batch_size}')
+        run.validate_input_url_data(input_urls)
+        defaults = {'wait_strategy': wait_strategy, 'resource_policy': resource_policy, 'schedule': schedule}
+        run.clean_input_url_data(input_urls, defaults={field: value for field, value in defaults.items() if value})
+        input_urls['domain'] = input_urls['url'].map(run.get_site_domain)
+        if input_urls['url'].duplicated().any():
+            raise RuntimeError('Each url can only be watched once')
+        self.rows = [row for _, row in input_urls.iterrows()]
+        self.intervals = [parse_interval(value) for value in input_urls['schedule']]
+        self.static_concurrency = static_concurrency
+        self.wait_timeout = wait_timeout
+        self.status_check = status_check
+        self.cache = cache
+        self.store = store
+        self.output_format = output_format
+        self.prometheus_file = prometheus_file
+        self.hosts = hosts if hosts is not None else HostHealth()
+        self.tracker_patterns = tracker_patterns
+        self.batch_size = batch_size
+        self.checkpoint_interval = parse_interval(checkpoint_interval or DEFAULT_CHECKPOINT_INTERVAL)
+        self.checkpointed = time.time()
+        if store is not None:
+            all_links = store.load(list(input_urls['url']))
+        self.history = LinkHistory(all_links)
+        self.pool = BrowserPool(
+            browser_factory,
+            workers=workers,
+            max_pages=browser_max_pages,
+            max_rss_mb=browser_max_rss_mb
+        )
+        self.scheduler = DomainScheduler(domain_concurrency, domain_rate)
+        self.session = run.get_session(max(workers, static_concurrency), hosts=input_urls['domain'].nunique())
+        self.parser = ParsePool(parse_workers) if parse_workers > 0 else None
+        # changes are appended where they can be read as the watch goes, rather than staged
+        self.writer = run.OutputWriter(output_format, staged=False)
+        self.writer.append('new_links', pd.DataFrame([], columns=constants.NEW_LINKS_FILE_HEADER))
+        self.writer.append('failed', pd.DataFrame([], columns=['failure_reason', 'url']))
+        # every url is due straight away
+        now = time.time()
+        self.queue: List[Tuple[float, int]] = [(now, i) for i in range(len(self.rows))]
+        heapq.heapify(self.queue)
+        self.passes = 0
+
+    def next_due(self) -> float:
+        return self.queue[0][0] if self.queue else float('inf')
+
+    def due(self, now: Optional[float] = None) -> List[int]:
+        """
+        Take the urls that are due off the queue, earliest first, up to the batch size.
+        """
+        now = time.time() if now is None else now
+        due = list()
+        while self.queue and self.queue[0][0] <= now and len(due) < self.batch_size:
+            due.append(heapq.heappop(self.queue)[1])
+        return due
+
+    def run_once(self, now: Optional[float] = None) -> int:
+        """
+        Scrape the urls that are due, writing out their changes, and return how many were scraped.
+        """
+        due = self.due(now)
+        if len(due) == 0:
+            return 0
+        self.passes += 1
+        metrics = RunMetrics() if self.prometheus_file else NO_METRICS
+        pass_start = time.perf_counter()
+        log.info(f'Pass {self.passes}: scraping {len(due)} due URLs.')
+        scraped = run.scrape_rows(
+            self.rows,
+            due,
+            self.pool,
+            self.session,
+            self.scheduler,
+            self.hosts,
+            cache=self.cache,
+            metrics=metrics,
+            static_concurrency=self.static_concurrency,
+            wait_timeout=self.wait_timeout,
+            status_check=self.status_check,
+            tracker_patterns=self.tracker_patterns,
+            parser=self.parser
+        )
+        changes = 0
+        unscraped = set(due)
+        try:
+            for i, result in scraped:
+                changes += self.collect(i, result, metrics)
+                unscraped.discard(i)
+                # the next scrape of a url is timed from when this one finished
+                heapq.heappush(self.queue, (time.time() + self.intervals[i], i))
+        finally:
+            # urls left over by a failed pass keep their schedule
+            for i in unscraped:
+                heapq.heappush(self.queue, (time.time() + self.intervals[i], i))
+        # parquet changes are buffered, so flush them to have every pass's changes on disk
+        for prefix in list(self.writer.buffers):
+            self.writer.flush(prefix)
+        # hosts get another try on the next pass; failures only reach the negative cache when the watch stops,
+        # so one bad pass doesn't keep a host from being polled for the cache's whole ttl
+        self.hosts.close_circuits()
+        metrics.add('run_seconds', time.perf_counter() - pass_start)
+        if self.prometheus_file:
+            metrics.write_prometheus(self.prometheus_file)
+        log.info(f'Pass {self.passes}: {changes} changes in {len(due)} URLs.')
+        if time.time() - self.checkpointed >= self.checkpoint_interval:
+            self.checkpoint()
+        return len(due)
+
+    def checkpoint(self):
+        # the history is otherwise only in memory; a store is already saved page by page
+        if self.store is None:
+            run.write_dataframe(self.history.to_frame(), 'all_links', self.output_format)
+            log.info(f'Checkpointed the history of {len(self.history.pages)} URLs.')
+        self.checkpointed = time.time()
+
+    def collect(self, i: int, result: dict, metrics: RunMetrics = NO_METRICS) -> int:
+        row = self.rows[i]
+        metrics.page(
+            row['url'],
+            domain=row['domain'],
+            render_mode=row['render_mode'],
+            failed=result['failed'],
+            failure_reason=result['failure_reason']
+        )
+        if result['failed']:
+            # a failed scrape leaves the page's history as it was
+            self.writer.append('failed', pd.DataFrame([result], columns=['failure_reason', 'url']))
+            return 0
+        with metrics.timer('diff'):
+            new_links = self.history.update(row['url'], result['links'].to_frame())
+        metrics.add('new_links', len(new_links))
+        self.writer.append('new_links', new_links)
+        if self.store is not None:
+            self.store.save([row['url']], self.history.links(row['url']))
+        return len(new_links)
+
+    def run(self, stop: threading.Event):
+        """
+        Scrape urls as they fall due, until ``stop`` is set.
+        """
+        log.info(f'Watching {len(self.rows)} URLs.')
+        while not stop.is_set():
+            try:
+                scraped = self.run_once()
+            except Exception:
+                # one bad pass doesn't end the watch
+                log.error('Uncaught error in watch pass.', exc_info=True)
+                scraped = 0
+            if scraped == 0:
+                stop.wait(max(self.next_due() - time.time(), 0))
+
+    def close(self):
+        self.writer.close()
+        self.checkpoint()
+        if self.store is not None:
+            self.store.close()
+        self.session.close()
+        self.pool.close()
+        if self.parser is not None:
+            self.parser.close()
+        log.info(f'Browsers: {self.pool.summary()}.')
+        if self.cache is not None:
+            log.info(f'Page cache: {self.cache.summary()}.')
+            self.cache.save()
+        self.hosts.save()
+        log.info(f'Failing hosts: {self.hosts.summary()}.')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Re-scrape input urls on their own schedules, writing new links as they are found'
+    )
+    run.add_scrape_args(parser)
+    parser.add_argument(
+        '--schedule',
+        dest='schedule',
+        type=str,
+        default=None,
+        required=False,
+        help='How often to re-scrape urls without a schedule, in seconds or e.g. 15m, 6h, 1d '
+             f'(default: {constants.INPUT_URLS_OPTIONAL_FIELDS["schedule"]})'
+    )
+    parser.add_argument(
+        '--batch-size',
+        dest='batch_size',
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        required=False,
+        help='Maximum number of due urls scraped in one pass'
+    )
+    parser.add_argument(
+        '--checkpoint-interval',
+        dest='checkpoint_interval',
+        type=str,
+        default=DEFAULT_CHECKPOINT_INTERVAL,
+        required=False,
+        help='How often to write the link history to all_links while watching, in seconds or e.g. 15m, 1h, '
+             f'so that a crash loses at most this much of it (default: {DEFAULT_CHECKPOINT_INTERVAL})'
+    )
+    parser.add_argument(
+        '--store',
+        dest='store_file',
+        type=str,
+        default=None,
+        required=False,
+        help='SQLite link history, updated as each page is scraped, instead of an all_links file '
+             'checkpointed while watching'
+    )
+    return parser.parse_args()
+
+
+def cli():
+    args = parse_args()
+    if args.store_file and args.all_links_file:
+        raise RuntimeError('Pass either an all_links file or --store, not both')
+    input_urls = run.load_csv(args.new_urls_file, missing_ok=False)
+    # only the history of the watched pages is kept
+    watched = set(input_urls['url'])
+    all_links = run.load_csv(
+        args.all_links_file,
+        missing_ok=True,
+        columns=constants.ALL_LINKS_FILE_HEADER,
+        keep=lambda df: df['url'].isin(watched)
+    )
+    tracker_patterns = load_tracker_patterns(args.tracker_patterns_file) if args.tracker_patterns_file else None
+    resource_policy = args.resource_policy or constants.INPUT_URLS_OPTIONAL_FIELDS['resource_policy']
+    watcher = Watcher(
+        partial(run.get_browser, args.headless, resource_policy, tracker_patterns),
+        input_urls,
+        all_links,
+        workers=args.workers,
+        static_concurrency=args.static_concurrency,
+        wait_strategy=args.wait_strategy,
+        wait_timeout=args.wait_timeout,
+        status_check=args.status_check,
+        cache=ValidatorCache(args.cache_file, max_entries=args.cache_size) if args.cache_file else None,
+        store=LinkStore(args.store_file) if args.store_file else None,
+        output_format=args.output_format,
+        prometheus_file=args.prometheus_file,
+        domain_concurrency=args.domain_concurrency,
+        domain_rate=args.domain_rate,
+        hosts=HostHealth(args.host_cache_file, ttl=args.host_cache_ttl, failure_threshold=args.host_failure_threshold),
+        resource_policy=args.resource_policy,
+        tracker_patterns=tracker_patterns,
+        browser_max_pages=args.browser_max_pages,
+        browser_max_rss_mb=args.browser_max_rss_mb,
+        schedule=args.schedule,
+        batch_size=args.batch_size,
+        checkpoint_interval=args.checkpoint_interval,
+        parse_workers=args.parse_workers,
+    )
+    # stop after the pass in progress, writing out the history
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+    try:
+        watcher.run(stop)
+    finally:
+        watcher.close()
+
+
+if __name__ == '__main__':
+    rc = 0
+    try:
+        cli()
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        rc = 1
+    os.sys.exit(rc)